@@ -0,0 +1,139 @@
+import builtins
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from UTILS.printer import debug_print
+
+
+class StartupProfiler:
+    """
+    Records how long each startup phase, import and model load takes.
+
+    Usage:
+    profiler.enable()          # before the imports that should be measured
+    with profiler.phase("wizard"):
+        ...
+    print(profiler.report())
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.started_at = time.perf_counter()
+        self._records: List[Tuple[str, str, float]] = []  # (kind, name, seconds)
+        self._lock = threading.Lock()
+        self._original_import = None
+        self._import_depth = threading.local()
+
+    def enable(self) -> None:
+        """Start recording, including the wall time of every module imported for the first time."""
+        if self.enabled:
+            return
+        self.enabled = True
+        self.started_at = time.perf_counter()
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def disable(self) -> None:
+        if self._original_import:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def record(self, kind: str, name: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._records.append((kind, name, seconds))
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record("phase", name, time.perf_counter() - started)
+
+    def report(self, top_imports: int = 15) -> str:
+        with self._lock:
+            records = list(self._records)
+        lines = [f"Startup profile ({time.perf_counter() - self.started_at:.2f}s since start)"]
+        for kind, title in (("phase", "Phases"), ("model", "Model loads"), ("import", "Slowest imports")):
+            entries = [(name, seconds) for record_kind, name, seconds in records if record_kind == kind]
+            if kind == "import":
+                entries = sorted(entries, key=lambda entry: entry[1], reverse=True)[:top_imports]
+            if entries:
+                lines.append(f"{title}:")
+                lines.extend(f"  {seconds * 1000:9.1f} ms  {name}" for name, seconds in entries)
+        return "\n".join(lines)
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # Only first-time, top-level imports are timed; their time includes the modules they pull in
+        depth = getattr(self._import_depth, "value", 0)
+        if level != 0 or name in sys.modules or depth > 0:
+            self._import_depth.value = depth + 1
+            try:
+                return self._original_import(name, globals, locals, fromlist, level)
+            finally:
+                self._import_depth.value = depth
+
+        self._import_depth.value = depth + 1
+        started = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            self._import_depth.value = depth
+            self.record("import", name, time.perf_counter() - started)
+
+
+profiler = StartupProfiler()
+
+
+class LazyLoader:
+    """
+    Loads a heavy resource (a model, an engine) on first use instead of at import time.
+    `warm_up` starts loading it on a background thread so it is ready by the time it is needed.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self.factory = factory
+        self._value: Optional[Any] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self) -> Any:
+        if self._loaded:
+            return self._value
+        with self._lock:
+            if not self._loaded:
+                started = time.perf_counter()
+                self._value = self.factory()
+                self._loaded = True
+                profiler.record("model", self.name, time.perf_counter() - started)
+                debug_print(f"{self.name} loaded in {time.perf_counter() - started:.2f}s")
+        return self._value
+
+    def warm_up(self) -> threading.Thread:
+        return warm_up({self.name: self.get})[self.name]
+
+
+def warm_up(tasks: Dict[str, Callable[[], Any]]) -> Dict[str, threading.Thread]:
+    """Run each task on its own daemon thread. Failures are logged, the resource then loads on first use."""
+    def run(name: str, task: Callable[[], Any]):
+        try:
+            task()
+        except Exception as e:
+            debug_print(f"Warm-up of {name} failed: {e}")
+
+    threads = {}
+    for name, task in tasks.items():
+        thread = threading.Thread(target=run, args=(name, task), name=f"warm-up-{name}", daemon=True)
+        thread.start()
+        threads[name] = thread
+    return threads
@@ -0,0 +1,243 @@
+import bisect
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from pydantic import BaseModel
+
+from UTILS.printer import debug_print
+from XAUTO.entity_matcher import EntityMatcher
+
+try:
+    import websocket  # websocket-client, only needed for live state_changed updates
+except ImportError:
+    websocket = None
+
+
+class IndexStats(BaseModel):
+    hits: int = 0
+    misses: int = 0
+    refreshes: int = 0
+    events_applied: int = 0
+    last_refresh_duration: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class EntityIndex:
+    """
+    In-process index of Home Assistant entities keyed by friendly name, entity_id and domain.
+
+    The index is built once from `fetch_entities` and kept fresh either by live state_changed
+    events (see HAStateSubscriber) or, when no subscriber is connected, by refreshing after `ttl`
+    seconds.
+    """
+
+    def __init__(self, fetch_entities: Callable[[], List[Any]], entity_factory: Callable[..., Any], ttl: float = 300,
+                 matcher: Optional[EntityMatcher] = None):
+        self.fetch_entities = fetch_entities
+        self.entity_factory = entity_factory
+        self.ttl = ttl
+        self.matcher = matcher or EntityMatcher()
+        self.stats = IndexStats()
+        self.live = False  # True while a state_changed subscription keeps the index up to date
+
+        self._by_id: Dict[str, Any] = {}
+        self._by_name: Dict[str, Set[str]] = {}
+        self._by_domain: Dict[str, Set[str]] = {}
+        self._sorted_names: List[str] = []
+        self._loaded_at: Optional[float] = None
+        self._listeners: List[Callable[[], None]] = []
+        self._lock = threading.RLock()
+
+    def add_listener(self, listener: Callable[[], None]) -> None:
+        """Register a callback invoked whenever the set of entities or their names change."""
+        self._listeners.append(listener)
+
+    def ensure_fresh(self) -> None:
+        with self._lock:
+            if self._loaded_at is None:
+                self.refresh()
+            elif not self.live and time.monotonic() - self._loaded_at > self.ttl:
+                self.refresh()
+
+    def refresh(self) -> None:
+        started = time.perf_counter()
+        entities = self.fetch_entities()
+        with self._lock:
+            self._by_id = {}
+            self._by_name = {}
+            self._by_domain = {}
+            self.matcher.rebuild([])
+            for entity in entities:
+                self._add(entity)
+            self._sorted_names = sorted(self._by_name)
+            self._loaded_at = time.monotonic()
+            self.stats.refreshes += 1
+            self.stats.last_refresh_duration = time.perf_counter() - started
+        debug_print(f"Entity index rebuilt with {len(entities)} entities in {self.stats.last_refresh_duration:.3f}s")
+        self._notify()
+
+    def apply_state_changed(self, event_data: Dict[str, Any]) -> None:
+        """Apply the data of a Home Assistant state_changed event."""
+        entity_id = event_data.get('entity_id')
+        new_state = event_data.get('new_state')
+        with self._lock:
+            previous = self._by_id.get(entity_id)
+            entity = self.entity_factory(**new_state) if new_state is not None else None
+            names_changed = (previous is None) != (entity is None) or (
+                entity is not None and self._friendly_name(previous) != self._friendly_name(entity)
+            )
+            if names_changed:
+                if previous is not None:
+                    self._remove(previous)
+                if entity is not None:
+                    self._add(entity)
+                self._sorted_names = sorted(self._by_name)
+            elif entity is not None:
+                # Plain state change: the name indexes and the matcher stay untouched
+                self._by_id[entity_id] = entity
+            self.stats.events_applied += 1
+        if names_changed:
+            self._notify()
+
+    def get(self, entity_id: str) -> Optional[Any]:
+        self.ensure_fresh()
+        return self._count(self._by_id.get(entity_id))
+
+    def find_by_name(self, name: str) -> List[Any]:
+        self.ensure_fresh()
+        with self._lock:
+            entity_ids = self._by_name.get(name.lower(), set())
+            return self._count([self._by_id[entity_id] for entity_id in entity_ids])
+
+    def find_by_prefix(self, prefix: str) -> List[Any]:
+        self.ensure_fresh()
+        prefix = prefix.lower()
+        with self._lock:
+            start = bisect.bisect_left(self._sorted_names, prefix)
+            matches = []
+            for name in self._sorted_names[start:]:
+                if not name.startswith(prefix):
+                    break
+                matches.extend(self._by_id[entity_id] for entity_id in self._by_name[name])
+            return self._count(matches)
+
+    def by_domain(self, domain: str) -> List[Any]:
+        self.ensure_fresh()
+        with self._lock:
+            return [self._by_id[entity_id] for entity_id in self._by_domain.get(domain, set())]
+
+    def search(self, entity_name: str, entity_type: Optional[str] = None) -> List[Any]:
+        """Best fuzzy matches for a spoken device name, several only when they are too close to call."""
+        self.ensure_fresh()
+        with self._lock:
+            matches = self.matcher.resolve(entity_name, domain=entity_type)
+            return self._count([self._by_id[match.entity_id] for match in matches])
+
+    def search_all(self, entity_name: str, entity_type: Optional[str] = None, limit: int = 100) -> List[Any]:
+        """Every entity matching a spoken device name, used for bulk actions."""
+        self.ensure_fresh()
+        with self._lock:
+            matches = self.matcher.match(entity_name, domain=entity_type, limit=limit)
+            return self._count([self._by_id[match.entity_id] for match in matches])
+
+    def names(self) -> List[str]:
+        self.ensure_fresh()
+        with self._lock:
+            return [self._by_id[next(iter(ids))].attributes.get('friendly_name') for ids in self._by_name.values()]
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def _add(self, entity: Any) -> None:
+        self._by_id[entity.entity_id] = entity
+        self._by_domain.setdefault(entity.entity_id.split('.')[0], set()).add(entity.entity_id)
+        name = self._friendly_name(entity)
+        if name:
+            self._by_name.setdefault(name, set()).add(entity.entity_id)
+            self.matcher.add(entity.entity_id, entity.attributes.get('friendly_name'))
+
+    def _remove(self, entity: Any) -> None:
+        self._by_id.pop(entity.entity_id, None)
+        self._by_domain.get(entity.entity_id.split('.')[0], set()).discard(entity.entity_id)
+        self.matcher.remove(entity.entity_id)
+        name = self._friendly_name(entity)
+        if name in self._by_name:
+            self._by_name[name].discard(entity.entity_id)
+            if not self._by_name[name]:
+                del self._by_name[name]
+
+    def _count(self, result):
+        if result:
+            self.stats.hits += 1
+        else:
+            self.stats.misses += 1
+        return result
+
+    def _notify(self) -> None:
+        for listener in self._listeners:
+            try:
+                listener()
+            except Exception as e:
+                debug_print(f"Entity index listener failed: {e}")
+
+    @staticmethod
+    def _friendly_name(entity: Any) -> str:
+        if entity is None:
+            return ''
+        return (entity.attributes.get('friendly_name') or '').lower()
+
+
+class HAStateSubscriber:
+    """Keeps an EntityIndex up to date from the Home Assistant websocket state_changed stream."""
+
+    def __init__(self, base_url: str, get_token: Callable[[], str], index: EntityIndex, reconnect_delay: float = 5):
+        if websocket is None:
+            raise ImportError("websocket-client is required for live entity updates.")
+        self.url = base_url.replace('http', 'ws', 1) + '/api/websocket'
+        self.get_token = get_token
+        self.index = index
+        self.reconnect_delay = reconnect_delay
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+            except Exception as e:
+                debug_print(f"Home Assistant event stream disconnected: {e}")
+            self.index.live = False
+            self._stopped.wait(self.reconnect_delay)
+
+    def _listen(self) -> None:
+        connection = websocket.create_connection(self.url, timeout=30)
+        try:
+            json.loads(connection.recv())  # auth_required
+            connection.send(json.dumps({"type": "auth", "access_token": self.get_token()}))
+            if json.loads(connection.recv()).get('type') != 'auth_ok':
+                raise ConnectionError("Home Assistant websocket authentication failed.")
+            connection.send(json.dumps({"id": 1, "type": "subscribe_events", "event_type": "state_changed"}))
+
+            # Events received while we were disconnected are lost, so start from a full snapshot
+            self.index.refresh()
+            self.index.live = True
+            connection.settimeout(None)
+            while not self._stopped.is_set():
+                message = json.loads(connection.recv())
+                if message.get('type') == 'event':
+                    self.index.apply_state_changed(message['event']['data'])
+        finally:
+            connection.close()
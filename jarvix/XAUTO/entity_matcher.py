@@ -0,0 +1,171 @@
+import re
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+
+class EntityMatch(BaseModel):
+    entity_id: str
+    name: str
+    score: float
+
+
+def normalize_name(name: str) -> str:
+    return ' '.join(re.sub(r"[^a-z0-9]+", " ", name.lower()).split())
+
+
+def trigrams(name: str) -> Set[str]:
+    # Spaces are dropped so STT splits like "living room" / "livingroom" produce the same trigrams
+    compact = normalize_name(name).replace(' ', '')
+    if not compact:
+        return set()
+    padded = f"${compact}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class EntityMatcher:
+    """
+    Ranked fuzzy matching of spoken device names against entity friendly names.
+
+    Names are indexed once as character trigrams. Lookups count shared trigrams for every
+    entity in one vectorized pass, with the domain filter applied before scoring. The score
+    mixes how much of the query is contained in the name with the Dice coefficient, so
+    "kitchen" still matches "Kitchen Ceiling Light" while "livingroom lamp" matches
+    "Living Room Lamp" and exact names rank first.
+    """
+
+    def __init__(self, min_score: float = 0.6, ambiguity_margin: float = 0.1, containment_weight: float = 0.7):
+        self.min_score = min_score
+        self.ambiguity_margin = ambiguity_margin
+        self.containment_weight = containment_weight
+        self._names: Dict[str, str] = {}
+        self._trigrams: Dict[str, Set[str]] = {}
+        self._dirty = True
+
+        # Compiled form of the index, rebuilt lazily after entities are added or removed
+        self._entity_ids: List[str] = []
+        self._sizes = np.zeros(0, dtype=np.int32)
+        self._domains = np.zeros(0, dtype=object)
+        self._postings: Dict[str, np.ndarray] = {}
+
+    def add(self, entity_id: str, name: str) -> None:
+        grams = trigrams(name)
+        if not grams:
+            self.remove(entity_id)
+            return
+        self._names[entity_id] = name
+        self._trigrams[entity_id] = grams
+        self._dirty = True
+
+    def remove(self, entity_id: str) -> None:
+        if self._names.pop(entity_id, None) is not None:
+            self._trigrams.pop(entity_id, None)
+            self._dirty = True
+
+    def rebuild(self, entities: Iterable[Tuple[str, str]]) -> None:
+        self._names, self._trigrams = {}, {}
+        for entity_id, name in entities:
+            self.add(entity_id, name)
+        self._dirty = True
+
+    def match(self, query: str, domain: Optional[str] = None, limit: int = 5) -> List[EntityMatch]:
+        """Entities scoring at least `min_score`, best first."""
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+        if self._dirty:
+            self._compile()
+
+        postings = [self._postings[gram] for gram in query_grams if gram in self._postings]
+        if not postings:
+            return []
+        shared = np.bincount(np.concatenate(postings), minlength=len(self._entity_ids))
+        if domain:
+            shared[self._domains != domain] = 0
+
+        query_size = len(query_grams)
+        # Dice is at most 2s/(q+s) for s shared trigrams, so entities below this overlap cannot reach min_score
+        min_shared = next((count for count in range(1, query_size + 1)
+                           if self._score(count, query_size, count) >= self.min_score),
+                          query_size + 1)
+        candidates = np.flatnonzero(shared >= min_shared)
+        if candidates.size == 0:
+            return []
+
+        counts = shared[candidates]
+        scores = self._score(counts, query_size, self._sizes[candidates])
+        keep = scores >= self.min_score
+        candidates, scores = candidates[keep], scores[keep]
+        top = np.argsort(-scores, kind='stable')[:limit]
+        return [EntityMatch(entity_id=self._entity_ids[candidates[i]], name=self._names[self._entity_ids[candidates[i]]],
+                            score=float(scores[i])) for i in top]
+
+    def resolve(self, query: str, domain: Optional[str] = None) -> List[EntityMatch]:
+        """
+        The best match alone when it is clearly ahead, otherwise every match within
+        `ambiguity_margin` of it so the caller can ask the user to be more specific.
+        """
+        matches = self.match(query, domain)
+        if not matches:
+            return []
+        best = matches[0].score
+        return [match for match in matches if best - match.score < self.ambiguity_margin]
+
+    def _score(self, shared, query_size: int, name_size):
+        dice = 2 * shared / (query_size + name_size)
+        containment = shared / query_size
+        return self.containment_weight * containment + (1 - self.containment_weight) * dice
+
+    def _compile(self) -> None:
+        self._entity_ids = list(self._names)
+        self._sizes = np.array([len(self._trigrams[entity_id]) for entity_id in self._entity_ids], dtype=np.int32)
+        self._domains = np.array([entity_id.split('.')[0] for entity_id in self._entity_ids], dtype=object)
+        postings: Dict[str, List[int]] = {}
+        for position, entity_id in enumerate(self._entity_ids):
+            for gram in self._trigrams[entity_id]:
+                postings.setdefault(gram, []).append(position)
+        self._postings = {gram: np.array(positions, dtype=np.int32) for gram, positions in postings.items()}
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+
+def benchmark(entity_count: int = 5000, query_count: int = 1000) -> Dict[str, float]:
+    """Lookup latency over a synthetic house with `entity_count` entities."""
+    rooms = ["kitchen", "living room", "bedroom", "office", "garage", "hallway", "bathroom", "porch", "attic", "basement"]
+    devices = [("light", "ceiling light"), ("light", "lamp"), ("light", "led strip"), ("switch", "plug"),
+               ("switch", "fan"), ("switch", "heater")]
+    matcher = EntityMatcher()
+    entities = []
+    for i in range(entity_count):
+        room = rooms[i % len(rooms)]
+        domain, device = devices[(i // len(rooms)) % len(devices)]
+        name = f"{room.title()} {device.title()} {i // (len(rooms) * len(devices))}"
+        entities.append((f"{domain}.{name.lower().replace(' ', '_')}", name))
+
+    started = time.perf_counter()
+    matcher.rebuild(entities)
+    matcher.match("warm up")
+    build_time = time.perf_counter() - started
+
+    queries = [name.lower().replace(' ', '', 1) for _, name in entities[::max(1, entity_count // query_count)]]
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        matcher.resolve(query)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {
+        "entities": entity_count,
+        "build_ms": build_time * 1000,
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+if __name__ == "__main__":
+    for count in (100, 1000, 5000):
+        print(benchmark(entity_count=count))
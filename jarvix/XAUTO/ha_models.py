@@ -0,0 +1,74 @@
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+# Plain data models for Home Assistant. Kept apart from home_assistant.py so the function
+# definitions and the intent parser can use them without importing yaml/requests at startup.
+
+class Action(Enum):
+    TURN_ON = 'turn_on'
+    TURN_OFF = 'turn_off'
+    TOGGLE = 'toggle'
+
+ACTION_SERVICE_MAP = {
+    Action.TURN_ON: 'turn_on',
+    Action.TURN_OFF: 'turn_off',
+    Action.TOGGLE: 'toggle',
+}
+
+class EntityType(str, Enum):
+    LIGHT = 'light'
+    SWITCH = 'switch'
+
+# Words that turn a command into a bulk action ("turn off all the lights")
+BULK_WORDS = {'all', 'every', 'everything'}
+DOMAIN_WORDS = {
+    'light': EntityType.LIGHT, 'lights': EntityType.LIGHT, 'lamps': EntityType.LIGHT,
+    'switch': EntityType.SWITCH, 'switches': EntityType.SWITCH, 'plugs': EntityType.SWITCH,
+}
+
+class Entity(BaseModel):
+    entity_id: str
+    state: str
+    attributes: Dict[str, Any] = Field(default_factory=dict)
+
+class HAFunctionInput(BaseModel):
+    action: Action
+    entity_name: str
+    entity_type: Optional[EntityType] = None
+
+class EntityActionResult(BaseModel):
+    entity_id: str
+    success: bool
+    error: Optional[str] = None
+
+class BulkActionReport(BaseModel):
+    action: Action
+    results: List[EntityActionResult] = Field(default_factory=list)
+    round_trips: int = 0
+
+    @property
+    def succeeded(self) -> List[str]:
+        return [result.entity_id for result in self.results if result.success]
+
+    @property
+    def failed(self) -> List[str]:
+        return [result.entity_id for result in self.results if not result.success]
+
+class HAConfig(BaseModel):
+    friendly_name: str
+    username: str
+    password: str
+    name: str
+    latitude: float
+    longitude: float
+    elevation: int
+    unit_system: str
+    currency: str
+    country: str
+    time_zone: str
+    language: str
+
+class HaAuthenticationException(Exception):
+    pass
@@ -3,16 +3,20 @@ import logging
 import os
 import subprocess
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-from enum import Enum
+from typing import List, Dict, Any, Optional, Tuple
 
 import yaml
-from pydantic import BaseModel, Field
 import requests
 from dotenv import load_dotenv, set_key
-from datetime import datetime, timedelta
 from UTILS.printer import debug_print
+from XAUTO.entity_index import EntityIndex, HAStateSubscriber
+from XAUTO.entity_matcher import EntityMatcher
+from XAUTO.http_session import get_session
+from XAUTO.token_manager import TokenManager
+from XAUTO.ha_models import (Action, ACTION_SERVICE_MAP, EntityType, BULK_WORDS, DOMAIN_WORDS, Entity, HAFunctionInput,
+                             EntityActionResult, BulkActionReport, HAConfig, HaAuthenticationException)
 
 # Load environment variables
 load_dotenv()
@@ -28,53 +32,12 @@ if os.getenv('LOGGING', 'false').lower() == 'true':
 ENTITY_ENDPOINT = '/api/states'
 SERVICE_ENDPOINT_TEMPLATE = '/api/services/{domain}/{service}'
 
-class Action(Enum):
-    TURN_ON = 'turn_on'
-    TURN_OFF = 'turn_off'
-    TOGGLE = 'toggle'
-
-ACTION_SERVICE_MAP = {
-    Action.TURN_ON: 'turn_on',
-    Action.TURN_OFF: 'turn_off',
-    Action.TOGGLE: 'toggle',
-}
-
-class EntityType(str, Enum):
-    LIGHT = 'light'
-    SWITCH = 'switch'
-
-class Entity(BaseModel):
-    entity_id: str
-    state: str
-    attributes: Dict[str, Any] = Field(default_factory=dict)
-
-class HAFunctionInput(BaseModel):
-    action: Action
-    entity_name: str
-    entity_type: Optional[EntityType] = None
-
-class HAConfig(BaseModel):
-    friendly_name: str
-    username: str
-    password: str
-    name: str
-    latitude: float
-    longitude: float
-    elevation: int
-    unit_system: str
-    currency: str
-    country: str
-    time_zone: str
-    language: str
-
-class HaAuthenticationException(Exception):
-    pass
-
 class HAInitializer:
     def __init__(self, ha_directory: str = Path(__file__).parent / 'homeassistant', config: HAConfig = None):
         self.ha_directory = ha_directory
         self.start_command = f'hass --config {self.ha_directory}'
         self.base_url = f"http://{os.getenv('INTERNAL_URL', 'localhost:8123')}"
+        self.session = get_session(self.base_url)
         self.headers = {'Content-Type': 'application/json'}
         self.auth_code = os.getenv('HA_AUTH_CODE', None)
         self.config = config
@@ -126,7 +89,8 @@ class HAInitializer:
         start_time = time.time()
         while True:
             try:
-                response = requests.get(f"{self.base_url}/manifest.json", timeout=2)
+                # The loop already polls, a retry would only hold up the next attempt
+                response = self.session.get("/manifest.json", retries=0)
                 if response.status_code == 200:
                     return True
             except requests.RequestException:
@@ -162,7 +126,6 @@ class HAInitializer:
 
     def _create_user(self) -> bool:
         """Create a new user via Home Assistant API."""
-        user_url = f"{self.base_url}/api/onboarding/users"
         payload = json.dumps({
             "client_id": self.base_url,
             "name": self.config.friendly_name,
@@ -170,7 +133,7 @@ class HAInitializer:
             "password": self.config.password,
             "language": self.config.language
         })
-        response = requests.post(user_url, headers=self.headers, data=payload)
+        response = self.session.post("/api/onboarding/users", headers=self.headers, data=payload)
         debug_print(response.text)
 
         if response.status_code == 200:
@@ -182,13 +145,12 @@ class HAInitializer:
 
     def _create_token(self):
         """Create a token for further actions using the authorization code."""
-        token_url = f"{self.base_url}/auth/token"
         data = {
             "grant_type": "authorization_code",
             "client_id": self.base_url,
             "code": self.auth_code
         }
-        response = requests.post(token_url, data=data)
+        response = self.session.post("/auth/token", data=data)
         debug_print(response.text)
 
         if response.status_code == 200:
@@ -205,8 +167,7 @@ class HAInitializer:
     def _run_core_config(self):
         """Run the core configuration step of onboarding."""
         if "core_config" not in self.done_list:
-            core_config_url = f"{self.base_url}/api/onboarding/core_config"
-            response = requests.post(core_config_url, headers=self.headers)
+            response = self.session.post("/api/onboarding/core_config", headers=self.headers)
 
             debug_print(response.text)
         else:
@@ -217,8 +178,7 @@ class HAInitializer:
     def _run_integration_config(self):
         """Run the integration configuration step of onboarding."""
         if "integration" not in self.done_list:
-            integration_url = f"{self.base_url}/api/onboarding/integration"
-            response = requests.post(integration_url, headers=self.headers)
+            response = self.session.post("/api/onboarding/integration", headers=self.headers)
             debug_print(response.text)
         else:
             debug_print("Integration onboarding task has already been run.")
@@ -226,8 +186,7 @@ class HAInitializer:
     def _run_analytics_config(self):
         """Run the analytics configuration step of onboarding."""
         if "analytics" not in self.done_list:
-            analytics_url = f"{self.base_url}/api/onboarding/analytics"
-            response = requests.post(analytics_url, headers=self.headers)
+            response = self.session.post("/api/onboarding/analytics", headers=self.headers)
             debug_print(response.text)
         else:
             debug_print("Analytics onboarding task has already been run.")
@@ -238,8 +197,8 @@ class HAClient:
         debug_print(f"Initializing Home Assistant on: {base_url}")
         load_dotenv(override=True) # This is to ensure we get updated refresh token as its been updated during HAInitializer
         self.base_url = base_url.rstrip('/')
+        self.session = get_session(self.base_url)
         self.refresh_token = os.getenv('HA_REFRESH_TOKEN', None)
-        self.ha_token = None
         self.headers = {
             'Content-Type': 'application/json',
         }
@@ -248,39 +207,54 @@ class HAClient:
             self.start_home_assistant()
             self.wait_until_ha_is_live()
 
+        self.token_manager = TokenManager(self._fetch_token,
+                                          refresh_margin=float(os.getenv('HA_TOKEN_REFRESH_MARGIN', '60')))
+        if self.refresh_token:
+            self.token_manager.start()
+
+        # Entities are fetched once and then kept fresh by state_changed events, or by TTL when those are unavailable
+        matcher = EntityMatcher(min_score=float(os.getenv('HA_MATCH_MIN_SCORE', '0.6')),
+                                ambiguity_margin=float(os.getenv('HA_MATCH_MARGIN', '0.1')))
+        self.entity_index = EntityIndex(self.get_entities, entity_factory=Entity,
+                                        ttl=float(os.getenv('HA_ENTITY_TTL', '300')), matcher=matcher)
+        self.state_subscriber = None
+        if os.getenv('HA_LIVE_ENTITIES', 'true').lower() == 'true':
+            try:
+                self.state_subscriber = HAStateSubscriber(self.base_url, self._get_token, self.entity_index)
+                self.state_subscriber.start()
+            except ImportError as e:
+                debug_print(f"{e} Falling back to TTL refresh of the entity index.")
+
     def is_ha_running(self) -> bool:
         """Check if HA is running by sending a request to the base URL."""
         try:
-            response = requests.get(f"{self.base_url}/manifest.json", timeout=2)
+            response = self.session.get("/manifest.json", retries=0)
             return response.status_code == 200
         except (requests.ConnectionError, requests.Timeout):
             return False
 
     def _get_token(self) -> str:
-        """Get a valid token, refreshing or generating a new one if necessary."""
-        if self.ha_token is None or datetime.now() >= self.ha_token["expires_in"]:
-            if not self.refresh_token:
-                raise HaAuthenticationException("No refresh token found in the environment.")
-
-            token_url = f"{self.base_url}/auth/token"
-            data = {
-                "grant_type": "refresh_token",
-                "client_id": self.base_url,
-                "refresh_token": self.refresh_token
-            }
-            response = requests.post(token_url, data=data)
-            if response.status_code == 200:
-                self.ha_token = response.json()
-                self.ha_token["access_token"] = self.ha_token["access_token"]
-                self.ha_token["expires_in"] = datetime.now() + timedelta(seconds=self.ha_token["expires_in"])
-                self.headers['Authorization'] = f"Bearer {self.ha_token['access_token']}"
-            else:
-                raise HaAuthenticationException("Failed to obtain a valid access token.")
+        """Get a valid token. Refreshes normally happen in the background before the token expires."""
+        access_token = self.token_manager.get_token()
+        self.headers['Authorization'] = f"Bearer {access_token}"
+        return access_token
+
+    def _fetch_token(self) -> Tuple[str, float]:
+        """Exchange the refresh token for a new access token and its lifetime in seconds."""
+        if not self.refresh_token:
+            raise HaAuthenticationException("No refresh token found in the environment.")
 
-        if self.ha_token:
-            return self.ha_token["access_token"]
+        data = {
+            "grant_type": "refresh_token",
+            "client_id": self.base_url,
+            "refresh_token": self.refresh_token
+        }
+        response = self.session.post("/auth/token", data=data)
+        if response.status_code == 200:
+            ha_token = response.json()
+            return ha_token["access_token"], ha_token["expires_in"]
         else:
-            raise HaAuthenticationException("Unable to obtain a valid access token.")
+            raise HaAuthenticationException("Failed to obtain a valid access token.")
 
     def start_home_assistant(self) -> None:
         """Start Home Assistant by running a subprocess."""
@@ -299,9 +273,8 @@ class HAClient:
         debug_print("Home Assistant is live!")
 
     def get_entities(self) -> List[Entity]:
-        url = f"{self.base_url}{ENTITY_ENDPOINT}"
         self._get_token()
-        response = requests.get(url, headers=self.headers)
+        response = self.session.get(ENTITY_ENDPOINT, headers=self.headers)
         response.raise_for_status()
         entities_data = response.json()
         entities = [Entity(**entity) for entity in entities_data]
@@ -313,31 +286,70 @@ class HAClient:
         if not service:
             raise ValueError(f"Unsupported action: {action}")
         service_endpoint = SERVICE_ENDPOINT_TEMPLATE.format(domain=domain, service=service)
-        url = f"{self.base_url}{service_endpoint}"
         self._get_token()
         data = {'entity_id': entity_id}
-        response = requests.post(url, headers=self.headers, json=data)
+        response = self.session.post(service_endpoint, headers=self.headers, json=data)
         return response.status_code == 200
 
+    def perform_bulk_action(self, action: Action, entity_ids: Optional[List[str]] = None,
+                            domain: Optional[str] = None, area_id: Optional[str] = None) -> BulkActionReport:
+        """
+        Apply an action to many entities with one service call per domain, domains in parallel.
+        Targets are explicit entity_ids, every entity of a domain, or a Home Assistant area.
+        """
+        service = ACTION_SERVICE_MAP.get(action)
+        if not service:
+            raise ValueError(f"Unsupported action: {action}")
+
+        targets: Dict[str, Dict[str, Any]] = {}
+        for entity_id in entity_ids or []:
+            targets.setdefault(entity_id.split('.')[0], {'entity_id': []})['entity_id'].append(entity_id)
+        if domain and not area_id:
+            ids = [entity.entity_id for entity in self.entity_index.by_domain(domain)]
+            targets.setdefault(domain, {'entity_id': []})['entity_id'].extend(ids)
+        if area_id:
+            # HA resolves the area itself; the generic homeassistant domain covers every entity type in it
+            targets[domain or 'homeassistant'] = {'area_id': area_id}
+
+        self._get_token()
+        report = BulkActionReport(action=action, round_trips=len(targets))
+        if not targets:
+            return report
+        with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+            for results in executor.map(lambda item: self._call_service(item[0], service, item[1]), targets.items()):
+                report.results.extend(results)
+        return report
+
+    def _call_service(self, domain: str, service: str, target: Dict[str, Any]) -> List[EntityActionResult]:
+        service_endpoint = SERVICE_ENDPOINT_TEMPLATE.format(domain=domain, service=service)
+        try:
+            response = self.session.post(service_endpoint, headers=self.headers, json=target)
+            success = response.status_code == 200
+            error = None if success else response.text
+        except requests.RequestException as e:
+            response, success, error = None, False, str(e)
+
+        entity_ids = target.get('entity_id')
+        if entity_ids is None:
+            # Area targets: HA answers with the states it changed
+            changed = response.json() if success else []
+            entity_ids = [state.get('entity_id') for state in changed]
+        return [EntityActionResult(entity_id=entity_id, success=success, error=error) for entity_id in entity_ids]
+
     def control_home_device(self, action: str, entity_name: str, entity_type: Optional[str] = None) -> str:
         try:
-            entities = self.get_entities()
+            words = entity_name.lower().split()
+            if BULK_WORDS & set(words):
+                return self._control_many_devices(Action(action), words, entity_type)
 
             # Filter entities based on the entity name and type
-            matching_entities = []
-            for entity in entities:
-                friendly_name = entity.attributes.get('friendly_name', '').lower()
-                if entity_name.lower() in friendly_name:
-                    if entity_type:
-                        if entity.entity_id.startswith(entity_type):
-                            matching_entities.append(entity)
-                    else:
-                        matching_entities.append(entity)
+            matching_entities = self.entity_index.search(entity_name, entity_type)
 
             if not matching_entities:
                 return f"Sorry, I couldn't find any device named '{entity_name}'."
             elif len(matching_entities) > 1:
-                return f"I found multiple devices named '{entity_name}'. Please be more specific."
+                candidates = ', '.join(entity.attributes.get('friendly_name', entity.entity_id) for entity in matching_entities)
+                return f"I found multiple devices named '{entity_name}': {candidates}. Please be more specific."
             else:
                 target_entity = matching_entities[0]
                 success = self.perform_action(entity_id=target_entity.entity_id, action=Action(action))
@@ -347,3 +359,26 @@ class HAClient:
                     return f"Sorry, I couldn't '{action.replace('_', ' ')}' '{target_entity.attributes.get('friendly_name')}'."
         except HaAuthenticationException as e:
             return f"I'm not authenticated to Home Assistant. Please reset your Home Assistant and try again. {str(e)}"
+
+    def _control_many_devices(self, action: Action, words: List[str], entity_type: Optional[str] = None) -> str:
+        name = ' '.join(word for word in words if word not in BULK_WORDS and word != 'the')
+        domain_word = DOMAIN_WORDS.get(name)
+        domain = entity_type or (domain_word.value if domain_word else None)
+
+        if not name or domain_word:
+            # "all the lights" / "everything": every entity of the domain, or of every supported domain
+            domains = [domain] if domain else [supported.value for supported in EntityType]
+            entity_ids = [entity.entity_id for name_domain in domains for entity in self.entity_index.by_domain(name_domain)]
+        else:
+            # "all the kitchen lights": every entity matching the name, not just the best one
+            entity_ids = [entity.entity_id for entity in self.entity_index.search_all(name, domain)]
+
+        if not entity_ids:
+            return f"Sorry, I couldn't find any devices matching '{' '.join(words)}'."
+        report = self.perform_bulk_action(action, entity_ids=entity_ids)
+        debug_print(f"Bulk {action.value}: {len(report.succeeded)} ok, {len(report.failed)} failed in {report.round_trips} request(s)")
+
+        action_text = action.value.replace('_', ' ')
+        if not report.failed:
+            return f"Done, {len(report.succeeded)} devices have been '{action_text}' successfully."
+        return f"I could only '{action_text}' {len(report.succeeded)} of {len(report.results)} devices."
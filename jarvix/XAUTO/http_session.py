@@ -0,0 +1,120 @@
+import os
+import threading
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from UTILS.printer import debug_print
+
+try:
+    import httpx  # optional HTTP/2 transport
+except ImportError:
+    httpx = None
+
+# Timeouts in seconds, matched on the longest path prefix
+DEFAULT_TIMEOUTS: Dict[str, float] = {
+    '/manifest.json': 2,
+    '/auth/token': 5,
+    '/api/states': 10,
+    '/api/services': 5,
+    '/api/onboarding': 15,
+}
+
+
+class HASession:
+    """
+    Keep-alive HTTP session to Home Assistant shared by HAInitializer and HAClient.
+
+    Connections are pooled, every request gets a per-endpoint timeout, and idempotent requests
+    (plus connection failures on any request) are retried with exponential backoff. With
+    HA_HTTP_TRANSPORT=httpx and httpx installed, requests go over HTTP/2 instead.
+    """
+
+    def __init__(self, base_url: str, timeouts: Optional[Dict[str, float]] = None, default_timeout: float = 10,
+                 retries: int = 3, backoff_factor: float = 0.2, pool_size: int = 10,
+                 transport: str = os.getenv('HA_HTTP_TRANSPORT', 'requests')):
+        self.base_url = base_url.rstrip('/')
+        self.timeouts = dict(DEFAULT_TIMEOUTS if timeouts is None else timeouts)
+        self.default_timeout = default_timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.pool_size = pool_size
+        self.transport = transport
+        if transport == 'httpx' and httpx is None:
+            debug_print("httpx is not installed, using the requests transport for Home Assistant.")
+            self.transport = 'requests'
+
+        # One pooled client per retry policy, so a liveness probe can skip the retries of the shared session
+        self._clients: Dict[int, object] = {}
+        self._clients_lock = threading.Lock()
+        self._client = self._client_for(retries)
+
+    def _client_for(self, retries: int):
+        with self._clients_lock:
+            if retries not in self._clients:
+                self._clients[retries] = self._create_client(retries)
+            return self._clients[retries]
+
+    def _create_client(self, retries: int):
+        if self.transport == 'httpx':
+            return httpx.Client(
+                http2=True,
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                transport=httpx.HTTPTransport(http2=True, retries=retries),
+            )
+
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      backoff_factor=self.backoff_factor, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset({'GET', 'HEAD'}), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+        client = requests.Session()
+        client.mount('http://', adapter)
+        client.mount('https://', adapter)
+        return client
+
+    def get(self, path: str, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path: str, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def request(self, method: str, path: str, retries: Optional[int] = None, **kwargs):
+        """`retries` overrides the session's retry count for this request, e.g. 0 for a liveness probe."""
+        kwargs.setdefault('timeout', self.timeout_for(path))
+        url = f"{self.base_url}{path}"
+        client = self._client if retries is None else self._client_for(retries)
+        if self.transport == 'requests':
+            return client.request(method, url, **kwargs)
+
+        try:
+            return client.request(method, url, **kwargs)
+        except httpx.TimeoutException as e:
+            # Callers only handle the requests exception family
+            raise requests.Timeout(str(e)) from e
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(str(e)) from e
+
+    def timeout_for(self, path: str) -> float:
+        matches = [prefix for prefix in self.timeouts if path.startswith(prefix)]
+        if not matches:
+            return self.default_timeout
+        return self.timeouts[max(matches, key=len)]
+
+    def close(self) -> None:
+        for client in self._clients.values():
+            client.close()
+
+
+_sessions: Dict[str, HASession] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(base_url: str) -> HASession:
+    """The shared session for a Home Assistant instance, created on first use."""
+    key = base_url.rstrip('/')
+    with _sessions_lock:
+        if key not in _sessions:
+            _sessions[key] = HASession(key)
+        return _sessions[key]
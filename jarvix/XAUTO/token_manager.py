@@ -0,0 +1,106 @@
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+from pydantic import BaseModel
+
+from UTILS.printer import debug_print
+
+
+class TokenMetrics(BaseModel):
+    refreshes: int = 0
+    background_refreshes: int = 0
+    failures: int = 0
+    last_refresh_latency: float = 0.0
+    total_refresh_latency: float = 0.0
+    last_error: Optional[str] = None
+
+    @property
+    def average_refresh_latency(self) -> float:
+        return self.total_refresh_latency / self.refreshes if self.refreshes else 0.0
+
+
+class TokenManager:
+    """
+    Keeps an access token valid without making callers wait for a refresh.
+
+    Tokens are refreshed on a background timer `refresh_margin` seconds before they expire.
+    If a caller still finds the token expired, the refresh is single-flight: concurrent
+    callers wait for the same refresh instead of each starting their own.
+    `fetch_token` returns the new access token and its lifetime in seconds.
+    """
+
+    def __init__(self, fetch_token: Callable[[], Tuple[str, float]], refresh_margin: float = 60,
+                 retry_delay: float = 10):
+        self.fetch_token = fetch_token
+        self.refresh_margin = refresh_margin
+        self.retry_delay = retry_delay
+        self.metrics = TokenMetrics()
+
+        self._access_token: Optional[str] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._stopped = False
+
+    def start(self) -> None:
+        """Fetch the first token in the background so the first command does not pay for it."""
+        self._schedule(0)
+
+    def stop(self) -> None:
+        self._stopped = True
+        if self._timer:
+            self._timer.cancel()
+
+    def get_token(self) -> str:
+        token = self._valid_token()
+        if token:
+            return token
+        with self._lock:
+            # Another caller may have refreshed while we were waiting for the lock
+            token = self._valid_token()
+            if token:
+                return token
+            return self._refresh()
+
+    def _valid_token(self) -> Optional[str]:
+        if self._access_token and time.monotonic() < self._expires_at:
+            return self._access_token
+        return None
+
+    def _refresh(self) -> str:
+        started = time.perf_counter()
+        try:
+            access_token, expires_in = self.fetch_token()
+        except Exception as e:
+            self.metrics.failures += 1
+            self.metrics.last_error = str(e)
+            raise
+        latency = time.perf_counter() - started
+        self.metrics.refreshes += 1
+        self.metrics.last_refresh_latency = latency
+        self.metrics.total_refresh_latency += latency
+
+        self._access_token = access_token
+        self._expires_at = time.monotonic() + expires_in
+        debug_print(f"Access token refreshed in {latency:.3f}s, valid for {expires_in}s")
+        self._schedule(max(expires_in - self.refresh_margin, 0))
+        return access_token
+
+    def _schedule(self, delay: float) -> None:
+        if self._stopped:
+            return
+        if self._timer:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self) -> None:
+        with self._lock:
+            try:
+                self._refresh()
+                self.metrics.background_refreshes += 1
+            except Exception as e:
+                debug_print(f"Background token refresh failed: {e}. Retrying in {self.retry_delay}s")
+                self._schedule(self.retry_delay)
@@ -0,0 +1,116 @@
+import threading
+from typing import Callable, Iterator, List
+
+import numpy as np
+import sounddevice as sd
+
+from UTILS.printer import debug_print
+
+
+class AudioCaptureService:
+    """
+    One persistent 16 kHz int16 input stream shared by wake word detection and recording.
+
+    Every frame is written into a preallocated ring buffer and handed to the registered
+    listeners (e.g. Porcupine). Readers pull audio from the ring buffer at their own pace and
+    can start a little in the past, so the first syllables said right after the wake word
+    are not lost while the recorder gets going.
+    """
+
+    def __init__(self, sample_rate: int = 16000, frame_length: int = 512, buffer_seconds: float = 30):
+        self.sample_rate = sample_rate
+        self.frame_length = frame_length
+        self._ring = np.zeros(int(sample_rate * buffer_seconds), dtype=np.int16)
+        self._position = 0  # Total samples written since start, the ring index is position % size
+        self.overflows = 0  # input blocks PortAudio dropped because the callback ran late
+        self._condition = threading.Condition()
+        self._listeners: List[Callable[[np.ndarray], None]] = []
+        self._stream = None
+
+    @property
+    def position(self) -> int:
+        return self._position
+
+    @property
+    def running(self) -> bool:
+        return self._stream is not None and self._stream.active
+
+    def start(self) -> "AudioCaptureService":
+        if self._stream is None:
+            self._stream = sd.InputStream(samplerate=self.sample_rate, blocksize=self.frame_length,
+                                          channels=1, dtype='int16', callback=self._callback)
+            self._stream.start()
+        return self
+
+    def stop(self) -> None:
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+        with self._condition:
+            self._condition.notify_all()
+
+    def add_listener(self, listener: Callable[[np.ndarray], None]) -> None:
+        """`listener` is called from the audio thread with every int16 frame and must return quickly."""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[np.ndarray], None]) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def read(self, start: int, count: int, timeout: float = 2.0) -> np.ndarray:
+        """Samples [start, start + count) as int16, waiting for them to be captured if needed."""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._position >= start + count or not self.running, timeout):
+                raise TimeoutError("No audio received from the input device.")
+            if self._position < start + count:
+                raise RuntimeError("Audio capture stopped.")
+            if self._position - start > self._ring.size:
+                raise OverflowError("Reader fell behind the capture ring buffer.")
+            return self._take(start, count)
+
+    def chunks(self, chunk_samples: int, pre_roll: float = 0.0) -> Iterator[np.ndarray]:
+        """
+        Endless float32 chunks shaped (chunk_samples, 1), like `sd.InputStream.read`, starting
+        `pre_roll` seconds before now.
+        """
+        pre_roll_samples = min(int(pre_roll * self.sample_rate), self._ring.size - chunk_samples)
+        cursor = max(self._position - pre_roll_samples, 0)
+        while True:
+            try:
+                chunk = self.read(cursor, chunk_samples)
+            except OverflowError:
+                # The consumer stalled for longer than the buffer holds, skip to the oldest audio left
+                debug_print("Audio reader fell behind, dropping the oldest audio")
+                cursor = self._position - self._ring.size + chunk_samples
+                continue
+            cursor += chunk_samples
+            yield (chunk.astype(np.float32) / 32768.0).reshape(-1, 1)
+
+    def _take(self, start: int, count: int) -> np.ndarray:
+        index = start % self._ring.size
+        end = index + count
+        if end <= self._ring.size:
+            return self._ring[index:end].copy()
+        return np.concatenate((self._ring[index:], self._ring[:end - self._ring.size]))
+
+    def _callback(self, indata, frames, time, status):
+        if status:
+            if status.input_overflow:
+                self.overflows += 1
+            debug_print(f"{status} ({self.overflows} input overflows so far)")
+        frame = indata[:, 0]
+        with self._condition:
+            index = self._position % self._ring.size
+            end = index + frames
+            if end <= self._ring.size:
+                self._ring[index:end] = frame
+            else:
+                split = self._ring.size - index
+                self._ring[index:] = frame[:split]
+                self._ring[:end - self._ring.size] = frame[split:]
+            self._position += frames
+            self._condition.notify_all()
+
+        for listener in list(self._listeners):
+            listener(frame)
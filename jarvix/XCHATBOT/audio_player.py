@@ -0,0 +1,178 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+import numpy as np
+import sounddevice as sd
+
+from UTILS.printer import debug_print
+from XCHATBOT.streaming_stt import resample
+
+
+class PlaybackHandle:
+    """
+    One utterance queued on the AudioPlayer.
+
+    The synthesizer `feed`s chunks while earlier ones are already playing and `close`s the
+    handle once the utterance is complete. `cancel` drops the rest of it within one output
+    block; `wait` returns False when playback was cancelled.
+    """
+
+    def __init__(self, sample_rate: int):
+        self.sample_rate = sample_rate
+        self.cancelled = False
+        self.started_at: Optional[float] = None  # when the first sample reached the output stream
+        self._pending: Deque[np.ndarray] = deque()
+        self._parts: List[np.ndarray] = []
+        self._audio: Optional[np.ndarray] = None
+        self._position = 0
+        self._closed = False
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def position(self) -> int:
+        """Number of samples handed to the output device so far."""
+        return self._position
+
+    @property
+    def audio(self) -> np.ndarray:
+        """Everything fed so far, at the player's sample rate."""
+        with self._lock:
+            if self._audio is None:
+                self._audio = np.concatenate(self._parts) if self._parts else np.zeros(0, dtype=np.float32)
+            return self._audio
+
+    def feed(self, chunk: np.ndarray, sample_rate: int) -> None:
+        chunk = resample(chunk, sample_rate, self.sample_rate)
+        with self._lock:
+            self._pending.append(chunk)
+            self._parts.append(chunk)
+            self._audio = None
+
+    def close(self) -> None:
+        """No more chunks will be fed."""
+        with self._lock:
+            self._closed = True
+
+    def cancel(self) -> None:
+        if not self._done.is_set():
+            self.cancelled = True
+            self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        self._done.wait(timeout)
+        return not self.cancelled
+
+    def recent_level(self, window: float = 0.15) -> float:
+        """Peak RMS of what was played over the last `window` seconds, the reference for echo suppression."""
+        end = self.position
+        start = max(end - int(window * self.sample_rate), 0)
+        if self._done.is_set() or end <= start:
+            return 0.0
+        played = self.audio[start:end]
+        block = int(0.02 * self.sample_rate)
+        blocks = played[:played.size // block * block].reshape(-1, block)
+        if not blocks.size:
+            return float(np.sqrt(np.mean(played ** 2)))
+        return float(np.sqrt(np.max(np.mean(blocks ** 2, axis=1))))
+
+    def _read(self, count: int) -> Tuple[np.ndarray, bool]:
+        """Up to `count` samples for the output callback, and whether the utterance is finished."""
+        with self._lock:
+            taken = []
+            needed = count
+            while needed and self._pending:
+                chunk = self._pending[0]
+                if chunk.size <= needed:
+                    taken.append(self._pending.popleft())
+                    needed -= chunk.size
+                else:
+                    taken.append(chunk[:needed])
+                    self._pending[0] = chunk[needed:]
+                    needed = 0
+            finished = self._closed and not self._pending
+        samples = np.concatenate(taken) if taken else np.zeros(0, dtype=np.float32)
+        if samples.size and self.started_at is None:
+            self.started_at = time.monotonic()
+        self._position += samples.size
+        return samples, finished
+
+
+class AudioPlayer:
+    """
+    One persistent output stream that plays queued PlaybackHandles back to back.
+
+    Keeping the stream open avoids reopening the device for every sentence, and since handles
+    are played while they are still being fed, speech starts with the first synthesized chunk.
+    When synthesis falls behind, the gap is filled with silence.
+    """
+
+    def __init__(self, sample_rate: int = int(os.getenv('TTS_SAMPLE_RATE', '22050')), blocksize: int = 512):
+        self.sample_rate = sample_rate
+        self.blocksize = blocksize
+        self._queue: Deque[PlaybackHandle] = deque()
+        self._lock = threading.Lock()
+        self._stream = None
+
+    def start(self) -> "AudioPlayer":
+        if self._stream is None:
+            self._stream = sd.OutputStream(samplerate=self.sample_rate, blocksize=self.blocksize,
+                                           channels=1, dtype='float32', callback=self._callback)
+            self._stream.start()
+        return self
+
+    def stop(self) -> None:
+        self.cancel_all()
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+    def enqueue(self, handle: Optional[PlaybackHandle] = None) -> PlaybackHandle:
+        """Queue a handle behind the ones already playing, a new one at the player's rate by default."""
+        handle = handle or PlaybackHandle(self.sample_rate)
+        self.start()
+        with self._lock:
+            self._queue.append(handle)
+        return handle
+
+    def cancel_all(self) -> None:
+        with self._lock:
+            handles = list(self._queue)
+        for handle in handles:
+            handle.cancel()
+
+    def _callback(self, outdata, frames, time, status):
+        if status:
+            debug_print(status)
+        out = outdata[:, 0]
+        out.fill(0)
+        filled = 0
+        while filled < frames:
+            with self._lock:
+                handle = self._queue[0] if self._queue else None
+            if handle is None:
+                break
+            if handle.cancelled:
+                self._pop(handle)
+                continue
+            samples, finished = handle._read(frames - filled)
+            out[filled:filled + samples.size] = samples
+            filled += samples.size
+            if finished:
+                handle._done.set()
+                self._pop(handle)
+            elif not samples.size:
+                break  # Synthesis has not caught up yet
+
+    def _pop(self, handle: PlaybackHandle) -> None:
+        with self._lock:
+            if self._queue and self._queue[0] is handle:
+                self._queue.popleft()
@@ -0,0 +1,113 @@
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from UTILS.printer import debug_print
+
+
+class BargeInMonitor:
+    """
+    Listens on the shared capture while Jarvix is speaking and cancels playback as soon as the
+    user says the wake word or starts talking over it.
+
+    The microphone also hears our own voice, so a frame only counts as user speech when its
+    energy is well above what the current playback is expected to leak into the microphone
+    (the echo) plus the noise floor. The echo coupling, mic energy per unit of playback energy,
+    is learned on frames that are not speech, so it adapts to the speaker volume and the room.
+    """
+
+    def __init__(self, capture, wake_detector=None, speech_ratio: float = 4.0, min_speech: float = 0.064,
+                 settle_time: float = 0.3, initial_coupling: float = 0.5, min_energy: float = 1e-5):
+        self.capture = capture
+        self.wake_detector = wake_detector
+        self.speech_ratio = speech_ratio
+        self.min_speech = min_speech
+        self.settle_time = settle_time  # only the wake word interrupts while the echo estimate settles
+        self.min_energy = min_energy
+        self.echo_coupling = initial_coupling
+        self.noise_floor = min_energy
+        self.interrupted: Optional[str] = None  # 'wake_word' or 'speech' once the user barged in
+        self.interrupted_at: Optional[float] = None
+        self._handles = []
+        self._speech_time = 0.0
+        self._echo_observed = 0.0  # seconds of our own playback the echo estimate has learned from
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        self.interrupted = None
+        self.interrupted_at = None
+
+    def start(self) -> None:
+        """Start listening, then `track` the handles to watch over."""
+        self.capture.start()
+        self.capture.add_listener(self.process_frame)
+
+    def stop(self) -> None:
+        self.capture.remove_listener(self.process_frame)
+        with self._lock:
+            self._handles = []
+        if self.interrupted:
+            debug_print(f"Playback interrupted by {self.interrupted} "
+                        f"({(time.monotonic() - self.interrupted_at) * 1000:.0f} ms to return)")
+
+    def track(self, handle) -> None:
+        """Watch `handle` once the ones tracked before it have finished playing."""
+        with self._lock:
+            self._handles.append(handle)
+        if self.interrupted:
+            handle.cancel()
+
+    def watch(self, handle) -> bool:
+        """Block until `handle` finishes playing or the user interrupts it, returns False when interrupted."""
+        self.start()
+        self.track(handle)
+        try:
+            # Waiting in short steps keeps Ctrl+C responsive
+            while not handle.done:
+                handle.wait(timeout=0.1)
+        finally:
+            self.stop()
+        return not self.interrupted
+
+    def process_frame(self, audio_frame: np.ndarray) -> None:
+        """Listener for the shared capture service, called with every int16 frame."""
+        with self._lock:
+            handle = next((handle for handle in self._handles if not handle.done), None)
+        if handle is None:
+            return
+
+        if self.wake_detector is not None and self.wake_detector.porcupine.process(audio_frame) >= 0:
+            self._interrupt(handle, 'wake_word')
+            return
+
+        frame = audio_frame.astype(np.float32) / 32768.0
+        energy = float(np.mean(frame ** 2))
+        reference = handle.recent_level() ** 2
+        expected = self.echo_coupling * reference + self.noise_floor
+        settled = self._echo_observed >= self.settle_time
+
+        if settled and energy > self.speech_ratio * expected and energy > self.min_energy:
+            self._speech_time += len(frame) / self.capture.sample_rate
+            if self._speech_time >= self.min_speech:
+                self._interrupt(handle, 'speech')
+            return
+
+        self._speech_time = 0.0
+        if reference > self.min_energy:
+            self._echo_observed += len(frame) / self.capture.sample_rate
+            # Track how much of our own output reaches the microphone, quickly while settling
+            rate = 0.05 if settled else 0.3
+            self.echo_coupling += rate * (energy / reference - self.echo_coupling)
+        else:
+            rate = 0.3 if energy < self.noise_floor else 0.05
+            self.noise_floor = max(self.noise_floor + rate * (energy - self.noise_floor), self.min_energy)
+
+    def _interrupt(self, handle, reason: str) -> None:
+        self.interrupted = reason
+        self.interrupted_at = time.monotonic()
+        with self._lock:
+            handles = list(self._handles)
+        for tracked in handles:
+            tracked.cancel()
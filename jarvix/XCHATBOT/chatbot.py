@@ -1,18 +1,22 @@
 import logging
 import os
-import time
-from collections import deque
-from typing import ClassVar
+from typing import ClassVar, Callable, Optional, Iterable, Iterator, Union
 
 from pathlib import Path
 import soundfile as sf
 import sounddevice as sd
 from pydantic import BaseModel
-from faster_whisper import WhisperModel
 import numpy as np
 
 from UTILS.printer import debug_print
+from UTILS.startup import LazyLoader
 from XCHATBOT.tts import NaturalTTS
+from XCHATBOT.streaming_stt import StreamingTranscriber
+from XCHATBOT.stt_engine import TieredSTTEngine
+from XCHATBOT.stt_batch import BatchedSTTEngine
+from XCHATBOT.stt_worker import STTWorkerPool
+from XCHATBOT.sentence_segmenter import SentenceSegmenter
+from XCHATBOT.endpointing import create_endpointer
 
 if os.getenv('LOGGING', 'false').lower() == 'true':
     logging.basicConfig(
@@ -27,90 +31,141 @@ class Chatbot(BaseModel):
     tts_model: str = "tts-1"
     tts_voice: str = "nova"
     silence_duration: float = 1.3 # 3 seconds for natural pauses
+    sample_rate: int = 44100
+    # Optional XCHATBOT.audio_capture.AudioCaptureService shared with the wake word detector
+    capture: Optional[object] = None
+    pre_roll: float = float(os.getenv('RECORDING_PRE_ROLL', '0.3'))  # seconds of audio kept from before the recording started
+    streaming_stt: bool = os.getenv('STREAMING_STT', 'false').lower() == 'true'
+    endpointer: str = os.getenv('ENDPOINTER', 'vad')  # 'vad' or the original 'amplitude' heuristic
+    # Optional XCHATBOT.barge_in.BargeInMonitor, lets the user interrupt while Jarvix is speaking
+    barge_in: Optional[object] = None
+    # Optional XCHATBOT.stt_vocabulary.STTVocabulary with the device names Whisper should expect
+    vocabulary: Optional[object] = None
     gpt_whisper_model: str = "whisper-1"
-    faster_whisper_model: ClassVar[WhisperModel] = WhisperModel("large-v3", device="cpu", compute_type="int8")
-    tts: ClassVar[NaturalTTS] = NaturalTTS()
+    # Loaded on first use, or ahead of time with `warm_up()` while the setup wizard runs
+    # With STT_WORKERS, Whisper runs in separate processes and never competes with the audio callbacks
+    # With STT_BATCHING, utterances transcribed at the same time are decoded together
+    stt_engine: ClassVar[Union[TieredSTTEngine, BatchedSTTEngine, STTWorkerPool]] = (
+        STTWorkerPool() if int(os.getenv('STT_WORKERS', '0'))
+        else BatchedSTTEngine() if os.getenv('STT_BATCHING', 'false').lower() == 'true'
+        else TieredSTTEngine())
+    tts_loader: ClassVar[LazyLoader] = LazyLoader("TTS engine", NaturalTTS)
 
     class Config:
         arbitrary_types_allowed = True
 
+    @property
+    def faster_whisper_model(self) -> Union[TieredSTTEngine, BatchedSTTEngine, STTWorkerPool]:
+        return self.stt_engine
+
+    @property
+    def tts(self) -> NaturalTTS:
+        return self.tts_loader.get()
+
+    @classmethod
+    def warm_up(cls) -> dict:
+        """Start loading the Whisper models and the TTS engine on background threads."""
+        return {**cls.stt_engine.warm_up(), cls.tts_loader.name: cls.tts_loader.warm_up()}
+
     def speech_to_text(self, file: Path) -> str:
-        segments, _ = self.faster_whisper_model.transcribe(str(file))
+        segments, _ = self.faster_whisper_model.transcribe(str(file), **self._transcribe_kwargs())
         transcription = ''.join(segment.text for segment in segments)
         return transcription
 
     def record_audio(self) -> Path:
         speech_file_path = Path(__file__).parent / self.filename
-        chunk_duration = 0.1  # seconds per chunk
-        sample_rate = 44100
-        chunk_samples = int(sample_rate * chunk_duration)
-
-        # Updated parameters for natural conversation
-        silence_threshold = 0.02  # Slightly lower threshold
-        min_duration = 1.0
-        max_duration = 30
-        smoothing_window = 10  # Number of chunks to average
-
-        frames = []
-        silence_counter = 0
-        has_detected_sound = False
-        recent_amplitudes = deque(maxlen=smoothing_window)  # For amplitude smoothing
+        audio = self._capture_audio()
 
-        print("Recording... (Speak now)")
+        debug_print("\nRecording stopped, saving file...")
+        sf.write(speech_file_path, audio, self.recording_sample_rate)
+        debug_print(f"File saved as {speech_file_path}")
 
-        start_time = time.time()
+        return speech_file_path
 
-        with sd.InputStream(samplerate=sample_rate, channels=1,
+    def stream_speech_to_text(self) -> str:
+        """Record and transcribe at the same time, without writing the audio to disk."""
+        transcriber = StreamingTranscriber(self.faster_whisper_model, input_sample_rate=self.recording_sample_rate,
+                                           **self._transcribe_kwargs()).start()
+        self._capture_audio(on_chunk=transcriber.feed, partial_transcript=transcriber.transcript_until)
+        debug_print("\nRecording stopped, finishing transcription...")
+        return transcriber.finish()
+
+    def _transcribe_kwargs(self) -> dict:
+        return self.vocabulary.transcribe_kwargs() if self.vocabulary is not None else {}
+
+    @property
+    def recording_sample_rate(self) -> int:
+        # The shared capture already records at Whisper's 16 kHz, so nothing needs resampling
+        return self.capture.sample_rate if self.capture is not None else self.sample_rate
+
+    def _audio_chunks(self, chunk_samples: int) -> Iterator[np.ndarray]:
+        if self.capture is not None:
+            yield from self.capture.start().chunks(chunk_samples, pre_roll=self.pre_roll)
+            return
+        with sd.InputStream(samplerate=self.sample_rate, channels=1,
                             dtype='float32', blocksize=chunk_samples) as stream:
             while True:
                 audio_chunk, _ = stream.read(chunk_samples)
-                frames.append(audio_chunk)
+                yield audio_chunk
 
-                # Calculate smoothed amplitude
-                current_amplitude = np.max(np.abs(audio_chunk))
-                recent_amplitudes.append(current_amplitude)
-                avg_amplitude = np.mean(recent_amplitudes)
+    def _capture_audio(self, on_chunk: Optional[Callable[[np.ndarray], None]] = None,
+                       partial_transcript: Optional[Callable[[float], Optional[str]]] = None) -> np.ndarray:
+        sample_rate = self.recording_sample_rate
+        endpointer = create_endpointer(self.endpointer, silence_duration=self.silence_duration)
+        endpointer.partial_transcript = partial_transcript
+        chunk_samples = int(sample_rate * endpointer.chunk_duration)
 
-                recording_duration = time.time() - start_time
-
-                # Check if we've detected sound using smoothed amplitude
-                if avg_amplitude > silence_threshold:
-                    has_detected_sound = True
-                    silence_counter = 0
-                else:
-                    if has_detected_sound:  # Only count silence after we've detected sound
-                        silence_counter += chunk_duration
+        frames = []
+        print("Recording... (Speak now)")
 
-                # Visual level meter and status
-                level_bars = '=' * int(avg_amplitude * 100)
-                status = f"Level: {level_bars:15}| Amplitude: {avg_amplitude:.4f}, Silence: {silence_counter:.1f}s"
-                print(status, end='\r')
+        audio_chunks = self._audio_chunks(chunk_samples)
+        for audio_chunk in audio_chunks:
+            frames.append(audio_chunk)
+            if on_chunk:
+                on_chunk(audio_chunk[:, 0])
 
-                # Stop conditions
-                if recording_duration >= max_duration:
-                    debug_print("\nMaximum duration reached")
-                    break
+            turn_ended = endpointer.process(audio_chunk[:, 0], sample_rate)
 
-                if has_detected_sound and recording_duration >= min_duration:
-                    if silence_counter >= self.silence_duration:
-                        print("\nLong silence detected - ending recording")
-                        break
+            # Visual level meter and status
+            level_bars = '=' * int(endpointer.level * 100)
+            status = f"Level: {level_bars:15}| Amplitude: {endpointer.level:.4f}, Silence: {endpointer.silence:.1f}s"
+            print(status, end='\r')
 
-        debug_print("\nRecording stopped, saving file...")
-        audio = np.concatenate(frames)
-        sf.write(speech_file_path, audio, sample_rate)
-        debug_print(f"File saved as {speech_file_path}")
+            if turn_ended:
+                debug_print(f"\nEnd of turn ({endpointer.reason}) after {endpointer.elapsed:.1f}s")
+                break
 
-        return speech_file_path
+        # Closes the input stream when recording without the shared capture
+        audio_chunks.close()
+        return np.concatenate(frames)
 
-    def start_conversation(self, processor: callable, test_text: str = None) -> None:
+    def start_conversation(self, processor: callable, test_text: str = None,
+                           stream_processor: Optional[Callable[[str], Iterable[str]]] = None) -> bool:
+            """Run one turn, returns True when the user interrupted the answer and is already talking again."""
             text = test_text
             input_audio_path = None
-            if not test_text:
+            if not test_text and self.streaming_stt:
+                text = self.stream_speech_to_text()
+            elif not test_text:
                 input_audio_path = self.record_audio()
                 text = self.speech_to_text(input_audio_path)
-            response = processor(text)
-            self.tts.speak(response)
+            if not test_text:
+                debug_print(self.stt_engine.report())
+            if self.barge_in is not None:
+                self.barge_in.reset()
+            if stream_processor:
+                # Speak each sentence as soon as it is generated
+                utterances = SentenceSegmenter().segment(stream_processor(text))
+                self.tts.speak_stream(utterances, monitor=self.barge_in)
+            else:
+                response = processor(text)
+                if self.barge_in is not None:
+                    self.tts.speak_interruptible(response, self.barge_in)
+                else:
+                    self.tts.speak(response)
 
             if input_audio_path:
                 input_audio_path.unlink()
+            if self.tts.cache is not None:
+                debug_print(self.tts.cache.report())
+            return self.barge_in is not None and self.barge_in.interrupted is not None
@@ -0,0 +1,265 @@
+import json
+import re
+import sys
+from abc import ABC, abstractmethod
+from collections import deque
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional
+
+import numpy as np
+
+try:
+    import webrtcvad  # optional, better speech/non-speech decisions than the energy detector
+except ImportError:
+    webrtcvad = None
+
+# A partial transcript ending like this is probably not finished yet ("turn off the ...")
+INCOMPLETE_ENDINGS = re.compile(r"\b(and|or|but|the|a|an|to|of|in|on|my|with|for|is|please|um|uh)\W*$", re.IGNORECASE)
+
+
+class Endpointer(ABC):
+    """Decides, one chunk at a time, when the user has finished speaking."""
+
+    chunk_duration: float = 0.1  # seconds of audio the recorder should pass per call
+
+    def __init__(self, min_duration: float = 1.0, max_duration: float = 30):
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        # Called with the time the current pause started, returns the transcript up to there or None if not decoded yet
+        self.partial_transcript: Optional[Callable[[float], Optional[str]]] = None
+        self.reset()
+
+    def reset(self) -> None:
+        self.elapsed = 0.0
+        self.speech_detected = False
+        self.silence = 0.0
+        self.level = 0.0
+        self.reason = None
+
+    @abstractmethod
+    def process(self, chunk: np.ndarray, sample_rate: int) -> bool:
+        """Feed a float32 mono chunk, returns True once the turn has ended."""
+
+    def _reached_max_duration(self) -> bool:
+        if self.elapsed >= self.max_duration:
+            self.reason = "max_duration"
+            return True
+        return False
+
+
+class AmplitudeEndpointer(Endpointer):
+    """The original heuristic: the smoothed peak amplitude stays below a threshold for `silence_duration`."""
+
+    def __init__(self, silence_threshold: float = 0.02, silence_duration: float = 1.3, smoothing_window: int = 10,
+                 **kwargs):
+        self.silence_threshold = silence_threshold
+        self.silence_duration = silence_duration
+        self.smoothing_window = smoothing_window
+        super().__init__(**kwargs)
+
+    def reset(self) -> None:
+        super().reset()
+        self.recent_amplitudes = deque(maxlen=self.smoothing_window)
+
+    def process(self, chunk: np.ndarray, sample_rate: int) -> bool:
+        duration = len(chunk) / sample_rate
+        self.elapsed += duration
+        self.recent_amplitudes.append(np.max(np.abs(chunk)))
+        self.level = float(np.mean(self.recent_amplitudes))
+
+        if self.level > self.silence_threshold:
+            self.speech_detected = True
+            self.silence = 0.0
+        elif self.speech_detected:  # Only count silence after we've detected sound
+            self.silence += duration
+
+        if self._reached_max_duration():
+            return True
+        if self.speech_detected and self.elapsed >= self.min_duration and self.silence >= self.silence_duration:
+            self.reason = "silence"
+            return True
+        return False
+
+
+class VadEndpointer(Endpointer):
+    """
+    Frame-level voice activity detection with an adaptive noise floor.
+
+    Audio is classified in 30 ms frames, by WebRTC VAD when installed and otherwise by
+    comparing frame energy to a running estimate of the room's noise floor. The turn ends
+    after `end_silence` of non-speech, or after `early_end_silence` when the transcript of
+    everything said before the pause already reads like a complete sentence.
+    """
+
+    chunk_duration = 0.03
+
+    def __init__(self, end_silence: float = 0.5, early_end_silence: float = 0.25, min_speech: float = 0.15,
+                 no_speech_timeout: float = 8.0, aggressiveness: int = 2, speech_ratio: float = 3.0,
+                 min_energy: float = 1e-5, frame_ms: int = 30, **kwargs):
+        self.end_silence = end_silence
+        self.early_end_silence = early_end_silence
+        self.min_speech = min_speech
+        self.no_speech_timeout = no_speech_timeout
+        self.speech_ratio = speech_ratio
+        self.min_energy = min_energy
+        self.frame_ms = frame_ms
+        self.vad = webrtcvad.Vad(aggressiveness) if webrtcvad is not None else None
+        kwargs.setdefault('min_duration', 0.0)
+        super().__init__(**kwargs)
+
+    def reset(self) -> None:
+        super().reset()
+        self.noise_floor = None
+        self.speech_time = 0.0
+        self._pending = np.zeros(0, dtype=np.float32)
+
+    def process(self, chunk: np.ndarray, sample_rate: int) -> bool:
+        frame_samples = sample_rate * self.frame_ms // 1000
+        self._pending = np.concatenate((self._pending, np.asarray(chunk, dtype=np.float32).reshape(-1)))
+        frame_duration = frame_samples / sample_rate
+
+        while self._pending.size >= frame_samples:
+            frame, self._pending = self._pending[:frame_samples], self._pending[frame_samples:]
+            self.elapsed += frame_duration
+            if self._is_speech(frame, sample_rate):
+                self.speech_time += frame_duration
+                self.silence = 0.0
+                if self.speech_time >= self.min_speech:
+                    self.speech_detected = True
+            elif self.speech_detected:
+                self.silence += frame_duration
+            else:
+                # Short blips before real speech do not count
+                self.speech_time = 0.0
+
+            if self._turn_ended():
+                return True
+        return False
+
+    def _turn_ended(self) -> bool:
+        if self._reached_max_duration():
+            return True
+        if not self.speech_detected:
+            if self.elapsed >= self.no_speech_timeout:
+                self.reason = "no_speech"
+                return True
+            return False
+        if self.elapsed < self.min_duration:
+            return False
+        if self.silence >= self.end_silence:
+            self.reason = "silence"
+            return True
+        if self.silence >= self.early_end_silence and self._transcript_looks_complete():
+            self.reason = "early"
+            return True
+        return False
+
+    def _is_speech(self, frame: np.ndarray, sample_rate: int) -> bool:
+        energy = float(np.mean(frame ** 2))
+        self.level = float(np.sqrt(energy))
+        if self.noise_floor is None:
+            self.noise_floor = max(energy, self.min_energy)
+
+        if self.vad is not None and sample_rate in (8000, 16000, 32000, 48000):
+            pcm = (np.clip(frame, -1, 1) * 32767).astype(np.int16).tobytes()
+            speech = self.vad.is_speech(pcm, sample_rate)
+        else:
+            speech = energy > max(self.noise_floor * self.speech_ratio, self.min_energy)
+
+        if not speech:
+            # Track the noise floor on non-speech frames only, quickly downwards and slowly upwards
+            rate = 0.3 if energy < self.noise_floor else 0.05
+            self.noise_floor += rate * (energy - self.noise_floor)
+            self.noise_floor = max(self.noise_floor, self.min_energy)
+        return speech
+
+    def _transcript_looks_complete(self) -> bool:
+        if self.partial_transcript is None:
+            return False
+        # Only a transcript reaching the start of this pause tells whether the last words finished a sentence
+        text = self.partial_transcript(self.elapsed - self.silence)
+        if text is None:
+            return False
+        text = text.strip()
+        return bool(text) and text[-1] in ".?!" and not INCOMPLETE_ENDINGS.search(text[:-1])
+
+
+def create_endpointer(kind: str = 'vad', silence_duration: float = 1.3) -> Endpointer:
+    if kind == 'amplitude':
+        return AmplitudeEndpointer(silence_duration=silence_duration)
+    if kind == 'vad':
+        return VadEndpointer()
+    raise ValueError(f"Unknown endpointer '{kind}'. Use 'vad' or 'amplitude'.")
+
+
+def evaluate(fixtures_dir: Path, kinds: Iterable[str] = ('amplitude', 'vad'), trailing_silence: float = 3.0,
+             silence_duration: float = 1.3, model=None) -> Dict[str, Dict[str, float]]:
+    """
+    Replay recorded turns through each endpointer as if they were streamed from the microphone.
+
+    Every `<name>.wav` in `fixtures_dir` needs a `<name>.json` next to it with `speech_end`, the
+    time in seconds where the speaker stops. With a Whisper `model`, the turns are also fed to a
+    StreamingTranscriber in real time, so the early end sees the partial transcripts and decode
+    delays it would see live; without one the early end never fires. Endpoint latency is how
+    long after `speech_end` the turn was closed; a turn closed before `speech_end` is truncated.
+    """
+    import time
+    import soundfile as sf
+    from XCHATBOT.streaming_stt import StreamingTranscriber
+
+    fixtures = []
+    for wav_path in sorted(Path(fixtures_dir).glob('*.wav')):
+        label_path = wav_path.with_suffix('.json')
+        if not label_path.exists():
+            continue
+        audio, sample_rate = sf.read(wav_path, dtype='float32', always_2d=True)
+        audio = np.concatenate((audio[:, 0], np.zeros(int(trailing_silence * sample_rate), dtype=np.float32)))
+        fixtures.append((audio, sample_rate, json.loads(label_path.read_text())))
+
+    results = {}
+    for kind in kinds:
+        latencies, truncated = [], 0
+        for audio, sample_rate, label in fixtures:
+            endpointer = create_endpointer(kind, silence_duration=silence_duration)
+            transcriber = None
+            if model is not None and isinstance(endpointer, VadEndpointer):
+                transcriber = StreamingTranscriber(model, input_sample_rate=sample_rate).start()
+                endpointer.partial_transcript = transcriber.transcript_until
+
+            chunk_samples = int(sample_rate * endpointer.chunk_duration)
+            end_time = audio.size / sample_rate
+            started = time.perf_counter()
+            for start in range(0, audio.size, chunk_samples):
+                chunk = audio[start:start + chunk_samples]
+                fed = (start + chunk.size) / sample_rate
+                if transcriber is not None:
+                    transcriber.feed(chunk)
+                    # At the microphone's pace, so background decoding lags as much as it would live
+                    time.sleep(max(started + fed - time.perf_counter(), 0))
+                if endpointer.process(chunk, sample_rate):
+                    end_time = fed
+                    break
+            if transcriber is not None:
+                transcriber.cancel()
+
+            if end_time < label['speech_end']:
+                truncated += 1
+            else:
+                latencies.append(end_time - label['speech_end'])
+
+        latencies.sort()
+        results[kind] = {
+            "turns": len(fixtures),
+            "mean_latency_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+            "p95_latency_ms": latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000 if latencies else 0.0,
+            "truncation_rate": truncated / len(fixtures) if fixtures else 0.0,
+        }
+    return results
+
+
+if __name__ == "__main__":
+    # python -m XCHATBOT.endpointing path/to/fixtures [--no-stt]
+    from XCHATBOT.stt_engine import TieredSTTEngine
+    stt_model = None if '--no-stt' in sys.argv else TieredSTTEngine()
+    for kind, result in evaluate(Path(sys.argv[1]), model=stt_model).items():
+        print(kind, result)
@@ -0,0 +1,372 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Iterable, List, Optional
+
+import numpy as np
+from pydantic import BaseModel
+
+from UTILS.printer import debug_print
+from XCHATBOT.endpointing import create_endpointer
+from XCHATBOT.sentence_segmenter import SentenceSegmenter
+from XCHATBOT.streaming_stt import StreamingTranscriber
+from XMODELS.router import classify_request
+
+# Put on a queue after the last item of a turn
+END = None
+
+
+class TurnTimings(BaseModel):
+    """Seconds after the wake word at which each stage finished its part of the turn."""
+    end_of_speech: float = 0.0
+    transcribed: float = 0.0
+    first_delta: float = 0.0
+    first_audio: float = 0.0
+    done: float = 0.0
+
+
+class Turn:
+    """One request travelling through the pipeline. Every stage drops the items of a cancelled turn."""
+
+    def __init__(self, number: int):
+        self.number = number
+        self.started_at = time.monotonic()
+        self.text = ''
+        self.route = None
+        self.audio: List[np.ndarray] = []
+        self.transcriber: Optional[StreamingTranscriber] = None
+        self.handles = []
+        self.cancelled = False
+        self.finished = False
+        self.timings = TurnTimings()
+
+    def mark(self, stage: str) -> None:
+        if not getattr(self.timings, stage):
+            setattr(self.timings, stage, time.monotonic() - self.started_at)
+
+
+class ConversationPipeline:
+    """
+    The voice loop as asyncio stages connected by bounded queues:
+
+    capture -> wake -> endpointing -> STT -> routing -> LLM -> synthesis -> playback
+
+    Each stage works on its own item while the others work on theirs, so the answer is
+    synthesized while it is still generated and played while the next sentence is synthesized.
+    Blocking work runs in executors: audio reads and the TTS engine on one thread each, and the
+    model client on its own pool. Whisper runs on the STT thread, or with STREAMING_STT on the
+    background thread of each turn's StreamingTranscriber, which only hands the final decode to
+    the STT thread. Tool calls run inside the client's ToolDispatcher. The bounded queues keep
+    a slow stage from piling up work: synthesis stays at most `queue_size` utterances ahead of
+    playback.
+
+    A stage that raises is logged and restarted after `restart_delay`, and the turn it was
+    working on is cancelled, so one failure does not end the voice loop. The capture stage
+    reopens the input stream when the device stops delivering audio.
+
+    The wake word, or the BargeInMonitor hearing the user over the answer, cancels the current
+    turn: its playback stops within one output block and every stage drops its remaining items.
+    """
+
+    def __init__(self, chatbot, wake_detector, processor: Callable[[str], str],
+                 stream_processor: Optional[Callable[[str], Iterable[str]]] = None,
+                 queue_size: int = int(os.getenv('PIPELINE_QUEUE_SIZE', '8')), restart_delay: float = 1.0):
+        if chatbot.capture is None:
+            raise ValueError("The pipeline reads from the shared audio capture, set SHARED_AUDIO_CAPTURE=true.")
+        self.chatbot = chatbot
+        self.capture = chatbot.capture
+        self.wake_detector = wake_detector
+        self.processor = processor
+        self.stream_processor = stream_processor
+        self.queue_size = queue_size
+        self.restart_delay = restart_delay
+        self.barge_in = chatbot.barge_in
+        if self.barge_in is not None:
+            # The wake stage already runs Porcupine on every frame, and it keeps state between frames
+            self.barge_in.wake_detector = None
+        self.turn: Optional[Turn] = None
+        self.listening = False
+        self._turn_count = 0
+        self._capture_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='capture')
+        self._stt_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stt')
+        self._llm_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='llm')
+        self._tts_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tts')
+
+    async def run(self) -> None:
+        self._frames = asyncio.Queue(maxsize=self.queue_size * 4)
+        self._speech = asyncio.Queue(maxsize=self.queue_size * 4)
+        self._audio = asyncio.Queue(maxsize=self.queue_size * 4)
+        self._requests = asyncio.Queue(maxsize=self.queue_size)
+        self._generation = asyncio.Queue(maxsize=self.queue_size)
+        self._deltas = asyncio.Queue(maxsize=self.queue_size * 4)
+        self._playback = asyncio.Queue(maxsize=self.queue_size)
+
+        stages = {'capture': self._capture, 'wake': self._wake, 'endpointing': self._endpoint,
+                  'stt': self._transcribe, 'routing': self._route, 'llm': self._generate,
+                  'synthesis': self._synthesize, 'playback': self._play}
+        print("\n🎙️ Listening for your wake word... Say 'Hey Jarvix' to start interacting!")
+        tasks = [asyncio.create_task(self._supervise(name, stage), name=name) for name, stage in stages.items()]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if self.turn is not None:
+                self.cancel_turn()
+            for executor in (self._capture_executor, self._stt_executor, self._llm_executor, self._tts_executor):
+                executor.shutdown(wait=False)
+
+    def cancel_turn(self) -> None:
+        turn = self.turn
+        if turn is None or turn.finished:
+            return
+        turn.cancelled = True
+        self.listening = False
+        for handle in turn.handles:
+            handle.cancel()
+        if turn.transcriber is not None:
+            turn.transcriber.cancel()
+        debug_print(f"Turn {turn.number} cancelled")
+        self._finish_turn(turn)
+
+    def _start_turn(self) -> None:
+        self._turn_count += 1
+        self.turn = Turn(self._turn_count)
+        if self.barge_in is not None:
+            self.barge_in.reset()
+        self.listening = True
+        print("Recording... (Speak now)")
+
+    def _finish_turn(self, turn: Turn) -> None:
+        if turn.finished:
+            return
+        turn.finished = True
+        turn.mark('done')
+        if self.barge_in is not None:
+            self.barge_in.stop()
+        timings = turn.timings
+        debug_print(f"Turn {turn.number}: end of speech {timings.end_of_speech:.2f}s, transcribed {timings.transcribed:.2f}s, "
+                    f"first delta {timings.first_delta:.2f}s, first audio {timings.first_audio:.2f}s, done {timings.done:.2f}s")
+        if self.chatbot.tts.cache is not None:
+            debug_print(self.chatbot.tts.cache.report())
+        if not turn.cancelled:
+            print("\n🤖 Conversation ended. Ready to listen for your next command.")
+            print("\n🎙️ Listening for your wake word... Say 'Hey Jarvix' to start interacting!")
+
+    def _interrupt(self) -> None:
+        """The user talked over the answer: drop the rest of the turn and listen to them right away."""
+        self.cancel_turn()
+        print("\n✋ Interrupted, listening...")
+        self._start_turn()
+
+    async def _supervise(self, name: str, stage: Callable) -> None:
+        while True:
+            try:
+                await stage()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                debug_print(f"Pipeline stage '{name}' failed: {e!r}, restarting in {self.restart_delay:.1f}s")
+                # The stage may have dropped items of the current turn, which would then never finish
+                self.cancel_turn()
+                await asyncio.sleep(self.restart_delay)
+
+    async def _capture(self) -> None:
+        loop = asyncio.get_running_loop()
+        frame_length = self.capture.frame_length
+        await loop.run_in_executor(self._capture_executor, self.capture.start)
+        cursor = self.capture.position
+        while True:
+            try:
+                frame = await loop.run_in_executor(self._capture_executor, self.capture.read, cursor, frame_length)
+            except OverflowError:
+                debug_print("Pipeline fell behind the capture, dropping the oldest audio")
+                cursor = self.capture.position - frame_length
+                continue
+            except (TimeoutError, RuntimeError) as e:
+                # The device stopped delivering audio, e.g. it was unplugged or PortAudio hiccuped
+                debug_print(f"{e} Reopening the input stream in {self.restart_delay:.1f}s")
+                await loop.run_in_executor(self._capture_executor, self.capture.stop)
+                await asyncio.sleep(self.restart_delay)
+                await loop.run_in_executor(self._capture_executor, self.capture.start)
+                cursor = self.capture.position
+                continue
+            cursor += frame_length
+            await self._frames.put(frame)
+
+    async def _wake(self) -> None:
+        while True:
+            frame = await self._frames.get()
+            # Porcupine takes well under a millisecond per frame, no executor needed
+            if self.wake_detector.porcupine.process(frame) >= 0:
+                debug_print("Wake word detected!")
+                self.cancel_turn()
+                print("\n💬 Wake word detected! Let's chat...")
+                self._start_turn()
+                continue
+
+            turn = self.turn
+            if self.barge_in is not None and turn is not None and turn.handles and not turn.finished:
+                self.barge_in.process_frame(frame)
+                if self.barge_in.interrupted:
+                    self._interrupt()
+                    continue
+
+            if self.listening:
+                # The frames right after the wake word are the request, no pre-roll is lost between them
+                await self._speech.put((self.turn, frame.astype(np.float32) / 32768.0))
+
+    async def _endpoint(self) -> None:
+        sample_rate = self.capture.sample_rate
+        turn = None
+        endpointer = None
+        pending: List[np.ndarray] = []
+        while True:
+            item_turn, frame = await self._speech.get()
+            if item_turn is not turn:
+                turn = item_turn
+                endpointer = create_endpointer(self.chatbot.endpointer, silence_duration=self.chatbot.silence_duration)
+                endpointer.partial_transcript = (
+                    lambda until, turn=turn: turn.transcriber.transcript_until(until) if turn.transcriber else None)
+                pending = []
+            if turn.cancelled or turn.timings.end_of_speech:
+                continue
+
+            # Capture frames are shorter than the chunks the endpointer expects
+            pending.append(frame)
+            if sum(part.size for part in pending) < int(sample_rate * endpointer.chunk_duration):
+                continue
+            chunk = np.concatenate(pending)
+            pending = []
+            await self._audio.put((turn, chunk))
+            if endpointer.process(chunk, sample_rate):
+                debug_print(f"End of turn ({endpointer.reason}) after {endpointer.elapsed:.1f}s")
+                self.listening = False
+                turn.mark('end_of_speech')
+                await self._audio.put((turn, END))
+
+    async def _transcribe(self) -> None:
+        loop = asyncio.get_running_loop()
+        model = self.chatbot.faster_whisper_model
+        sample_rate = self.capture.sample_rate
+        while True:
+            turn, chunk = await self._audio.get()
+            if turn.cancelled:
+                continue
+            if chunk is not END:
+                if not self.chatbot.streaming_stt:
+                    turn.audio.append(chunk)
+                    continue
+                if turn.transcriber is None:
+                    turn.transcriber = StreamingTranscriber(model, input_sample_rate=sample_rate,
+                                                            **self.chatbot._transcribe_kwargs()).start()
+                turn.transcriber.feed(chunk)
+                continue
+
+            try:
+                if turn.transcriber is not None:
+                    text = await loop.run_in_executor(self._stt_executor, turn.transcriber.finish)
+                elif turn.audio:
+                    # The capture records at Whisper's 16 kHz, the samples are transcribed as they are
+                    transcribe = partial(model.transcribe, np.concatenate(turn.audio), **self.chatbot._transcribe_kwargs())
+                    segments, _ = await loop.run_in_executor(self._stt_executor, transcribe)
+                    text = ''.join(segment.text for segment in segments)
+                else:
+                    text = ''
+            except Exception as e:
+                debug_print(f"Transcription failed: {e}")
+                text = ''
+            debug_print(model.report())
+            turn.text = text.strip()
+            turn.mark('transcribed')
+            await self._requests.put(turn)
+
+    async def _route(self) -> None:
+        while True:
+            turn = await self._requests.get()
+            if turn.cancelled:
+                continue
+            if not turn.text:
+                debug_print("Nothing was said, ending the turn")
+                self._finish_turn(turn)
+                continue
+            # The model clients still route on their own, this only labels the turn
+            turn.route = classify_request(turn.text)
+            debug_print(f"Turn {turn.number}: '{turn.text}' ({turn.route.value})")
+            await self._generation.put(turn)
+
+    async def _generate(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            turn = await self._generation.get()
+            if turn.cancelled:
+                continue
+            try:
+                if self.stream_processor:
+                    deltas = iter(self.stream_processor(turn.text))
+                    while not turn.cancelled:
+                        delta = await loop.run_in_executor(self._llm_executor, next, deltas, END)
+                        if delta is END:
+                            break
+                        turn.mark('first_delta')
+                        await self._deltas.put((turn, delta))
+                    if turn.cancelled and hasattr(deltas, 'close'):
+                        # Stops the request to the model instead of reading the rest of the answer
+                        await loop.run_in_executor(self._llm_executor, deltas.close)
+                else:
+                    response = await loop.run_in_executor(self._llm_executor, self.processor, turn.text)
+                    turn.mark('first_delta')
+                    await self._deltas.put((turn, response))
+            except Exception as e:
+                debug_print(f"Generating the answer failed: {e}")
+                await self._deltas.put((turn, "Sorry, something went wrong."))
+            await self._deltas.put((turn, END))
+
+    async def _synthesize(self) -> None:
+        loop = asyncio.get_running_loop()
+        tts = self.chatbot.tts
+        turn = None
+        segmenter = None
+        while True:
+            item_turn, delta = await self._deltas.get()
+            if item_turn is not turn:
+                turn = item_turn
+                segmenter = SentenceSegmenter()
+            if turn.cancelled:
+                continue
+
+            if delta is END:
+                remaining = segmenter.flush()
+                utterances = [remaining] if remaining else []
+            else:
+                utterances = segmenter.feed(delta)
+            for utterance in utterances:
+                if turn.cancelled:
+                    break
+                handle = tts.player.enqueue()
+                turn.handles.append(handle)
+                if self.barge_in is not None:
+                    self.barge_in.track(handle)
+                # Bounded, so synthesis never runs more than a few utterances ahead of playback
+                await self._playback.put((turn, handle))
+                await loop.run_in_executor(self._tts_executor, tts.fill, utterance, handle)
+            if delta is END:
+                await self._playback.put((turn, END))
+
+    async def _play(self) -> None:
+        while True:
+            turn, handle = await self._playback.get()
+            if turn.cancelled:
+                if handle is not END:
+                    handle.cancel()
+                continue
+            if handle is END:
+                self._finish_turn(turn)
+                continue
+            # The player's output stream plays the handle, this stage waits for it and notices cancellation
+            while not handle.done and not turn.cancelled:
+                await asyncio.sleep(0.02)
+            if handle.started_at is not None and not turn.timings.first_audio:
+                turn.timings.first_audio = handle.started_at - turn.started_at
@@ -0,0 +1,52 @@
+import re
+from typing import Iterable, Iterator, List, Optional
+
+# Abbreviations that end with a period but should not end an utterance
+ABBREVIATIONS = {"mr.", "mrs.", "ms.", "dr.", "st.", "vs.", "etc.", "e.g.", "i.e.", "no."}
+SENTENCE_BOUNDARY = re.compile(r'[.!?;:]+["\')\]]*\s+|\n+')
+
+
+class SentenceSegmenter:
+    """
+    Cuts a stream of LLM token deltas into utterances that can be spoken on their own.
+
+    Usage:
+    segmenter = SentenceSegmenter()
+    for utterance in segmenter.segment(token_stream):
+        tts.speak(utterance)
+    """
+
+    def __init__(self, min_words: int = 3):
+        # Very short fragments ("Sure." / "Okay!") are merged with what follows to avoid choppy speech
+        self.min_words = min_words
+        self._buffer = ""
+
+    def feed(self, delta: str) -> List[str]:
+        self._buffer += delta
+        utterances = []
+        start = 0
+        for match in SENTENCE_BOUNDARY.finditer(self._buffer):
+            candidate = self._buffer[start:match.end()].strip()
+            if not candidate:
+                start = match.end()
+                continue
+            last_word = candidate.split()[-1].lower()
+            if last_word in ABBREVIATIONS or len(candidate.split()) < self.min_words:
+                continue
+            utterances.append(candidate)
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        return utterances
+
+    def flush(self) -> Optional[str]:
+        remaining = self._buffer.strip()
+        self._buffer = ""
+        return remaining or None
+
+    def segment(self, deltas: Iterable[str]) -> Iterator[str]:
+        for delta in deltas:
+            if delta:
+                yield from self.feed(delta)
+        remaining = self.flush()
+        if remaining:
+            yield remaining
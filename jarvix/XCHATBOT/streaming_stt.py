@@ -0,0 +1,171 @@
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from UTILS.printer import debug_print
+
+WHISPER_SAMPLE_RATE = 16000
+
+
+def resample(audio: np.ndarray, source_rate: int, target_rate: int = WHISPER_SAMPLE_RATE) -> np.ndarray:
+    """Linearly resample a mono float32 buffer to the rate Whisper expects."""
+    audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+    if source_rate == target_rate or audio.size == 0:
+        return audio
+    target_size = int(round(audio.size * target_rate / source_rate))
+    positions = np.linspace(0, audio.size - 1, num=target_size, dtype=np.float64)
+    return np.interp(positions, np.arange(audio.size), audio).astype(np.float32)
+
+
+class StreamingTranscriber:
+    """
+    Transcribes audio while it is still being recorded.
+
+    Chunks pushed through `feed` are kept in memory as 16 kHz float32 and a background
+    thread decodes them every `commit_interval` seconds. Segments that end before the
+    last `tail_duration` seconds are committed and dropped from the buffer, so only the
+    uncommitted tail is left to decode once the speaker stops. `transcript_until` asks the
+    thread to decode the tail too, for an endpointer that needs the words up to a pause.
+    """
+
+    def __init__(self, model, input_sample_rate: int = WHISPER_SAMPLE_RATE, commit_interval: float = 2.0,
+                 tail_duration: float = 1.0, **transcribe_kwargs):
+        self.model = model
+        self.input_sample_rate = input_sample_rate
+        self.commit_interval = commit_interval
+        self.tail_duration = tail_duration
+        self.transcribe_kwargs = transcribe_kwargs
+
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._buffer_start = 0.0  # seconds of audio before the buffer, covered by the committed text
+        self._committed: List[str] = []
+        self._partial: Optional[Tuple[str, float]] = None  # latest tail decode and the audio time it covers
+        self._partial_requested = 0.0
+        self._lock = threading.Lock()
+        self._decode_lock = threading.Lock()
+        self._wake = threading.Event()  # set by finish, cancel and transcript_until, not by every chunk
+        self._stopped = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+    def start(self) -> "StreamingTranscriber":
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+        return self
+
+    def feed(self, chunk: np.ndarray) -> None:
+        audio = resample(chunk, self.input_sample_rate)
+        with self._lock:
+            self._buffer = np.concatenate((self._buffer, audio))
+
+    def finish(self) -> str:
+        """Stop background decoding, decode whatever is left and return the full transcript."""
+        self._stopped.set()
+        self._wake.set()
+        if self._worker:
+            self._worker.join()
+
+        with self._lock:
+            remaining = self._buffer
+            self._buffer = np.zeros(0, dtype=np.float32)
+
+        if remaining.size:
+            segments = self._transcribe(remaining)
+            self._committed.extend(segment.text for segment in segments)
+        return ''.join(self._committed)
+
+    def cancel(self) -> None:
+        """Stop background decoding without transcribing the rest."""
+        self._stopped.set()
+        self._wake.set()
+
+    @property
+    def text(self) -> str:
+        """The transcript committed so far, lagging the audio by about `tail_duration`."""
+        return ''.join(self._committed)
+
+    def transcript_until(self, seconds: float) -> Optional[str]:
+        """
+        The transcript of at least the first `seconds` of audio, or None while it is not decoded yet.
+
+        The committed text lags the audio, so it only counts once it reaches `seconds`. Otherwise
+        the background thread is asked to decode the uncommitted tail, and a later call returns it.
+        """
+        with self._lock:
+            if self._buffer_start >= seconds:
+                return ''.join(self._committed)
+            if self._partial is not None and self._partial[1] >= seconds:
+                return self._partial[0]
+            if self._partial_requested < seconds:
+                self._partial_requested = seconds
+                self._wake.set()
+        return None
+
+    @property
+    def buffered_duration(self) -> float:
+        with self._lock:
+            return self._buffer.size / WHISPER_SAMPLE_RATE
+
+    def _run(self) -> None:
+        last_commit = time.monotonic()
+        while not self._stopped.is_set():
+            # Chunks arrive every few milliseconds, so the buffer is only re-decoded once per interval
+            self._wake.wait(timeout=max(0.0, last_commit + self.commit_interval - time.monotonic()))
+            self._wake.clear()
+            if self._stopped.is_set():
+                break
+            with self._lock:
+                partial_requested = self._partial_requested > (self._partial[1] if self._partial else 0.0)
+            if partial_requested:
+                self._decode_tail()
+            elif time.monotonic() - last_commit >= self.commit_interval:
+                last_commit = time.monotonic()
+                if self.buffered_duration >= self.commit_interval + self.tail_duration:
+                    self._commit_segments()
+
+    def _decode_tail(self) -> None:
+        with self._lock:
+            snapshot, start, committed = self._buffer, self._buffer_start, ''.join(self._committed)
+        if not snapshot.size:
+            return
+        segments = self._transcribe(snapshot)
+        with self._lock:
+            self._partial = (committed + ''.join(segment.text for segment in segments),
+                             start + snapshot.size / WHISPER_SAMPLE_RATE)
+
+    def _commit_segments(self) -> None:
+        with self._lock:
+            snapshot = self._buffer
+
+        segments = self._transcribe(snapshot)
+        commit_limit = snapshot.size / WHISPER_SAMPLE_RATE - self.tail_duration
+
+        committed_end = 0.0
+        committed_text = []
+        for segment in segments:
+            if segment.end > commit_limit:
+                break
+            committed_text.append(segment.text)
+            committed_end = segment.end
+
+        if not committed_text:
+            return
+
+        cut = min(int(committed_end * WHISPER_SAMPLE_RATE), snapshot.size)
+        with self._lock:
+            # Audio fed while decoding was appended after the snapshot, so it is kept intact
+            self._buffer = self._buffer[cut:]
+            self._buffer_start += cut / WHISPER_SAMPLE_RATE
+            self._committed.extend(committed_text)
+        debug_print(f"\nCommitted {committed_end:.1f}s of audio: {''.join(committed_text)}")
+
+    def _transcribe(self, audio: np.ndarray) -> list:
+        kwargs = dict(self.transcribe_kwargs)
+        if self._committed:
+            # Condition the next window on what has already been said, after any vocabulary prompt
+            context = ''.join(self._committed)[-200:]
+            kwargs['initial_prompt'] = f"{kwargs['initial_prompt']} {context}" if kwargs.get('initial_prompt') else context
+        with self._decode_lock:
+            segments, _ = self.model.transcribe(audio, **kwargs)
+            return list(segments)
@@ -0,0 +1,303 @@
+import os
+import sys
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+from UTILS.printer import debug_print
+from XCHATBOT.stt_engine import TieredSTTEngine
+from XCHATBOT.stt_worker import Segment, TranscriptionInfo
+from XCHATBOT.streaming_stt import WHISPER_SAMPLE_RATE
+
+# Whisper decodes 30 s windows, longer utterances go through the regular engine
+MAX_BATCHED_DURATION = 30.0
+TIMESTAMP_RESOLUTION = 0.02  # seconds per Whisper timestamp token
+
+# faster-whisper's defaults: worse results are decoded again with its temperature fallback
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOG_PROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+
+
+def compression_ratio(text: str) -> float:
+    """High for repetitive text, Whisper's sign of a decoding loop."""
+    data = text.encode('utf-8')
+    return len(data) / len(zlib.compress(data)) if data else 0.0
+
+
+class BatchStats(BaseModel):
+    batches: int = 0
+    utterances: int = 0
+    escalations: int = 0  # utterances passed on to the larger tiers for low confidence
+    fallbacks: int = 0  # utterances failing faster-whisper's quality checks, decoded again unbatched
+    decode_time: float = 0.0
+
+    @property
+    def average_batch(self) -> float:
+        return self.utterances / self.batches if self.batches else 0.0
+
+
+class _Pending:
+    def __init__(self, audio: np.ndarray, kwargs: dict):
+        self.audio = audio
+        self.kwargs = kwargs
+        self.result: Optional[Tuple[list, TranscriptionInfo]] = None
+        self.error: Optional[Exception] = None
+        self.done = threading.Event()
+
+
+class BatchedSTTEngine:
+    """
+    Decodes concurrent utterances together instead of one after the other.
+
+    `transcribe` can be called from many threads at once. The first call opens a window of
+    `max_wait` seconds, every utterance that arrives meanwhile (up to `max_batch`) is padded to
+    Whisper's 30 s window and decoded in one CTranslate2 `generate` call on the first tier's
+    model. Results are split into timestamped segments like faster-whisper's, so a
+    StreamingTranscriber can commit them. A result failing faster-whisper's compression ratio
+    or log probability check is decoded again by the TieredSTTEngine with its temperature
+    fallback, and one that is not confident enough escalates to the next tiers, so accuracy
+    matches the unbatched engine.
+    `transcribe_batch` decodes a list the caller already collected, e.g. the server's scheduler.
+    """
+
+    def __init__(self, engine: Optional[TieredSTTEngine] = None,
+                 max_batch: int = int(os.getenv('STT_MAX_BATCH', '8')),
+                 max_wait: float = float(os.getenv('STT_MAX_WAIT', '0.05'))):
+        self.engine = engine or TieredSTTEngine()
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.stats = BatchStats()
+        self._pending: List[_Pending] = []
+        self._condition = threading.Condition()
+        self._decode_lock = threading.Lock()  # CTranslate2 runs one batch at a time on the model
+        self._collector: Optional[threading.Thread] = None
+
+    def warm_up(self) -> Dict[str, threading.Thread]:
+        return self.engine.warm_up()
+
+    def transcribe(self, audio, **kwargs) -> Tuple[list, TranscriptionInfo]:
+        audio = self._load(audio)
+        if audio.size / WHISPER_SAMPLE_RATE > MAX_BATCHED_DURATION:
+            return self.engine.transcribe(audio, **kwargs)
+        pending = _Pending(audio, kwargs)
+        with self._condition:
+            self._pending.append(pending)
+            if self._collector is None or not self._collector.is_alive():
+                self._collector = threading.Thread(target=self._collect, name="STT batcher", daemon=True)
+                self._collector.start()
+            self._condition.notify_all()
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def transcribe_batch(self, audios: List, **kwargs) -> List[Tuple[list, TranscriptionInfo]]:
+        audios = [self._load(audio) for audio in audios]
+        results: List[Optional[Tuple[list, TranscriptionInfo]]] = [None] * len(audios)
+        short = [index for index, audio in enumerate(audios) if audio.size / WHISPER_SAMPLE_RATE <= MAX_BATCHED_DURATION]
+        for start in range(0, len(short), self.max_batch):
+            indices = short[start:start + self.max_batch]
+            for index, result in zip(indices, self._decode([audios[index] for index in indices], kwargs)):
+                results[index] = result
+        for index, result in enumerate(results):
+            if result is None:
+                results[index] = self.engine.transcribe(audios[index], **kwargs)
+        return results
+
+    def report(self) -> str:
+        stats = self.stats
+        return (f"{self.engine.report()}\n  batched: {stats.utterances} utterances in {stats.batches} batches "
+                f"({stats.average_batch:.1f} average), {stats.fallbacks} decoded again, {stats.escalations} escalated")
+
+    def _collect(self) -> None:
+        while True:
+            with self._condition:
+                if not self._condition.wait_for(lambda: self._pending, timeout=5):
+                    self._collector = None
+                    return  # Idle, a new thread starts with the next utterance
+                deadline = time.monotonic() + self.max_wait
+                while len(self._pending) < self.max_batch and time.monotonic() < deadline:
+                    self._condition.wait(deadline - time.monotonic())
+                batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+
+            # Only utterances with the same options share a prompt, and so a batch
+            groups: Dict[str, List[_Pending]] = {}
+            for pending in batch:
+                groups.setdefault(repr(sorted(pending.kwargs.items())), []).append(pending)
+            for group in groups.values():
+                try:
+                    results = self._decode([pending.audio for pending in group], group[0].kwargs)
+                except Exception as e:
+                    debug_print(f"Batched transcription failed: {e}")
+                    results = [e] * len(group)
+                for pending, result in zip(group, results):
+                    if isinstance(result, Exception):
+                        pending.error = result
+                    else:
+                        pending.result = result
+                    pending.done.set()
+
+    def _decode(self, audios: List[np.ndarray], kwargs: dict) -> List[Tuple[list, TranscriptionInfo]]:
+        import ctranslate2
+        from faster_whisper.audio import pad_or_trim
+        from faster_whisper.tokenizer import Tokenizer
+
+        model = self.engine.loaders[0].get()
+        settings = self.engine.settings
+        language = kwargs.get('language', settings.language)
+        beam_size = kwargs.get('beam_size', settings.beam_size)
+        previous_text = kwargs.get('initial_prompt') or kwargs.get('hotwords')
+
+        started = time.perf_counter()
+        with self._decode_lock:
+            # Shorter utterances are padded with silence to the same 30 s window of mel frames
+            features = np.stack([pad_or_trim(model.feature_extractor(audio)) for audio in audios]).astype(np.float32)
+            encoded = model.model.encode(ctranslate2.StorageView.from_array(features), to_cpu=False)
+            if language is None and model.model.is_multilingual:
+                detected = [candidates[0] for candidates in model.model.detect_language(encoded)]
+                languages = [token[2:-2] for token, _ in detected]
+                probabilities = [probability for _, probability in detected]
+            else:
+                languages = [language or 'en'] * len(audios)
+                probabilities = [1.0] * len(audios)
+
+            tokenizers, prompts = [], []
+            for item_language in languages:
+                tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task='transcribe',
+                                      language=item_language)
+                prompt = []
+                if previous_text:
+                    # Same place as WhisperModel.get_prompt puts the initial prompt
+                    prompt = [tokenizer.sot_prev] + tokenizer.encode(" " + previous_text.strip())[-223:]
+                # Without no_timestamps the model emits segment timestamps, as in faster-whisper's default
+                prompts.append(prompt + list(tokenizer.sot_sequence))
+                tokenizers.append(tokenizer)
+
+            outputs = model.model.generate(encoded, prompts, beam_size=beam_size, return_scores=True,
+                                           return_no_speech_prob=True, max_length=448, suppress_blank=True,
+                                           suppress_tokens=[-1])
+        decode_time = time.perf_counter() - started
+
+        results = []
+        escalations = fallbacks = 0
+        for audio, tokenizer, item_language, probability, output in zip(audios, tokenizers, languages, probabilities, outputs):
+            tokens = output.sequences_ids[0]
+            # CTranslate2 scores are length-normalized, faster-whisper reports per token including the end token
+            avg_logprob = output.scores[0] * len(tokens) / (len(tokens) + 1)
+            duration = audio.size / WHISPER_SAMPLE_RATE
+            info = TranscriptionInfo(item_language, probability, duration)
+            text = tokenizer.decode([token for token in tokens if token < tokenizer.eot])
+
+            if output.no_speech_prob > NO_SPEECH_THRESHOLD and avg_logprob < LOG_PROB_THRESHOLD:
+                segments = []  # Silence, faster-whisper drops the window too
+            elif compression_ratio(text) > COMPRESSION_RATIO_THRESHOLD or avg_logprob < LOG_PROB_THRESHOLD:
+                fallbacks += 1
+                results.append(self.engine.transcribe(audio, **kwargs))
+                continue
+            else:
+                segments = self._segments(tokens, tokenizer, duration, avg_logprob, output.no_speech_prob)
+            confident = len(self.engine.loaders) == 1 or self.engine.is_confident(segments)
+            with self.engine._lock:
+                # Keeps the tier report comparable with unbatched transcription
+                stats = self.engine.stats[self.engine.settings.tiers[0]]
+                stats.calls += 1
+                stats.total_latency += decode_time / len(audios)
+                if confident:
+                    stats.accepted += 1
+                    self.engine.transcriptions += 1
+            if not confident:
+                escalations += 1
+                segments, info = self.engine.transcribe(audio, first_tier=1, **kwargs)
+            results.append((segments, info))
+
+        self.stats.batches += 1
+        self.stats.utterances += len(audios)
+        self.stats.escalations += escalations
+        self.stats.fallbacks += fallbacks
+        self.stats.decode_time += decode_time
+        debug_print(f"Decoded a batch of {len(audios)} in {decode_time:.2f}s "
+                    f"({fallbacks} decoded again, {escalations} escalated)")
+        return results
+
+    @staticmethod
+    def _segments(tokens: List[int], tokenizer, duration: float, avg_logprob: float,
+                  no_speech_prob: float) -> List[Segment]:
+        """Split `<|start|> text <|end|>` runs into segments, as faster-whisper does for one window."""
+        segments = []
+        text_tokens: List[int] = []
+        start = 0.0
+        for token in tokens:
+            if token >= tokenizer.timestamp_begin:
+                time_point = min((token - tokenizer.timestamp_begin) * TIMESTAMP_RESOLUTION, duration)
+                if text_tokens:
+                    segments.append(Segment(start, time_point, tokenizer.decode(text_tokens), avg_logprob, no_speech_prob))
+                    text_tokens = []
+                start = time_point
+            elif token < tokenizer.eot:
+                text_tokens.append(token)
+        if text_tokens:
+            # The window ended inside a segment
+            segments.append(Segment(start, duration, tokenizer.decode(text_tokens), avg_logprob, no_speech_prob))
+        return segments
+
+    @staticmethod
+    def _load(audio) -> np.ndarray:
+        if isinstance(audio, str):
+            from faster_whisper import decode_audio
+            return decode_audio(audio)
+        return np.asarray(audio, dtype=np.float32).reshape(-1)
+
+
+def benchmark(fixtures_dir: Path, batch_sizes: Iterable[int] = (1, 2, 4, 8, 16),
+              utterances: int = 32) -> Dict[int, Dict[str, float]]:
+    """
+    Throughput and latency of batched decoding on the configured device (STT_DEVICE, cpu by default).
+
+    The `<name>.wav` recordings in `fixtures_dir` are repeated to `utterances` utterances and
+    decoded in batches of each size. Every utterance of a batch waits for the whole batch, so
+    its latency is the batch's decode time; the p95 is taken over all utterances.
+    """
+    from faster_whisper import decode_audio
+
+    recordings = [decode_audio(str(path)) for path in sorted(Path(fixtures_dir).glob('*.wav'))]
+    if not recordings:
+        raise ValueError(f"No .wav fixtures in {fixtures_dir}.")
+    audios = [recordings[index % len(recordings)] for index in range(utterances)]
+
+    # One tier only, escalation would measure the second model instead of the batching
+    engine = TieredSTTEngine()
+    engine.loaders = engine.loaders[:1]
+    engine.loaders[0].get()
+
+    results = {}
+    for batch_size in batch_sizes:
+        batched = BatchedSTTEngine(engine, max_batch=batch_size)
+        batched._decode(audios[:batch_size], {})  # warm-up, the first batch of a size allocates its buffers
+        latencies = []
+        started = time.perf_counter()
+        for start in range(0, len(audios), batch_size):
+            batch_started = time.perf_counter()
+            batch = audios[start:start + batch_size]
+            batched._decode(batch, {})
+            latencies += [time.perf_counter() - batch_started] * len(batch)
+        total = time.perf_counter() - started
+        latencies.sort()
+        results[batch_size] = {
+            "utterances_per_second": len(audios) / total,
+            "p95_latency": latencies[max(int(len(latencies) * 0.95) - 1, 0)],
+        }
+    return results
+
+
+if __name__ == "__main__":
+    # python -m XCHATBOT.stt_batch path/to/fixtures [1,2,4,8,16]
+    sizes = [int(size) for size in sys.argv[2].split(',')] if len(sys.argv) > 2 else [1, 2, 4, 8, 16]
+    for size, result in benchmark(Path(sys.argv[1]), sizes).items():
+        print(f"batch {size:>2}: {result['utterances_per_second']:.2f} utterances/s, "
+              f"p95 latency {result['p95_latency']:.2f}s")
@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from UTILS.printer import debug_print
+from UTILS.startup import LazyLoader
+
+
+class STTSettings(BaseModel):
+    # Tried in order, the next one only runs when the previous transcript is not confident enough
+    tiers: List[str] = Field(default_factory=lambda: [size.strip() for size in os.getenv('STT_TIERS', 'base,large-v3').split(',')
+                                                      if size.strip()])
+    device: str = os.getenv('STT_DEVICE', 'cpu')
+    compute_type: str = os.getenv('STT_COMPUTE_TYPE', 'int8')
+    beam_size: int = int(os.getenv('STT_BEAM_SIZE', '5'))
+    language: Optional[str] = os.getenv('STT_LANGUAGE') or None  # None detects the language on every call
+    cpu_threads: int = int(os.getenv('STT_CPU_THREADS', '0'))  # 0 lets CTranslate2 decide
+    min_avg_logprob: float = float(os.getenv('STT_MIN_AVG_LOGPROB', '-0.7'))
+    max_no_speech_prob: float = float(os.getenv('STT_MAX_NO_SPEECH_PROB', '0.6'))
+
+
+class TierStats(BaseModel):
+    calls: int = 0
+    accepted: int = 0
+    total_latency: float = 0.0
+
+    @property
+    def average_latency(self) -> float:
+        return self.total_latency / self.calls if self.calls else 0.0
+
+
+class TieredSTTEngine:
+    """
+    Runs a small Whisper model first and only escalates to the next tier when its transcript
+    looks unreliable, i.e. the duration-weighted `avg_logprob` of the segments is below
+    `min_avg_logprob` or a segment with text is likely not speech at all.
+
+    `transcribe` has the same signature as `WhisperModel.transcribe`, so the engine can be used
+    wherever a model is expected. Models are loaded on first use, the larger tiers only on the
+    first escalation, so they stay out of memory while the small model is confident.
+    """
+
+    def __init__(self, settings: Optional[STTSettings] = None):
+        self.settings = settings or STTSettings()
+        if not self.settings.tiers:
+            raise ValueError("STT_TIERS needs at least one Whisper model, e.g. 'base,large-v3'.")
+        self.loaders = [LazyLoader(f"Whisper {size}", lambda size=size: self._load_model(size))
+                        for size in self.settings.tiers]
+        self.stats: Dict[str, TierStats] = {size: TierStats() for size in self.settings.tiers}
+        self.transcriptions = 0
+        self.escalations = 0
+        self._lock = threading.Lock()
+
+    @property
+    def escalation_rate(self) -> float:
+        return self.escalations / self.transcriptions if self.transcriptions else 0.0
+
+    def warm_up(self) -> Dict[str, threading.Thread]:
+        """Load the first tier in the background, it is needed for every utterance."""
+        return {self.loaders[0].name: self.loaders[0].warm_up()}
+
+    def transcribe(self, audio, first_tier: int = 0, **kwargs) -> Tuple[list, object]:
+        """`first_tier` skips the smaller models, e.g. when a batched decode already ran the first one."""
+        if isinstance(audio, str):
+            # Decode once instead of once per tier
+            from faster_whisper import decode_audio
+            audio = decode_audio(audio)
+
+        options = {'beam_size': self.settings.beam_size, 'language': self.settings.language}
+        options.update(kwargs)
+
+        escalated = first_tier > 0
+        for tier, (size, loader) in enumerate(zip(self.settings.tiers, self.loaders)):
+            if tier < first_tier:
+                continue
+            started = time.perf_counter()
+            segments, info = loader.get().transcribe(audio, **options)
+            segments = list(segments)
+            latency = time.perf_counter() - started
+
+            last_tier = tier == len(self.loaders) - 1
+            confident = self.is_confident(segments)
+            with self._lock:
+                stats = self.stats[size]
+                stats.calls += 1
+                stats.total_latency += latency
+                if confident or last_tier:
+                    stats.accepted += 1
+                    self.transcriptions += 1
+                    self.escalations += escalated
+            debug_print(f"Whisper {size} transcribed in {latency:.2f}s ({'confident' if confident else 'low confidence'})")
+
+            if confident or last_tier:
+                return segments, info
+            escalated = True
+
+    def is_confident(self, segments: list) -> bool:
+        spoken = [segment for segment in segments if segment.text.strip()]
+        if not spoken:
+            return True  # Nothing was said, a bigger model will not find more
+
+        if any(segment.no_speech_prob > self.settings.max_no_speech_prob for segment in spoken):
+            return False
+        durations = np.array([max(segment.end - segment.start, 0.01) for segment in spoken])
+        logprobs = np.array([segment.avg_logprob for segment in spoken])
+        return float(np.average(logprobs, weights=durations)) >= self.settings.min_avg_logprob
+
+    def report(self) -> str:
+        lines = [f"STT escalation rate: {self.escalation_rate:.0%} of {self.transcriptions} transcriptions"]
+        for size, stats in self.stats.items():
+            lines.append(f"  {size:>10}: {stats.calls} calls, {stats.accepted} accepted, "
+                         f"{stats.average_latency * 1000:.0f} ms average")
+        return "\n".join(lines)
+
+    def _load_model(self, size: str):
+        # faster_whisper pulls in ctranslate2, so it is only imported when a model is actually loaded
+        from faster_whisper import WhisperModel
+        return WhisperModel(size, device=self.settings.device, compute_type=self.settings.compute_type,
+                            cpu_threads=self.settings.cpu_threads)
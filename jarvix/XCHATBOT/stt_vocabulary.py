@@ -0,0 +1,150 @@
+import re
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+# Phrases every Jarvix command is built from, always part of the vocabulary
+JARVIX_COMMANDS = [
+    "Hey Jarvix", "Jarvix", "turn on", "turn off", "switch on", "switch off", "toggle",
+    "all the lights", "every switch", "lights", "plug", "lamp",
+]
+
+
+class STTVocabulary:
+    """
+    Words Whisper should expect to hear: the Jarvix command phrases plus the friendly names of
+    the Home Assistant entities, passed to `transcribe` as `initial_prompt` and/or `hotwords`
+    once there are entities.
+
+    `update_entities` only rebuilds the prompt when names were actually added or removed, so
+    it can be called on every entity index change. New names are appended and removed names
+    dropped in place, which keeps the prompt stable between updates.
+    """
+
+    def __init__(self, commands: Iterable[str] = JARVIX_COMMANDS, max_prompt_chars: int = 600,
+                 mode: str = 'prompt'):
+        self.commands = list(commands)
+        self.max_prompt_chars = max_prompt_chars  # Whisper only keeps the last ~224 prompt tokens
+        self.mode = mode  # 'prompt', 'hotwords' or 'both'
+        self._names: Dict[str, str] = {}  # normalized -> friendly name, in insertion order
+        self._lock = threading.Lock()
+        self._initial_prompt = ''
+        self._hotwords = ''
+        self._rebuild()
+
+    @property
+    def initial_prompt(self) -> str:
+        return self._initial_prompt
+
+    @property
+    def hotwords(self) -> str:
+        return self._hotwords
+
+    def update_entities(self, names: Iterable[str]) -> bool:
+        """Sync the entity names, returns True when the vocabulary changed."""
+        incoming = {self._normalize(name): name for name in names if name and self._normalize(name)}
+        with self._lock:
+            removed = self._names.keys() - incoming.keys()
+            added = [key for key in incoming if key not in self._names]
+            if not removed and not added:
+                return False
+            for key in removed:
+                del self._names[key]
+            for key in added:
+                self._names[key] = incoming[key]
+            self._rebuild()
+        return True
+
+    def transcribe_kwargs(self) -> dict:
+        if not self._names:
+            # The command phrases alone would bias every utterance, chit-chat included, towards a command
+            return {}
+        kwargs = {}
+        if self.mode in ('prompt', 'both'):
+            kwargs['initial_prompt'] = self._initial_prompt
+        if self.mode in ('hotwords', 'both'):
+            kwargs['hotwords'] = self._hotwords
+        return kwargs
+
+    def _rebuild(self) -> None:
+        terms = self._fit(self.commands + list(self._names.values()))
+        commands = [term for term in terms if term in self.commands]
+        devices = [term for term in terms if term not in self.commands]
+        prompt = f"Jarvix commands: {', '.join(commands)}."
+        if devices:
+            prompt += f" Devices: {', '.join(devices)}."
+        self._initial_prompt = prompt
+        self._hotwords = ' '.join(terms)
+
+    def _fit(self, terms: List[str]) -> List[str]:
+        fitted, size = [], 0
+        for term in terms:
+            size += len(term) + 2
+            if size > self.max_prompt_chars:
+                break
+            fitted.append(term)
+        return fitted
+
+    @staticmethod
+    def _normalize(name: str) -> str:
+        return ' '.join(re.findall(r"[a-z0-9]+", name.lower()))
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """Word-level edit distance divided by the number of reference words, ignoring case and punctuation."""
+    ref = re.findall(r"[a-z0-9']+", reference.lower())
+    hyp = re.findall(r"[a-z0-9']+", hypothesis.lower())
+    if not ref:
+        return float(bool(hyp))
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def benchmark(fixtures_dir: Path, engine=None) -> Dict[str, Dict[str, float]]:
+    """
+    Command-level WER with and without the vocabulary.
+
+    `fixtures_dir` holds `<name>.wav` recordings of spoken commands with the reference text in
+    `<name>.txt`, and an `entities.txt` with one friendly name per line.
+    """
+    from faster_whisper import decode_audio
+    from XCHATBOT.stt_engine import TieredSTTEngine
+
+    engine = engine or TieredSTTEngine()
+    fixtures_dir = Path(fixtures_dir)
+    vocabulary = STTVocabulary()
+    entities_path = fixtures_dir / 'entities.txt'
+    if entities_path.exists():
+        vocabulary.update_entities(entities_path.read_text().splitlines())
+
+    runs: Dict[str, Optional[dict]] = {"baseline": None, "vocabulary": vocabulary.transcribe_kwargs()}
+    results = {}
+    for label, kwargs in runs.items():
+        errors, exact, count = 0.0, 0, 0
+        for wav_path in sorted(fixtures_dir.glob('*.wav')):
+            reference_path = wav_path.with_suffix('.txt')
+            if not reference_path.exists():
+                continue
+            segments, _ = engine.transcribe(decode_audio(str(wav_path)), **(kwargs or {}))
+            error = word_error_rate(reference_path.read_text(), ''.join(segment.text for segment in segments))
+            errors += error
+            exact += error == 0
+            count += 1
+        results[label] = {
+            "commands": count,
+            "wer": errors / count if count else 0.0,
+            "exact_match_rate": exact / count if count else 0.0,
+        }
+    return results
+
+
+if __name__ == "__main__":
+    # python -m XCHATBOT.stt_vocabulary path/to/fixtures
+    for label, result in benchmark(Path(sys.argv[1])).items():
+        print(label, result)
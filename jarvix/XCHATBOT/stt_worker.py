@@ -0,0 +1,297 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from UTILS.printer import debug_print
+
+# What the workers send back instead of faster-whisper's objects, so the parent never imports it
+Segment = namedtuple('Segment', ['start', 'end', 'text', 'avg_logprob', 'no_speech_prob'])
+TranscriptionInfo = namedtuple('TranscriptionInfo', ['language', 'language_probability', 'duration'])
+
+
+def parse_cpus(value: str) -> List[Set[int]]:
+    """
+    STT_WORKER_CPUS as one CPU set per worker: "2,3" pins every worker to CPUs 2 and 3,
+    "2,3;4,5" pins the first worker to 2-3 and the second to 4-5. Empty leaves scheduling to the OS.
+    """
+    return [{int(cpu) for cpu in group.split(',') if cpu.strip()} for group in value.split(';') if group.strip()]
+
+
+def _serve(connection, cpus: Optional[Set[int]]) -> None:
+    """Worker process: load the tiered Whisper engine, then answer requests until told to stop."""
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError as e:
+            debug_print(f"Cannot pin the STT worker to CPUs {sorted(cpus)}: {e}")
+    from XCHATBOT.stt_engine import TieredSTTEngine
+    engine = TieredSTTEngine()
+    engine.loaders[0].get()  # The larger tiers load on their first escalation
+    connection.send(('ready', os.getpid()))
+
+    block: Optional[shared_memory.SharedMemory] = None
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break  # The parent is gone
+        kind = message[0]
+        if kind == 'stop':
+            break
+        if kind == 'ping':
+            connection.send(('pong',))
+            continue
+        try:
+            _, source, samples, kwargs = message
+            if kind == 'transcribe_file':
+                audio = source
+            else:
+                if block is None or block.name != source:
+                    if block is not None:
+                        block.close()
+                    # Spawned workers share the parent's resource tracker, so the block is not unlinked when they exit
+                    block = shared_memory.SharedMemory(name=source)
+                # Whisper reads the samples straight out of the parent's buffer
+                audio = np.ndarray((samples,), dtype=np.float32, buffer=block.buf)
+            segments, info = engine.transcribe(audio, **kwargs)
+            del audio  # the block can only be closed once no array points into it
+            result = [Segment(segment.start, segment.end, segment.text, segment.avg_logprob, segment.no_speech_prob)
+                      for segment in segments]
+            connection.send(('result', result,
+                             TranscriptionInfo(info.language, info.language_probability, info.duration),
+                             engine.report()))
+        except Exception as e:
+            connection.send(('error', f"{type(e).__name__}: {e}"))
+    if block is not None:
+        block.close()
+
+
+class STTWorker:
+    """One worker process, its pipe and the shared memory block its audio is passed through."""
+
+    def __init__(self, index: int, cpus: Optional[Set[int]] = None):
+        self.index = index
+        self.cpus = cpus
+        self.name = f"STT worker {index}"
+        self.process = None
+        self.connection = None
+        self.restarts = 0
+        self.pooled = False  # waiting in the pool's idle queue or serving a request
+        self.busy = threading.Lock()
+        self._block: Optional[shared_memory.SharedMemory] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def start(self, context, load_timeout: float) -> None:
+        parent, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child, self.cpus), name=self.name, daemon=True)
+        self.process.start()
+        child.close()
+        self.connection = parent
+        # Loading the models can take a while the first time they are downloaded
+        if not parent.poll(load_timeout):
+            self.kill()
+            raise RuntimeError(f"{self.name} did not load its models within {load_timeout:.0f}s.")
+        try:
+            message = parent.recv()
+        except EOFError:
+            self.process.join()
+            raise RuntimeError(f"{self.name} exited with code {self.process.exitcode} while loading its models.")
+        debug_print(f"{self.name} ready (pid {message[1]}{f', CPUs {sorted(self.cpus)}' if self.cpus else ''})")
+
+    def stop(self) -> None:
+        if self.alive:
+            try:
+                self.connection.send(('stop',))
+            except (BrokenPipeError, OSError):
+                pass
+            self.process.join(timeout=2)
+        self.kill()
+        if self._block is not None:
+            self._block.close()
+            self._block.unlink()
+            self._block = None
+
+    def kill(self) -> None:
+        if self.process is not None and self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def ping(self, timeout: float) -> bool:
+        try:
+            self.connection.send(('ping',))
+            return self.connection.poll(timeout) and self.connection.recv()[0] == 'pong'
+        except (EOFError, BrokenPipeError, OSError):
+            return False
+
+    def request(self, audio, kwargs: dict, timeout: float) -> tuple:
+        if isinstance(audio, str):
+            self.connection.send(('transcribe_file', audio, None, kwargs))
+        else:
+            audio = np.ascontiguousarray(audio, dtype=np.float32).reshape(-1)
+            block = self._buffer(audio.size)
+            np.ndarray(audio.shape, dtype=np.float32, buffer=block.buf)[:] = audio
+            self.connection.send(('transcribe', block.name, audio.size, kwargs))
+
+        # Polling in short steps notices a worker that died mid-request
+        deadline = time.monotonic() + timeout
+        while not self.connection.poll(0.1):
+            if not self.alive:
+                raise EOFError(f"{self.name} exited with code {self.process.exitcode}.")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{self.name} did not answer within {timeout:.0f}s.")
+        try:
+            return self.connection.recv()
+        except EOFError:
+            raise EOFError(f"{self.name} closed its pipe mid-request.")
+
+    def _buffer(self, samples: int) -> shared_memory.SharedMemory:
+        """The shared block, grown to at least `samples` float32 samples. Reused across requests."""
+        size = samples * 4
+        if self._block is None or self._block.size < size:
+            if self._block is not None:
+                self._block.close()
+                self._block.unlink()
+            # Room for 30 s at 16 kHz up front, most utterances never need a bigger block
+            self._block = shared_memory.SharedMemory(create=True, size=max(size, 30 * 16000 * 4))
+        return self._block
+
+
+class STTWorkerPool:
+    """
+    Serves transcriptions from dedicated worker processes, so Whisper never holds the GIL of
+    the process running the audio callbacks, wake word detection and playback.
+
+    Audio is written into a shared memory block per worker and read by Whisper in place; only
+    the file path, sample count and options cross the pipe. Workers can be pinned to CPUs
+    (STT_WORKER_CPUS) away from the audio threads. A background health check pings idle
+    workers every `health_interval` seconds, and a worker that crashed, hung or stopped
+    answering is restarted; the request it was serving is retried once on the new process.
+
+    `transcribe` and `report` match TieredSTTEngine, which each worker runs with the usual
+    STT_* settings.
+    """
+
+    def __init__(self, workers: int = int(os.getenv('STT_WORKERS', '1')),
+                 cpus: List[Set[int]] = parse_cpus(os.getenv('STT_WORKER_CPUS', '')),
+                 request_timeout: float = float(os.getenv('STT_WORKER_TIMEOUT', '60')),
+                 load_timeout: float = 600, health_interval: float = 10):
+        self.request_timeout = request_timeout
+        self.load_timeout = load_timeout
+        self.health_interval = health_interval
+        self.workers = [STTWorker(index, cpus[index % len(cpus)] if cpus else None) for index in range(max(workers, 1))]
+        # Spawned, not forked, so the workers do not inherit the PortAudio streams and their threads
+        self._context = multiprocessing.get_context('spawn')
+        self._idle: "queue.Queue[STTWorker]" = queue.Queue()
+        self._last_report = "STT workers have not transcribed anything yet"
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    @property
+    def restarts(self) -> int:
+        return sum(worker.restarts for worker in self.workers)
+
+    def warm_up(self) -> Dict[str, threading.Thread]:
+        """Start the workers in the background, each loads its Whisper models before taking requests."""
+        threads = {}
+        with self._start_lock:
+            if self._started:
+                return threads
+            self._started = True
+            for worker in self.workers:
+                thread = threading.Thread(target=self._start_worker, args=(worker,), name=worker.name, daemon=True)
+                thread.start()
+                threads[worker.name] = thread
+        threading.Thread(target=self._health_loop, name="STT health check", daemon=True).start()
+        return threads
+
+    def transcribe(self, audio, **kwargs) -> Tuple[list, TranscriptionInfo]:
+        self.warm_up()
+        try:
+            worker = self._idle.get(timeout=self.load_timeout)
+        except queue.Empty:
+            raise RuntimeError("No STT worker is available.")
+        try:
+            with worker.busy:
+                return self._request(worker, audio, kwargs)
+        finally:
+            if worker.alive:
+                self._idle.put(worker)
+            else:
+                worker.pooled = False  # The health check restarts it and puts it back
+
+    def report(self) -> str:
+        return f"{self._last_report}\n  {len(self.workers)} worker process(es), {self.restarts} restart(s)"
+
+    def health_check(self, timeout: float = 2.0) -> None:
+        """Ping every idle worker and restart the ones that are dead or do not answer."""
+        for worker in self.workers:
+            if not worker.busy.acquire(blocking=False):
+                continue  # Loading its models or serving a request, which has its own timeout
+            try:
+                if (worker.alive and worker.ping(timeout)) or self._stopped.is_set():
+                    continue
+                debug_print(f"{worker.name} failed its health check, restarting it")
+                try:
+                    self._restart(worker)
+                except Exception as e:
+                    debug_print(f"Restarting {worker.name} failed: {e}")
+                    continue
+            finally:
+                worker.busy.release()
+            if not worker.pooled:
+                worker.pooled = True
+                self._idle.put(worker)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        for worker in self.workers:
+            worker.stop()
+
+    def _request(self, worker: STTWorker, audio, kwargs: dict) -> Tuple[list, TranscriptionInfo]:
+        for attempt in range(2):
+            try:
+                reply = worker.request(audio, kwargs, self.request_timeout)
+            except (EOFError, TimeoutError, OSError) as e:
+                debug_print(f"{e} Restarting it.")
+                self._restart(worker)
+                if attempt:
+                    raise RuntimeError(f"Transcription failed twice on {worker.name}.") from e
+                continue
+            if reply[0] == 'error':
+                raise RuntimeError(f"{worker.name} failed to transcribe: {reply[1]}")
+            _, segments, info, self._last_report = reply
+            return segments, info
+
+    def _start_worker(self, worker: STTWorker) -> None:
+        with worker.busy:
+            try:
+                worker.start(self._context, self.load_timeout)
+            except Exception as e:
+                debug_print(f"Starting {worker.name} failed: {e}")
+                return
+        worker.pooled = True
+        self._idle.put(worker)
+
+    def _restart(self, worker: STTWorker) -> None:
+        """Replace the worker's process, the caller holds `worker.busy`."""
+        worker.kill()
+        worker.restarts += 1
+        worker.start(self._context, self.load_timeout)
+
+    def _health_loop(self) -> None:
+        while not self._stopped.wait(self.health_interval):
+            self.health_check()
@@ -1,6 +1,15 @@
+import os
+import queue
+import threading
+import time
+
 from pydantic import BaseModel, Field
-import pyttsx3
-from typing import Optional
+import numpy as np
+from typing import Optional, Iterable, Iterator, Tuple
+
+from UTILS.printer import debug_print
+from XCHATBOT.audio_player import AudioPlayer, PlaybackHandle
+from XCHATBOT.tts_engines import TTSEngine, create_tts_engine
 
 """
     Usage:
@@ -14,34 +23,172 @@ class TTSSettings(BaseModel):
     voice_id: Optional[str] = None
 
 
+class SynthesisTiming(BaseModel):
+    first_chunk: float = 0.0  # seconds until the first audio was available
+    total: float = 0.0
+    audio_duration: float = 0.0
+
+    @property
+    def real_time_factor(self) -> float:
+        return self.total / self.audio_duration if self.audio_duration else 0.0
+
+
 class NaturalTTS:
+    """
+    Speaks through a pluggable TTSEngine (TTS_ENGINE: pyttsx3, espeak or piper) and one
+    persistent output stream. Audio is played while it is still being synthesized.
+    """
     _instance = None
-    _engine = None
+    engine: TTSEngine = None
+    player: AudioPlayer = None
+    # Optional XCHATBOT.tts_cache.TTSCache, rendered utterances are then played from disk
+    cache = None
 
     def __new__(cls, settings: Optional[TTSSettings] = None):
         # Create singleton instance
         if cls._instance is None:
             cls._instance = super(NaturalTTS, cls).__new__(cls)
-            cls._engine = pyttsx3.init()
+            cls.engine = create_tts_engine(os.getenv('TTS_ENGINE', 'pyttsx3'))
+            cls.player = AudioPlayer()
         return cls._instance
 
     def __init__(self, settings: Optional[TTSSettings] = None):
         if settings:
             self.settings = settings
-            self._setup_engine()
         elif not hasattr(self, 'settings'):
             self.settings = TTSSettings()
-            self._setup_engine()
+        if not hasattr(self, 'last_timing'):
+            self.last_timing = SynthesisTiming()
 
-    def _setup_engine(self):
-        self._engine.setProperty('rate', self.settings.rate)
-        self._engine.setProperty('volume', self.settings.volume)
-        if self.settings.voice_id:
-            self._engine.setProperty('voice', self.settings.voice_id)
+    @property
+    def engine_name(self) -> str:
+        return self.engine.name
 
     def speak(self, text: str) -> None:
-        self._engine.say(text)
-        self._engine.runAndWait()
+        self.play(text).wait()
+
+    def play(self, text: str) -> PlaybackHandle:
+        """Start speaking `text` and return immediately with a handle that can cancel it."""
+        handle = self.player.enqueue()
+        threading.Thread(target=self.fill, args=(text, handle), daemon=True).start()
+        return handle
+
+    def synthesize(self, text: str) -> Iterator[Tuple[np.ndarray, int]]:
+        """The engine's audio chunks for `text`, timing the synthesis into `last_timing`."""
+        started = time.perf_counter()
+        timing = SynthesisTiming()
+        for chunk, sample_rate in self.engine.synthesize(text, self.settings):
+            if not timing.first_chunk:
+                timing.first_chunk = time.perf_counter() - started
+            timing.audio_duration += chunk.size / sample_rate
+            yield chunk, sample_rate
+        timing.total = time.perf_counter() - started
+        self.last_timing = timing
+        debug_print(f"{self.engine_name} synthesized {timing.audio_duration:.1f}s of audio in {timing.total:.2f}s "
+                    f"(first audio after {timing.first_chunk * 1000:.0f} ms)")
+
+    def render(self, text: str) -> Tuple[np.ndarray, int]:
+        """Synthesize `text` to float32 mono samples instead of speaking it."""
+        if self.cache is None:
+            return self._render_uncached(text)
+        return self.cache.get_or_render(self._cache_key(text), lambda: self._render_uncached(text))
+
+    def prerender(self, texts: Iterable[str]) -> int:
+        """Render phrases into the cache ahead of time, returns how many were new."""
+        rendered = 0
+        for text in texts:
+            key = self._cache_key(text)
+            if key not in self.cache:
+                self.cache.put(key, *self._render_uncached(text))
+                rendered += 1
+        return rendered
+
+    def speak_interruptible(self, text: str, monitor) -> bool:
+        """Speak while `monitor` (a BargeInMonitor) listens for the user, returns False if interrupted."""
+        return monitor.watch(self.play(text))
+
+    def fill(self, text: str, handle: PlaybackHandle) -> None:
+        """Feed `handle` from the cache, or from the engine chunk by chunk as they are synthesized."""
+        cached = self.cache.get(self._cache_key(text)) if self.cache is not None else None
+        if cached is not None:
+            handle.feed(*cached)
+            handle.close()
+            return
+
+        chunks = []
+        sample_rate = self.player.sample_rate
+        try:
+            for chunk, sample_rate in self.synthesize(text):
+                if handle.cancelled:
+                    return
+                handle.feed(chunk, sample_rate)
+                chunks.append(chunk)
+            if self.cache is not None and chunks:
+                self.cache.put(self._cache_key(text), np.concatenate(chunks), sample_rate)
+        except Exception as e:
+            debug_print(f"Speech synthesis failed: {e}")
+        finally:
+            handle.close()
+
+    def _render_uncached(self, text: str) -> Tuple[np.ndarray, int]:
+        chunks = []
+        sample_rate = self.player.sample_rate
+        for chunk, sample_rate in self.synthesize(text):
+            chunks.append(chunk)
+        audio = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+        return audio, sample_rate
+
+    def _cache_key(self, text: str) -> str:
+        return self.cache.key(text.strip(), self.settings.rate, self.settings.volume, self.settings.voice_id,
+                              self.engine_name)
+
+    def speak_stream(self, utterances: Iterable[str], monitor=None) -> str:
+        """
+        Speak utterances as soon as they are produced.
+        A consumer thread synthesizes utterance N+1 while N is still playing, and the player
+        plays them back to back. With a BargeInMonitor, an interruption stops playback and the
+        remaining utterances are dropped.
+        """
+        pending = queue.Queue()
+        spoken = []
+        handles = []
+
+        def interrupted() -> bool:
+            return monitor is not None and monitor.interrupted is not None
+
+        def consume():
+            while True:
+                utterance = pending.get()
+                if utterance is None:
+                    break
+                if interrupted():
+                    continue
+                handle = self.player.enqueue()
+                handles.append(handle)
+                if monitor is not None:
+                    monitor.track(handle)
+                self.fill(utterance, handle)
+
+        if monitor is not None:
+            monitor.start()
+        consumer = threading.Thread(target=consume, daemon=True)
+        consumer.start()
+        try:
+            for utterance in utterances:
+                if interrupted():
+                    break
+                spoken.append(utterance)
+                pending.put(utterance)
+        finally:
+            pending.put(None)
+            consumer.join()
+            for handle in handles:
+                # Waiting in short steps keeps Ctrl+C responsive
+                while not handle.done:
+                    handle.wait(timeout=0.1)
+            if monitor is not None:
+                monitor.stop()
+        return ' '.join(spoken)
 
     def list_voices(self) -> list:
-        return [voice.id for voice in self._engine.getProperty('voices')]
\ No newline at end of file
+        return self.engine.list_voices()
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Tuple
+
+import numpy as np
+import soundfile as sf
+from pydantic import BaseModel
+
+from UTILS.printer import debug_print
+
+# Fixed answers Jarvix gives word for word, rendered ahead of time
+PRERENDER_PHRASES = [
+    "Unknown function: control_home_device. You don't have Home Assistant setup.",  # ToolDispatcher without HA
+    "Sorry, something went wrong.",  # ConversationPipeline when the model fails
+]
+
+
+def device_response_phrases(friendly_names: Iterable[str]) -> list:
+    """The replies of HAClient.control_home_device for every device, to pre-render them."""
+    phrases = []
+    for name in friendly_names:
+        for action in ("turn on", "turn off", "toggle"):
+            phrases.append(f"'{name}' has been '{action}' successfully.")
+    return phrases
+
+
+class CacheStats(BaseModel):
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class TTSCache:
+    """
+    Rendered utterances stored as WAV files, keyed by the text, the voice settings and the engine.
+
+    The directory is bounded to `max_bytes`, the least recently played files are deleted first.
+    Recency survives restarts through the file modification times.
+    """
+
+    def __init__(self, directory: Path = Path(os.getenv('TTS_CACHE_DIR', Path.home() / '.cache' / 'jarvix' / 'tts')),
+                 max_bytes: int = int(float(os.getenv('TTS_CACHE_MB', '100')) * 1024 * 1024)):
+        self.directory = Path(directory).expanduser()
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # key -> file size, least recent first
+        self._size = 0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for path in sorted(self.directory.glob('*.wav'), key=lambda path: path.stat().st_mtime):
+            size = path.stat().st_size
+            self._entries[path.stem] = size
+            self._size += size
+
+    @staticmethod
+    def key(text: str, rate: int, volume: float, voice_id: Optional[str], engine: str) -> str:
+        return hashlib.sha256(f"{engine}|{voice_id}|{rate}|{volume}|{text}".encode()).hexdigest()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, int]]:
+        path = self._path(key)
+        with self._lock:
+            if key not in self._entries:
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+        try:
+            audio, sample_rate = sf.read(path, dtype='float32')
+            os.utime(path)
+        except (OSError, RuntimeError) as e:
+            debug_print(f"Dropping unreadable TTS cache entry {path.name}: {e}")
+            self._discard(key)
+            return None
+        return audio, sample_rate
+
+    def put(self, key: str, audio: np.ndarray, sample_rate: int) -> None:
+        path = self._path(key)
+        # A file of its own per write, two threads rendering the same phrase must not share one
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False) as temporary:
+            pass
+        try:
+            sf.write(temporary.name, audio, sample_rate, format='WAV')
+            os.replace(temporary.name, path)
+        except BaseException:
+            Path(temporary.name).unlink(missing_ok=True)
+            raise
+        size = path.stat().st_size
+        with self._lock:
+            self._size += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                oldest, oldest_size = self._entries.popitem(last=False)
+                self._size -= oldest_size
+                self.stats.evictions += 1
+                self._path(oldest).unlink(missing_ok=True)
+
+    def get_or_render(self, key: str, render: Callable[[], Tuple[np.ndarray, int]]) -> Tuple[np.ndarray, int]:
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        audio, sample_rate = render()
+        self.put(key, audio, sample_rate)
+        return audio, sample_rate
+
+    def report(self) -> str:
+        return (f"TTS cache: {self.stats.hit_rate:.0%} hit rate ({self.stats.hits} hits, {self.stats.misses} misses), "
+                f"{len(self._entries)} entries, {self._size / 1024 / 1024:.1f} MB")
+
+    def _discard(self, key: str) -> None:
+        with self._lock:
+            self._size -= self._entries.pop(key, 0)
+        self._path(key).unlink(missing_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.wav"
@@ -0,0 +1,185 @@
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from typing import Callable, Iterator, Optional, Tuple
+
+import numpy as np
+import soundfile as sf
+
+from UTILS.printer import debug_print
+
+try:
+    from piper.voice import PiperVoice  # optional, local neural voices
+except ImportError:
+    PiperVoice = None
+
+# Speaking rate that TTSSettings treats as normal speed, in words per minute
+NORMAL_RATE = 150
+
+
+class TTSEngine(ABC):
+    """
+    A speech synthesizer that produces audio instead of playing it.
+    `synthesize` yields (float32 mono chunk, sample rate) pairs as soon as they are available.
+    """
+
+    name: str = ''
+
+    @abstractmethod
+    def synthesize(self, text: str, settings) -> Iterator[Tuple[np.ndarray, int]]:
+        ...
+
+    def list_voices(self) -> list:
+        return []
+
+
+class Pyttsx3Engine(TTSEngine):
+    """
+    The platform voice through pyttsx3. It can only render whole utterances, via a temporary WAV.
+
+    pyttsx3 drivers (SAPI5, NSSpeechSynthesizer) only work on the thread that created them, while
+    synthesis is requested from the warm-up, pre-render and speaker threads. So the engine is
+    created on, and only used from, one thread of its own.
+    """
+
+    name = 'pyttsx3'
+
+    def __init__(self):
+        self._tasks: "queue.Queue[Tuple[Callable, Future]]" = queue.Queue()
+        ready = Future()
+        threading.Thread(target=self._serve, args=(ready,), name='pyttsx3', daemon=True).start()
+        ready.result()  # raises if pyttsx3 could not be initialized
+
+    def _serve(self, ready: Future) -> None:
+        try:
+            import pyttsx3
+            engine = pyttsx3.init()
+        except Exception as e:
+            ready.set_exception(e)
+            return
+        ready.set_result(None)
+        while True:
+            task, result = self._tasks.get()
+            try:
+                result.set_result(task(engine))
+            except Exception as e:
+                result.set_exception(e)
+
+    def _call(self, task: Callable):
+        result = Future()
+        self._tasks.put((task, result))
+        return result.result()
+
+    def synthesize(self, text: str, settings) -> Iterator[Tuple[np.ndarray, int]]:
+        handle, path = tempfile.mkstemp(suffix='.wav')
+        os.close(handle)
+
+        def render(engine):
+            engine.setProperty('rate', settings.rate)
+            engine.setProperty('volume', settings.volume)
+            if settings.voice_id:
+                engine.setProperty('voice', settings.voice_id)
+            engine.save_to_file(text, path)
+            engine.runAndWait()
+
+        try:
+            self._call(render)
+            audio, sample_rate = sf.read(path, dtype='float32', always_2d=True)
+        finally:
+            os.unlink(path)
+        yield audio[:, 0], sample_rate
+
+    def list_voices(self) -> list:
+        return self._call(lambda engine: [voice.id for voice in engine.getProperty('voices')])
+
+
+class EspeakEngine(TTSEngine):
+    """
+    eSpeak NG as a subprocess writing WAV to stdout. Fast and robotic; the audio is read while
+    it is produced, so playback starts with the first phonemes.
+    """
+
+    name = 'espeak-ng'
+
+    def __init__(self, executable: Optional[str] = None, chunk_samples: int = 1024):
+        self.executable = executable or shutil.which('espeak-ng') or shutil.which('espeak')
+        if not self.executable:
+            raise RuntimeError("espeak-ng is not installed.")
+        self.chunk_samples = chunk_samples
+
+    def synthesize(self, text: str, settings) -> Iterator[Tuple[np.ndarray, int]]:
+        command = [self.executable, '--stdout', '--stdin', '-s', str(settings.rate)]
+        if settings.voice_id:
+            command += ['-v', settings.voice_id]
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL)
+        try:
+            process.stdin.write(text.encode())
+            process.stdin.close()
+            header = process.stdout.read(44)
+            if len(header) < 44:
+                return
+            sample_rate = int.from_bytes(header[24:28], 'little')
+            leftover = b''
+            while True:
+                data = process.stdout.read1(self.chunk_samples * 2)
+                if not data:
+                    break
+                data = leftover + data
+                usable = len(data) - len(data) % 2
+                leftover = data[usable:]
+                samples = np.frombuffer(data[:usable], dtype=np.int16).astype(np.float32) / 32768.0
+                yield samples * settings.volume, sample_rate
+        finally:
+            # The generator may be closed early when playback is cancelled
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+
+    def list_voices(self) -> list:
+        output = subprocess.run([self.executable, '--voices'], capture_output=True, text=True).stdout
+        return [line.split()[1] for line in output.splitlines()[1:] if len(line.split()) > 1]
+
+
+class PiperEngine(TTSEngine):
+    """Piper neural voices (`pip install piper-tts`, PIPER_MODEL=path/to/voice.onnx). Natural but slower, streamed per sentence."""
+
+    name = 'piper'
+
+    def __init__(self, model_path: Optional[str] = None):
+        if PiperVoice is None:
+            raise RuntimeError("piper-tts is not installed.")
+        model_path = model_path or os.getenv('PIPER_MODEL')
+        if not model_path:
+            raise RuntimeError("PIPER_MODEL is not set.")
+        self.voice = PiperVoice.load(model_path)
+        self.sample_rate = self.voice.config.sample_rate
+
+    def synthesize(self, text: str, settings) -> Iterator[Tuple[np.ndarray, int]]:
+        length_scale = NORMAL_RATE / settings.rate
+        if hasattr(self.voice, 'synthesize_stream_raw'):
+            for raw in self.voice.synthesize_stream_raw(text, length_scale=length_scale):
+                yield np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768.0 * settings.volume, self.sample_rate
+        else:
+            # piper-tts >= 1.3 yields AudioChunk objects per sentence
+            from piper import SynthesisConfig
+            for chunk in self.voice.synthesize(text, syn_config=SynthesisConfig(length_scale=length_scale)):
+                yield chunk.audio_float_array.astype(np.float32) * settings.volume, chunk.sample_rate
+
+
+def create_tts_engine(kind: str = 'pyttsx3') -> TTSEngine:
+    engines = {'pyttsx3': Pyttsx3Engine, 'espeak': EspeakEngine, 'piper': PiperEngine}
+    if kind not in engines:
+        raise ValueError(f"Unknown TTS engine '{kind}'. Use one of: {', '.join(engines)}.")
+    try:
+        return engines[kind]()
+    except RuntimeError as e:
+        if kind == 'pyttsx3':
+            raise
+        debug_print(f"Cannot use the {kind} TTS engine ({e}), falling back to pyttsx3.")
+        return Pyttsx3Engine()
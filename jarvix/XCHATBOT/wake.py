@@ -1,5 +1,6 @@
 import logging
 import os
+import threading
 from pathlib import Path
 
 import pvporcupine
@@ -17,7 +18,9 @@ if os.getenv('LOGGING', 'false').lower() == 'true':
 
 
 class WakeWordDetector:
-    def __init__(self):
+    def __init__(self, capture=None):
+        # Optional XCHATBOT.audio_capture.AudioCaptureService shared with the recorder
+        self.capture = capture
         self.keyword_paths = None
         self.access_key = os.getenv('PORCUPINE_ACCESS_KEY')
         file_path = Path(__file__).parent / os.getenv('PORCUPINE_FILE_NAME')
@@ -37,6 +40,7 @@ class WakeWordDetector:
             keyword_paths=self.keyword_paths
         )
         self.wake_word_detected = False
+        self._detected = threading.Event()
 
     def audio_callback(self, indata, frames, time, status):
         if status:
@@ -48,8 +52,17 @@ class WakeWordDetector:
             self.wake_word_detected = True
             raise sd.CallbackStop
 
+    def process_frame(self, audio_frame: np.ndarray) -> None:
+        """Listener for the shared capture service, called with every int16 frame."""
+        if self.porcupine.process(audio_frame) >= 0:
+            debug_print("Wake word detected!")
+            self.wake_word_detected = True
+            self._detected.set()
+
     def listen_for_wake_word(self):
         self.wake_word_detected = False
+        if self.capture is not None:
+            return self._listen_on_shared_capture()
         try:
             with sd.InputStream(samplerate=self.porcupine.sample_rate,
                                 blocksize=self.porcupine.frame_length,
@@ -62,6 +75,19 @@ class WakeWordDetector:
             pass
         return self.wake_word_detected
 
+    def _listen_on_shared_capture(self) -> bool:
+        self._detected.clear()
+        self.capture.start()
+        self.capture.add_listener(self.process_frame)
+        print("Listening for wake word... Press Ctrl+C to exit.")
+        try:
+            # Waiting in short steps keeps Ctrl+C responsive
+            while not self._detected.wait(timeout=0.1):
+                pass
+        finally:
+            self.capture.remove_listener(self.process_frame)
+        return self.wake_word_detected
+
     def __del__(self):
         if hasattr(self, 'porcupine'):
             self.porcupine.delete()
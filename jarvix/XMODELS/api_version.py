@@ -1,18 +1,31 @@
 import json
 import os
+import threading
+import time
 from enum import Enum
+from typing import Dict, Iterator, List, Optional
 
-import openai
-from anthropic import Anthropic
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
-from XMODELS.function_definitions import function_definitions
+from UTILS.printer import debug_print
+
+from XMODELS.function_definitions import device_function_definitions
+from XMODELS.tool_dispatcher import ToolCall, ToolDispatcher
 
 CHAT_ROLE_MESSAGE = (
     "You are an AI System called Jarvix. Your job is to answer every question users ask you no matter what."
     "You also support in extracting actions and entity names from user commands for use in Home Assistant API through function calling. Use supplied tools to assist the user."
 )
 
+def _openai_client(api_key: str, base_url: Optional[str] = None, http_client=None):
+    # Provider SDKs are imported on first use so they stay out of Jarvix's startup path
+    import openai
+    return openai.Client(api_key=api_key, base_url=base_url, http_client=http_client)
+
+def _anthropic_client(api_key: str, base_url: Optional[str] = None, http_client=None):
+    from anthropic import Anthropic
+    return Anthropic(api_key=api_key, base_url=base_url, http_client=http_client)
+
 class ModelType(Enum):
     GPT = "GPT"
     CLAUDE = "CLAUDE"
@@ -22,60 +35,219 @@ class ChatType(Enum):
     CONVERSATION = "conversation"
 
 
+class RequestTimings(BaseModel):
+    connect: float = 0.0  # until TCP/TLS was set up, 0 when a pooled connection was reused
+    ttfb: float = 0.0  # until the response headers arrived
+    first_token: float = 0.0  # until the first streamed text, streaming only
+    total: float = 0.0
+    reused_connection: bool = True
+    tools: Dict[str, float] = Field(default_factory=dict)  # latency of every tool call
+
+
 class ApiClient(BaseModel):
     gpt_api_key: str = Field(..., env='OPENAI_API_KEY')
     claude_api_key: str = Field(None, env='ANTHROPIC_API_KEY')
     gpt_model_name: str = "gpt-4o-mini"
     claude_model_name: str = "claude-3-haiku-20240307"
+    selected_model: Optional[ModelType] = None  # Read from SELECTED_MODEL once when not given
+    gpt_base_url: Optional[str] = os.getenv('OPENAI_BASE_URL')  # e.g. a local OpenAI-compatible mock server
+    claude_base_url: Optional[str] = os.getenv('ANTHROPIC_BASE_URL')
+    request_timeout: float = 30
     function_registry: dict = Field(default_factory=dict)
+    last_timings: Optional[RequestTimings] = None
+    last_tool_names: List[str] = Field(default_factory=list)
+
+    _client: Optional[object] = PrivateAttr(default=None)
+    _http_client: Optional[object] = PrivateAttr(default=None)
+    _client_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _request_started_at: float = PrivateAttr(default=0.0)
+    _tool_dispatcher: Optional[ToolDispatcher] = PrivateAttr(default=None)
 
     class Config:
         protected_namespaces = ()
         arbitrary_types_allowed = True
 
+    @property
+    def model_type(self) -> ModelType:
+        if self.selected_model is None:
+            self.selected_model = ModelType(os.getenv('SELECTED_MODEL'))
+        return self.selected_model
+
+    @property
+    def client(self):
+        """The provider SDK client, created once on top of a pooled keep-alive HTTP client."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    @property
+    def tool_dispatcher(self) -> ToolDispatcher:
+        if self._tool_dispatcher is None:
+            self._tool_dispatcher = ToolDispatcher(self.function_registry)
+        self._tool_dispatcher.function_registry = self.function_registry
+        return self._tool_dispatcher
+
+    def for_conversation(self) -> "ApiClient":
+        """A client for another conversation, e.g. another room: same provider connection, its own request state."""
+        client = self.model_copy(update={'last_timings': None, 'last_tool_names': []})
+        # The SDK client is thread-safe and keeps the connection pool, the dispatcher records each request's results
+        client._client, client._http_client = self.client, self._http_client
+        client._tool_dispatcher = None
+        return client
+
+    def warm_up(self) -> None:
+        """Open the connection to the provider (DNS, TCP, TLS) before the first request needs it."""
+        client = self.client
+        started = time.perf_counter()
+        # The status does not matter, only the connection left in the pool
+        self._http_client.head(str(client.base_url))
+        debug_print(f"{self.model_type.value} connection ready in {time.perf_counter() - started:.2f}s")
+
     def process_text(self, text: str) -> str:
-        selected_model = ModelType(os.getenv('SELECTED_MODEL'))
-
-        if selected_model == ModelType.GPT:
-            client = openai.Client(api_key=self.gpt_api_key)
-            completion = client.chat.completions.create(
-                model=self.gpt_model_name,
-                messages=[
-                    {"role": "system", "content": CHAT_ROLE_MESSAGE},
-                    {"role": "user", "content": text}
-                ],
-                tools=function_definitions
-            )
-
-            # Check if GPT suggests a function call
-            choice = completion.choices[0]
-            if choice.finish_reason == 'tool_calls':
-                tool_call_function = choice.message.tool_calls[0].function
-                function_name = tool_call_function.name
-                function_args = json.loads(tool_call_function.arguments)
-
-                # Check if function is registered
-                if function_name in self.function_registry:
-                    function_to_call = self.function_registry[function_name]
-                    # Call the function dynamically with arguments unpacked
-                    return function_to_call(**function_args)
+        self._begin_request()
+        try:
+            if self.model_type == ModelType.GPT:
+                completion = self.client.chat.completions.create(
+                    model=self.gpt_model_name,
+                    messages=[
+                        {"role": "system", "content": CHAT_ROLE_MESSAGE},
+                        {"role": "user", "content": text}
+                    ],
+                    # General questions are answered in this completion, only device actions go through tools
+                    tools=device_function_definitions
+                )
+
+                # Check if GPT suggests function calls, all of them run concurrently
+                choice = completion.choices[0]
+                if choice.finish_reason == 'tool_calls':
+                    calls = [ToolCall(name=tool_call.function.name, arguments=json.loads(tool_call.function.arguments or "{}"))
+                             for tool_call in choice.message.tool_calls]
+                    return ToolDispatcher.merge(list(self._run_tools(calls)))
+
                 else:
-                    return f"Unknown function: {function_name}"
+                    # Regular response without function call
+                    return choice.message.content
 
+            elif self.model_type == ModelType.CLAUDE:
+                completion = self.client.messages.create(
+                    model=self.claude_model_name,
+                    max_tokens=1000,
+                    system=CHAT_ROLE_MESSAGE,
+                    messages=[
+                        {"role": "user", "content": text}
+                    ]
+                )
+                return completion.content[0].text
             else:
-                # Regular response without function call
-                return choice.message.content
-
-        elif selected_model == ModelType.CLAUDE:
-            client = Anthropic(api_key=self.claude_api_key)
-            completion = client.messages.create(
-                model=self.claude_model_name,
-                max_tokens=1000,
-                messages=[
-                    {"role": "system", "content": CHAT_ROLE_MESSAGE},
-                    {"role": "user", "content": text}
-                ]
-            )
-            return completion.content[0].text
-        else:
-            raise ValueError("Unsupported model type. Use 'gpt' or 'claude'.")
+                raise ValueError("Unsupported model type. Use 'gpt' or 'claude'.")
+        finally:
+            self._end_request()
+
+    def stream_text(self, text: str) -> Iterator[str]:
+        """Streaming version of process_text: yields response deltas as the provider sends them."""
+        self._begin_request()
+        try:
+            if self.model_type == ModelType.GPT:
+                stream = self.client.chat.completions.create(
+                    model=self.gpt_model_name,
+                    messages=[
+                        {"role": "system", "content": CHAT_ROLE_MESSAGE},
+                        {"role": "user", "content": text}
+                    ],
+                    tools=device_function_definitions,
+                    stream=True
+                )
+
+                # Tool call names and arguments arrive in pieces, per call index, and are only usable once complete
+                function_names: Dict[int, str] = {}
+                function_arguments: Dict[int, str] = {}
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.tool_calls:
+                        for tool_call in delta.tool_calls:
+                            function_names[tool_call.index] = function_names.get(tool_call.index, "") + (tool_call.function.name or "")
+                            function_arguments[tool_call.index] = function_arguments.get(tool_call.index, "") + (tool_call.function.arguments or "")
+                    elif delta.content:
+                        self._first_token()
+                        yield delta.content
+
+                if function_names:
+                    yield from self._run_tools([ToolCall(name=function_names[index], arguments=json.loads(function_arguments[index] or "{}"))
+                                                for index in sorted(function_names)])
+
+            elif self.model_type == ModelType.CLAUDE:
+                stream = self.client.messages.create(
+                    model=self.claude_model_name,
+                    max_tokens=1000,
+                    system=CHAT_ROLE_MESSAGE,
+                    messages=[
+                        {"role": "user", "content": text}
+                    ],
+                    stream=True
+                )
+                for event in stream:
+                    if event.type == "content_block_delta" and getattr(event.delta, "text", None):
+                        self._first_token()
+                        yield event.delta.text
+            else:
+                raise ValueError("Unsupported model type. Use 'gpt' or 'claude'.")
+        finally:
+            self._end_request()
+
+    def _run_tools(self, calls: List[ToolCall]) -> Iterator[str]:
+        self.last_tool_names = [call.name for call in calls]
+        dispatcher = self.tool_dispatcher
+        yield from dispatcher.run(calls)
+        self.last_timings.tools = {result.name: result.latency for result in dispatcher.last_results}
+
+    def _create_client(self):
+        import httpx
+        self._http_client = httpx.Client(
+            timeout=self.request_timeout,
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=300),
+            event_hooks={'request': [self._attach_trace]},
+        )
+        if self.model_type == ModelType.GPT:
+            return _openai_client(self.gpt_api_key, self.gpt_base_url, self._http_client)
+        if self.model_type == ModelType.CLAUDE:
+            return _anthropic_client(self.claude_api_key, self.claude_base_url, self._http_client)
+        raise ValueError("Unsupported model type. Use 'gpt' or 'claude'.")
+
+    def _attach_trace(self, request) -> None:
+        # httpx reports connection and response milestones through the "trace" request extension
+        timings = self.last_timings
+        if timings is None:
+            return
+        started = time.perf_counter()
+
+        def trace(event_name: str, info: dict) -> None:
+            elapsed = time.perf_counter() - started
+            if event_name == 'connection.connect_tcp.started':
+                timings.reused_connection = False
+            elif event_name in ('connection.connect_tcp.complete', 'connection.start_tls.complete'):
+                timings.connect = elapsed
+            elif event_name.endswith('receive_response_headers.complete'):
+                timings.ttfb = elapsed
+
+        request.extensions['trace'] = trace
+
+    def _begin_request(self) -> None:
+        self._request_started_at = time.perf_counter()
+        self.last_timings = RequestTimings()
+        self.last_tool_names = []
+
+    def _first_token(self) -> None:
+        if not self.last_timings.first_token:
+            self.last_timings.first_token = time.perf_counter() - self._request_started_at
+
+    def _end_request(self) -> None:
+        timings = self.last_timings
+        timings.total = time.perf_counter() - self._request_started_at
+        debug_print(f"Request timings: connect {timings.connect * 1000:.0f} ms"
+                    f"{' (reused)' if timings.reused_connection else ''}, TTFB {timings.ttfb * 1000:.0f} ms, "
+                    f"first token {timings.first_token * 1000:.0f} ms, total {timings.total * 1000:.0f} ms"
+                    + ''.join(f", {name} {latency * 1000:.0f} ms" for name, latency in timings.tools.items()))
@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from UTILS.printer import debug_print
+
+Message = Dict[str, str]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough Llama token count, about four characters per token plus the per-message framing."""
+    return len(text) // 4 + 4
+
+
+class ConversationMemory:
+    """
+    Multi-turn chat history for OllamaClient, bounded by a token budget.
+
+    The system prompt and tool list come from the modelfile and the jarvix template. Its system
+    block does not depend on whether tools are sent, and the tools are only added to the last
+    user message, so every request starts with the same prefix: system prompt, then the
+    earlier turns unchanged. Ollama can then reuse its KV cache for that prefix and only
+    evaluates the new message, also when a general question is asked a second time without
+    tools through handle_general_question.
+
+    When the history grows past `max_tokens`, the oldest turns are dropped until it fits in
+    `trim_to` of the budget. Trimming in one larger step keeps the prefix stable for several
+    turns instead of changing it on every turn. With `summarize`, dropped turns are folded into
+    a short summary on a background thread and kept at the start of the history.
+    """
+
+    def __init__(self, max_tokens: int = int(os.getenv('CONVERSATION_TOKEN_BUDGET', '1500')), trim_to: float = 0.5,
+                 idle_reset: float = float(os.getenv('CONVERSATION_IDLE_RESET', '300')),
+                 summarize: Optional[Callable[[str, List[Message]], str]] = None):
+        self.max_tokens = max_tokens
+        self.trim_to = trim_to
+        self.idle_reset = idle_reset  # seconds without a turn after which a new conversation starts
+        self.summarize = summarize
+        self.summary = ''
+        self._turns: List[List[Message]] = []
+        self._last_turn_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self) -> int:
+        return sum(estimate_tokens(message['content']) for message in self.history())
+
+    def history(self) -> List[Message]:
+        with self._lock:
+            messages = []
+            if self.summary:
+                messages += [{"role": "user", "content": f"Summary of our conversation so far: {self.summary}"},
+                             {"role": "assistant", "content": "Got it."}]
+            for turn in self._turns:
+                messages += turn
+            return messages
+
+    def messages(self, text: str) -> List[Message]:
+        """The history followed by the new user message."""
+        if self._last_turn_at and time.monotonic() - self._last_turn_at > self.idle_reset:
+            self.reset()
+        return self.history() + [{"role": "user", "content": text}]
+
+    def add_turn(self, user: str, assistant: str) -> None:
+        with self._lock:
+            self._turns.append([{"role": "user", "content": user}, {"role": "assistant", "content": assistant}])
+            self._last_turn_at = time.monotonic()
+        if self.tokens > self.max_tokens:
+            self._trim()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._turns = []
+            self.summary = ''
+            self._last_turn_at = 0.0
+
+    def _trim(self) -> None:
+        target = self.max_tokens * self.trim_to
+        dropped = []
+        with self._lock:
+            # The latest turn is always kept
+            while len(self._turns) > 1 and sum(
+                    estimate_tokens(message['content']) for turn in self._turns for message in turn) > target:
+                dropped += self._turns.pop(0)
+        debug_print(f"Conversation memory trimmed {len(dropped) // 2} turn(s), {self.tokens} tokens left")
+        if self.summarize and dropped:
+            threading.Thread(target=self._fold_into_summary, args=(dropped,), daemon=True).start()
+
+    def _fold_into_summary(self, dropped: List[Message]) -> None:
+        try:
+            summary = self.summarize(self.summary, dropped)
+        except Exception as e:
+            debug_print(f"Summarizing the conversation failed: {e}")
+            return
+        with self._lock:
+            self.summary = summary.strip()
@@ -7,9 +7,12 @@ import shutil
 from enum import Enum
 from pathlib import Path
 
-from pydantic import BaseModel, Field
-from typing import List, Dict
-from XMODELS.function_definitions import function_definitions
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import List, Dict, Iterator, Optional
+from XMODELS.function_definitions import function_definitions, device_function_definitions
+from XMODELS.router import RoutingMode, Route, RequestStats, classify_request
+from XMODELS.conversation_memory import ConversationMemory
+from XMODELS.tool_dispatcher import ToolCall, ToolDispatcher
 import ollama
 from UTILS.printer import debug_print
 
@@ -29,18 +32,27 @@ class OllamaModel(Enum):
 class OllamaClient(BaseModel):
     model_name: OllamaModel = OllamaModel.JARVIX
     word_limit: int = 50
-    conversation_history: List[Dict[str, str]] = Field(default_factory=list)
-    max_tokens: int = 300
+    # Earlier turns sent with every request, see XMODELS.conversation_memory
+    memory: ConversationMemory = Field(default_factory=ConversationMemory)
+    max_tokens: int = 300  # Longest answer the model may generate
+    keep_alive: str = os.getenv('OLLAMA_KEEP_ALIVE', '30m')  # How long Ollama keeps the model loaded after a request
     function_registry: dict = Field(default_factory=dict)
+    routing_mode: RoutingMode = RoutingMode(os.getenv('ROUTING_MODE', RoutingMode.TOOLS.value))
+    last_request_stats: Optional[RequestStats] = None
     custom_model_path: str = os.path.abspath(os.path.join(os.path.dirname(__file__), 'local_models'))
     modelfile_path: str = os.path.abspath(os.path.join(os.path.dirname(__file__), 'modelfile'))
 
+    _request_started_at: float = PrivateAttr(default=0.0)
+    _tool_dispatcher: Optional[ToolDispatcher] = PrivateAttr(default=None)
+
     class Config:
         protected_namespaces = ()
         arbitrary_types_allowed = True
 
     def __init__(self, **data):
         super().__init__(**data)
+        if os.getenv('CONVERSATION_SUMMARIZE', 'false').lower() == 'true' and self.memory.summarize is None:
+            self.memory.summarize = self._summarize
         if not self._is_ollama_installed():
             debug_print("Ollama is not installed. Installing Ollama...")
             self._install_ollama()
@@ -59,6 +71,38 @@ class OllamaClient(BaseModel):
             except subprocess.CalledProcessError as e:
                 raise RuntimeError(f"Failed to download model '{self.model_name.value}': {e}")
 
+    @property
+    def last_tool_names(self) -> List[str]:
+        return self.last_request_stats.tool_names if self.last_request_stats else []
+
+    @property
+    def tool_dispatcher(self) -> ToolDispatcher:
+        if self._tool_dispatcher is None:
+            # A general question is a whole model call, device commands only an HTTP request
+            self._tool_dispatcher = ToolDispatcher(self.function_registry, timeouts={"handle_general_question": 60})
+        self._tool_dispatcher.function_registry = self.function_registry
+        return self._tool_dispatcher
+
+    def for_conversation(self) -> "OllamaClient":
+        """A client for another conversation, e.g. another room: same model and settings, its own history and state."""
+        memory = self.memory
+        client = self.model_copy(update={
+            'memory': ConversationMemory(max_tokens=memory.max_tokens, trim_to=memory.trim_to, idle_reset=memory.idle_reset),
+            'last_request_stats': None,
+        })
+        # The copy is shallow, everything bound to this client has to be rebound to the new one
+        client.function_registry = {**self.function_registry}
+        if "handle_general_question" in client.function_registry:
+            client.function_registry["handle_general_question"] = client.process_general_text
+        if memory.summarize is not None:
+            client.memory.summarize = client._summarize
+        client._tool_dispatcher = None
+        return client
+
+    def preload(self) -> None:
+        """Load the model into Ollama's memory before the first question. An empty prompt only loads it."""
+        ollama.generate(model=self.model_name.value, prompt="", keep_alive=self.keep_alive)
+
     def _build_model(self) -> None:
         if not os.path.exists(self.modelfile_path):
             raise FileNotFoundError(f"Model file '{self.modelfile_path}' not found.")
@@ -69,40 +113,140 @@ class OllamaClient(BaseModel):
             raise RuntimeError(f"Failed to create and start model: {e}")
 
     def process_text(self, text: str) -> str:
-        completion = ollama.chat(
-            model=self.model_name.value,
-            messages=[{"role": "user", "content": text}],
-            stream=False,
-            tools=function_definitions
-        )
+        self._begin_request()
+        try:
+            response = self._respond(text)
+            self.memory.add_turn(text, response)
+            return response
+        finally:
+            self._end_request()
+
+    def _respond(self, text: str) -> str:
+        if self._route(text) == Route.GENERAL:
+            return self.process_general_text(text)
+
+        completion = self._chat(text, stream=False, tools=self._routed_tools())
 
         message = completion.get('message', {})
         tool_calls = message.get('tool_calls', [])
 
         if tool_calls:
-            tool_call_function = tool_calls[0].get('function', {})
-            function_name = tool_call_function.get('name')
-            function_args = tool_call_function.get('arguments', {})
-
-            # Check if function is registered
-            if function_name and function_name in self.function_registry:
-                function_to_call = self.function_registry[function_name]
-                # Call the function dynamically with arguments unpacked
-                return function_to_call(**function_args)
-            else:
-                return f"Unknown function: {function_name}. You don't have Home Assistant setup."
+            # Every call runs, concurrently, and their answers are spoken together
+            return ToolDispatcher.merge(list(self._run_tools(tool_calls)))
 
         else:
             return completion.get('message', {}).get('content', 'No response')
 
     # Function to process general text. tobe called through ollama tool calls when needed
     def process_general_text(self, user_query: str) -> str:
-        completion = ollama.chat(
+        completion = self._chat(user_query, stream=False)
+        return completion.get('message', {}).get('content', 'No response')
+
+    def stream_text(self, text: str) -> Iterator[str]:
+        """Streaming version of process_text: yields response deltas as the model produces them."""
+        self._begin_request()
+        deltas = []
+        try:
+            for delta in self._stream_response(text):
+                deltas.append(delta)
+                yield delta
+            self.memory.add_turn(text, ''.join(deltas))
+        finally:
+            self._end_request()
+
+    def _stream_response(self, text: str) -> Iterator[str]:
+        if self._route(text) == Route.GENERAL:
+            yield from self.stream_general_text(text)
+            return
+
+        for chunk in self._chat(text, stream=True, tools=self._routed_tools()):
+            message = chunk.get('message', {})
+            tool_calls = message.get('tool_calls', [])
+
+            if tool_calls:
+                # A general question is streamed while the other calls run in the background
+                yield from self._run_tools(tool_calls, inline={"handle_general_question": self.stream_general_text})
+                return
+
+            content = message.get('content')
+            if content:
+                yield content
+
+    def stream_general_text(self, user_query: str) -> Iterator[str]:
+        for chunk in self._chat(user_query, stream=True):
+            content = chunk.get('message', {}).get('content')
+            if content:
+                yield content
+
+    def _run_tools(self, tool_calls: list, inline: Optional[dict] = None) -> Iterator[str]:
+        calls = [ToolCall(name=tool_call.get('function', {}).get('name'),
+                          arguments=tool_call.get('function', {}).get('arguments') or {})
+                 for tool_call in tool_calls]
+        self.last_request_stats.tool_names = [call.name for call in calls]
+        dispatcher = self.tool_dispatcher
+        yield from dispatcher.run(calls, inline)
+        self.last_request_stats.tool_latencies = {result.name: result.latency for result in dispatcher.last_results}
+
+    def _route(self, text: str) -> Optional[Route]:
+        """Only the classifier mode decides the route before calling the model."""
+        if self.routing_mode == RoutingMode.CLASSIFIER:
+            self.last_request_stats.route = classify_request(text)
+        return self.last_request_stats.route
+
+    def _routed_tools(self) -> list:
+        if self.routing_mode == RoutingMode.TOOLS:
+            return function_definitions
+        return device_function_definitions
+
+    def _chat(self, text: str, **kwargs):
+        if self.last_request_stats:
+            self.last_request_stats.model_calls += 1
+        response = ollama.chat(
             model=self.model_name.value,
-            messages=[{"role": "user", "content": user_query}],
-            stream=False,
+            messages=self.memory.messages(text),
+            keep_alive=self.keep_alive,
+            options={'num_predict': self.max_tokens},
+            **kwargs
         )
-        return completion.get('message', {}).get('content', 'No response')
+        if kwargs.get('stream'):
+            return self._track_stream(response)
+        self._record_usage(response)
+        return response
+
+    def _track_stream(self, chunks) -> Iterator[dict]:
+        for chunk in chunks:
+            if chunk.get('done'):
+                self._record_usage(chunk)
+            yield chunk
+
+    def _record_usage(self, response) -> None:
+        # Ollama only counts the prompt tokens it had to evaluate, a reused prefix is not included
+        stats = self.last_request_stats
+        if stats is None:
+            return
+        stats.prompt_eval_count += response.get('prompt_eval_count') or 0
+        stats.eval_count += response.get('eval_count') or 0
+        stats.prompt_eval_time += (response.get('prompt_eval_duration') or 0) / 1e9
+        stats.eval_time += (response.get('eval_duration') or 0) / 1e9
+
+    def _summarize(self, summary: str, messages: List[Dict[str, str]]) -> str:
+        transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+        prompt = (f"Earlier summary: {summary or 'none'}\n\n{transcript}\n\n"
+                  "Summarize the conversation above in at most two sentences. Keep names and facts the user may refer back to.")
+        return ollama.generate(model=self.model_name.value, prompt=prompt, keep_alive=self.keep_alive,
+                               options={'num_predict': 120})['response']
+
+    def _begin_request(self) -> None:
+        self.last_request_stats = RequestStats(routing_mode=self.routing_mode)
+        self._request_started_at = time.perf_counter()
+
+    def _end_request(self) -> None:
+        self.last_request_stats.latency = time.perf_counter() - self._request_started_at
+        stats = self.last_request_stats
+        debug_print(f"Request routed via {self.routing_mode.value}: {stats.model_calls} model call(s), "
+                    f"tools={', '.join(stats.tool_names) or None}, {stats.latency:.2f}s, prompt eval {stats.prompt_eval_count} tokens "
+                    f"({stats.prompt_eval_time:.2f}s), eval {stats.eval_count} tokens ({stats.eval_time:.2f}s), "
+                    f"history {self.memory.tokens} tokens")
 
     def _is_ollama_running(self) -> bool:
         try:
@@ -0,0 +1,276 @@
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional
+
+import numpy as np
+from pydantic import BaseModel
+
+from UTILS.printer import debug_print
+from XMODELS.router import Route, classify_request
+
+# Answers to these change over time and are never cached
+TIME_SENSITIVE = re.compile(
+    r"\b(now|today|tonight|tomorrow|yesterday|current(ly)?|latest|recent(ly)?|this (week|month|year)|"
+    r"time|date|day is it|weather|forecast|temperature|news|score|price|stock)\b"
+)
+
+# Follow-up questions only make sense with the conversation history, so their answer is not reusable
+FOLLOW_UP = re.compile(r"^(and|but|so|what about|how about)\b|\b(it|its|that|this|those|they|them|their|he|she|him|her)\b")
+
+# Tools with side effects, a response produced through them is never cached
+SIDE_EFFECT_TOOLS = {"control_home_device"}
+
+FILLER = re.compile(r"\b(hey|hi|ok|okay|jarvix|please|can you|could you|would you|tell me)\b")
+
+
+def normalize_query(text: str) -> str:
+    text = FILLER.sub(" ", text.lower().replace("what's", "what is").replace("who's", "who is"))
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+def numbers(normalized: str) -> List[str]:
+    return re.findall(r"\d+", normalized)
+
+
+def ollama_embedding(model: str) -> Callable[[str], List[float]]:
+    """Embeddings from a local Ollama embedding model, e.g. nomic-embed-text."""
+    import ollama
+
+    def embed(text: str) -> List[float]:
+        vector = np.asarray(ollama.embeddings(model=model, prompt=text)['embedding'], dtype=np.float32)
+        return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+    return embed
+
+
+class CacheEntry(BaseModel):
+    query: str
+    response: str
+    embedding: Optional[List[float]] = None  # only with an embedding model
+    created_at: float
+    latency: float  # how long generating the response took, saved on every hit
+    hits: int = 0
+
+
+class ResponseCacheStats(BaseModel):
+    exact_hits: int = 0
+    semantic_hits: int = 0
+    misses: int = 0
+    bypassed: int = 0  # device commands, time-sensitive questions and follow-ups
+    latency_saved: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0
+
+
+class ResponseCache:
+    """
+    Answers repeated general questions without running the model again.
+
+    Queries are normalized (case, punctuation, "hey Jarvix", "please", ...) and looked up exactly.
+    With an `embed` model, e.g. `ollama_embedding`, a query that misses is also compared by
+    cosine similarity to every cached query. Spelling-based similarity cannot tell "5 miles to
+    kilometers" from "5 kilometers to miles", so there is no fuzzy matching without a model.
+    Embeddings still score "12 times 13" and "12 times 14" as near duplicates, so a similar
+    query must also have the same numbers. Entries expire after `ttl` seconds,
+    the least recently used are evicted beyond `max_entries`, and the cache is written to a
+    JSON file in the background `save_delay` seconds after a change.
+    Device commands, responses produced by a side-effect tool, time-sensitive questions and
+    follow-ups that depend on the conversation are never cached.
+    """
+
+    def __init__(self, path: Path = Path(os.getenv('RESPONSE_CACHE_PATH', Path.home() / '.cache' / 'jarvix' / 'responses.json')),
+                 ttl: float = float(os.getenv('RESPONSE_CACHE_TTL', str(7 * 24 * 3600))),
+                 max_entries: int = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '500')),
+                 threshold: float = float(os.getenv('RESPONSE_CACHE_THRESHOLD', '0.9')),
+                 embed: Optional[Callable[[str], List[float]]] = None,
+                 last_tool_names: Optional[Callable[[], List[str]]] = None,
+                 remember: Optional[Callable[[str, str], None]] = None, save_delay: float = 5.0):
+        self.path = Path(path).expanduser()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.embed = embed
+        self.last_tool_names = last_tool_names
+        # Records a cached answer in the conversation history, which the processor would have done
+        self.remember = remember
+        self.save_delay = save_delay
+        self.stats = ResponseCacheStats()
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()  # normalized query -> entry, least recent first
+        self._matrix: Optional[np.ndarray] = None  # embeddings of _matrix_keys stacked, rebuilt lazily
+        self._matrix_keys: List[str] = []
+        self._lock = threading.Lock()
+        self._save_timer: Optional[threading.Timer] = None
+        self._save_lock = threading.Lock()  # a flush and the timer must not write the file at the same time
+        self._load()
+        atexit.register(self.flush)
+
+    def cacheable(self, text: str) -> bool:
+        normalized = text.lower()
+        return (classify_request(normalized) == Route.GENERAL and not TIME_SENSITIVE.search(normalized)
+                and not FOLLOW_UP.search(normalized))
+
+    def get(self, text: str) -> Optional[str]:
+        key = normalize_query(text)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.created_at <= self.ttl:
+                self.stats.exact_hits += 1
+                return self._hit(key, entry)
+            if self.embed is None:
+                self.stats.misses += 1
+                return None
+
+        embedding = np.asarray(self.embed(key), dtype=np.float32)
+        with self._lock:
+            self._expire(now)
+            if self._matrix is None:
+                # Entries saved without a model, or by another one, cannot be compared
+                self._matrix_keys = [key for key, entry in self._entries.items()
+                                     if entry.embedding is not None and len(entry.embedding) == embedding.size]
+                self._matrix = np.array([self._entries[key].embedding for key in self._matrix_keys],
+                                        dtype=np.float32).reshape(len(self._matrix_keys), embedding.size)
+            if self._matrix_keys:
+                scores = self._matrix @ embedding
+                for best in np.argsort(scores)[::-1]:
+                    if scores[best] < self.threshold:
+                        break
+                    best_key = self._matrix_keys[best]
+                    if numbers(key) != numbers(best_key):
+                        continue
+                    self.stats.semantic_hits += 1
+                    debug_print(f"Response cache: '{key}' matched '{best_key}' ({scores[best]:.2f})")
+                    return self._hit(best_key, self._entries[best_key])
+            self.stats.misses += 1
+        return None
+
+    def put(self, text: str, response: str, latency: float) -> None:
+        key = normalize_query(text)
+        if not key or not response:
+            return
+        entry = CacheEntry(query=key, response=response, embedding=self.embed(key) if self.embed else None,
+                           created_at=time.time(), latency=latency)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+            self._schedule_save()
+
+    def flush(self) -> None:
+        """Write pending changes now instead of after `save_delay`."""
+        with self._lock:
+            if self._save_timer is None:
+                return
+            self._save_timer.cancel()
+            self._save_timer = None
+        self._save()
+
+    def wrap(self, processor: Callable[[str], str]) -> Callable[[str], str]:
+        """`processor` with the cache in front of it."""
+        def cached_processor(text: str) -> str:
+            if not self.cacheable(text):
+                self.stats.bypassed += 1
+                return processor(text)
+            response = self.get(text)
+            if response is None:
+                started = time.perf_counter()
+                response = processor(text)
+                self._store(text, response, time.perf_counter() - started)
+            elif self.remember:
+                self.remember(text, response)
+            debug_print(self.report())
+            return response
+        return cached_processor
+
+    def wrap_stream(self, stream_processor: Callable[[str], Iterable[str]]) -> Callable[[str], Iterator[str]]:
+        """Streaming version of `wrap`: a hit is yielded at once, a miss is stored once fully streamed."""
+        def cached_stream(text: str) -> Iterator[str]:
+            if not self.cacheable(text):
+                self.stats.bypassed += 1
+                yield from stream_processor(text)
+                return
+            response = self.get(text)
+            if response is not None:
+                if self.remember:
+                    self.remember(text, response)
+                debug_print(self.report())
+                yield response
+                return
+            started = time.perf_counter()
+            deltas = []
+            for delta in stream_processor(text):
+                deltas.append(delta)
+                yield delta
+            self._store(text, ''.join(deltas), time.perf_counter() - started)
+            debug_print(self.report())
+        return cached_stream
+
+    def report(self) -> str:
+        return (f"Response cache: {self.stats.hit_rate:.0%} hit rate ({self.stats.exact_hits} exact, "
+                f"{self.stats.semantic_hits} similar, {self.stats.misses} misses, {self.stats.bypassed} bypassed), "
+                f"{self.stats.latency_saved:.1f}s of generation saved")
+
+    def _store(self, text: str, response: str, latency: float) -> None:
+        tool_names = self.last_tool_names() if self.last_tool_names else []
+        if SIDE_EFFECT_TOOLS.intersection(tool_names):
+            return
+        self.put(text, response, latency)
+
+    def _hit(self, key: str, entry: CacheEntry) -> str:
+        entry.hits += 1
+        self._entries.move_to_end(key)
+        self.stats.latency_saved += entry.latency
+        return entry.response
+
+    def _expire(self, now: float) -> None:
+        expired = [key for key, entry in self._entries.items() if now - entry.created_at > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            entries = [CacheEntry(**entry) for entry in json.loads(self.path.read_text())]
+        except (OSError, ValueError, TypeError) as e:
+            debug_print(f"Ignoring unreadable response cache {self.path}: {e}")
+            return
+        for entry in entries:
+            self._entries[entry.query] = entry
+
+    def _schedule_save(self) -> None:
+        # Called with the lock held. Answers are returned right away, several puts share one write
+        if self._save_timer is not None:
+            return
+        self._save_timer = threading.Timer(self.save_delay, self._background_save)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+
+    def _background_save(self) -> None:
+        with self._lock:
+            self._save_timer = None
+        self._save()
+
+    def _save(self) -> None:
+        with self._lock:
+            entries = [entry.model_dump() for entry in self._entries.values()]
+        try:
+            with self._save_lock:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                temporary = self.path.with_suffix('.tmp')
+                temporary.write_text(json.dumps(entries))
+                os.replace(temporary, self.path)
+        except OSError as e:
+            debug_print(f"Saving the response cache to {self.path} failed: {e}")
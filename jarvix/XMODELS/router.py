@@ -0,0 +1,54 @@
+import re
+from enum import Enum
+from typing import Optional, Dict, List
+
+from pydantic import BaseModel, Field
+
+
+class RoutingMode(Enum):
+    # The model picks between the device and the general question tool. General questions cost two calls.
+    TOOLS = "tools"
+    # One completion with only the device tool: the model either answers directly or calls the tool.
+    SINGLE_PASS = "single_pass"
+    # A local classifier picks the path, only device commands go through function calling.
+    CLASSIFIER = "classifier"
+
+
+class Route(Enum):
+    DEVICE = "device"
+    GENERAL = "general"
+
+
+class RequestStats(BaseModel):
+    routing_mode: RoutingMode
+    route: Optional[Route] = None
+    model_calls: int = 0
+    tool_names: List[str] = Field(default_factory=list)  # every tool the model called, in order
+    tool_latencies: Dict[str, float] = Field(default_factory=dict)
+    latency: float = 0.0
+    prompt_eval_count: int = 0  # prompt tokens the model evaluated, a reused KV cache prefix is not counted
+    eval_count: int = 0  # generated tokens
+    prompt_eval_time: float = 0.0
+    eval_time: float = 0.0
+
+
+DEVICE_VERBS = re.compile(
+    r"\b(turn|switch|power)\s+(\w+\s+){0,4}?(on|off)\b"
+    r"|\b(toggle|dim|brighten|unlock|lock)\b"
+    r"|\b(open|close|start|stop)\s+(the\s+)?\w+\s+(door|garage|blinds|curtains|fan|vacuum|heater)\b"
+)
+DEVICE_NOUNS = re.compile(
+    r"\b(lights?|lamps?|plugs?|switch(es)?|fans?|heater|thermostat|tv|outlets?|bulbs?|blinds|garage)\b"
+)
+
+
+def classify_request(text: str) -> Route:
+    """Cheap keyword classifier deciding whether a request needs a device action."""
+    normalized = text.lower()
+    if DEVICE_VERBS.search(normalized):
+        return Route.DEVICE
+    # Nouns alone are weak evidence ("why do lamps flicker?"), so they only count in short imperatives
+    if DEVICE_NOUNS.search(normalized) and len(normalized.split()) <= 6 and not normalized.rstrip().endswith('?'):
+        return Route.DEVICE
+    return Route.GENERAL
+
@@ -0,0 +1,135 @@
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from typing import Callable, Dict, Generator, Iterable, Iterator, List, Optional
+
+from pydantic import BaseModel, Field
+
+from UTILS.printer import debug_print
+
+
+class ToolCall(BaseModel):
+    name: Optional[str] = None
+    arguments: dict = Field(default_factory=dict)
+
+
+class ToolResult(BaseModel):
+    name: Optional[str] = None
+    output: str = ""
+    latency: float = 0.0
+    timed_out: bool = False
+    error: Optional[str] = None
+
+
+class ToolDispatcher:
+    """
+    Executes every tool call of a model response instead of only the first one.
+
+    All calls are submitted to a thread pool at once, so "turn off the lights and tell me a
+    joke" controls the device while the joke is generated. Each call gets `timeout` seconds
+    (or its own entry in `timeouts`); a call that takes longer is answered with an apology and
+    left to finish in the background. Results come back in the order the model asked for them
+    and `merge` joins them into a single spoken response.
+    """
+
+    def __init__(self, function_registry: Dict[str, Callable[..., str]],
+                 timeout: float = float(os.getenv('TOOL_TIMEOUT', '10')),
+                 timeouts: Optional[Dict[str, float]] = None, max_workers: int = 4):
+        self.function_registry = function_registry
+        self.timeout = timeout
+        self.timeouts = timeouts or {}
+        self.last_results: List[ToolResult] = []
+        # Long-lived so a timed out call never blocks the next request on pool shutdown
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tool')
+
+    def run(self, calls: Iterable[ToolCall],
+            inline: Optional[Dict[str, Callable[..., Iterator[str]]]] = None) -> Iterator[str]:
+        """
+        Start every call, then yield their outputs in order as each one completes.
+        Calls named in `inline` are streamed on the caller's thread instead, e.g. a general
+        question whose answer should be spoken while it is generated.
+        """
+        calls = list(calls)
+        inline = inline or {}
+        started = time.perf_counter()
+        pending = [None if call.name in inline else self._submit(call) for call in calls]
+        self.last_results = []
+        for call, future in zip(calls, pending):
+            # Outputs are separate sentences, a space keeps them apart for the sentence segmenter
+            separator = ' ' if any(result.output for result in self.last_results) else ''
+            if future is None:
+                result = yield from self._stream(call, inline[call.name], separator)
+            else:
+                # Every call was started together, so each deadline counts from the dispatch
+                remaining = self._timeout(call) - (time.perf_counter() - started)
+                result = self._result(call, future, remaining)
+                if result.output:
+                    yield separator + result.output
+            self.last_results.append(result)
+        debug_print(self.report())
+
+    def dispatch(self, calls: Iterable[ToolCall]) -> str:
+        """Run every call concurrently and merge their outputs into one response."""
+        return self.merge(list(self.run(calls)))
+
+    @staticmethod
+    def merge(outputs: List[str]) -> str:
+        return ' '.join(output.strip() for output in outputs if output and output.strip())
+
+    def report(self) -> str:
+        timings = ', '.join(f"{result.name} {result.latency * 1000:.0f} ms"
+                            f"{' (timed out)' if result.timed_out else ''}{' (failed)' if result.error else ''}"
+                            for result in self.last_results)
+        return f"Tool calls: {timings or 'none'}"
+
+    def _timeout(self, call: ToolCall) -> float:
+        return self.timeouts.get(call.name, self.timeout)
+
+    def _stream(self, call: ToolCall, function: Callable[..., Iterator[str]],
+                separator: str) -> Generator[str, None, ToolResult]:
+        call_started = time.perf_counter()
+        deltas = []
+        try:
+            for delta in function(**call.arguments):
+                if not deltas and separator:
+                    yield separator
+                deltas.append(delta)
+                yield delta
+        except Exception as e:
+            result = self._failed(call, call_started, e)
+            # After a partial answer the apology is a sentence of its own
+            yield (' ' if deltas else separator) + result.output
+            if deltas:
+                result.output = f"{''.join(deltas)} {result.output}"
+            return result
+        return ToolResult(name=call.name, output=''.join(deltas), latency=time.perf_counter() - call_started)
+
+    def _submit(self, call: ToolCall) -> Future:
+        function = self.function_registry.get(call.name) if call.name else None
+
+        def execute() -> ToolResult:
+            call_started = time.perf_counter()
+            if function is None:
+                output = f"Unknown function: {call.name}."
+                if call.name == "control_home_device":
+                    output += " You don't have Home Assistant setup."
+                return ToolResult(name=call.name, output=output)
+            try:
+                output = function(**call.arguments)
+                return ToolResult(name=call.name, output=output or "", latency=time.perf_counter() - call_started)
+            except Exception as e:
+                return self._failed(call, call_started, e)
+        return self._executor.submit(execute)
+
+    @staticmethod
+    def _failed(call: ToolCall, call_started: float, error: Exception) -> ToolResult:
+        debug_print(f"Tool {call.name} failed: {error}")
+        return ToolResult(name=call.name, output=f"Sorry, {call.name.replace('_', ' ')} failed.",
+                          latency=time.perf_counter() - call_started, error=str(error))
+
+    def _result(self, call: ToolCall, future: Future, remaining: float) -> ToolResult:
+        try:
+            return future.result(timeout=max(remaining, 0))
+        except TimeoutError:
+            return ToolResult(name=call.name, output=f"Sorry, {call.name.replace('_', ' ')} is taking too long.",
+                              latency=self._timeout(call), timed_out=True)
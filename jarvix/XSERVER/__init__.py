@@ -0,0 +1,3 @@
+"""
+Server mode: one Jarvix base serving many room satellites.
+"""
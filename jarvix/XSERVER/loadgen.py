@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+try:
+    import websockets  # optional, only needed for server mode
+except ImportError:
+    websockets = None
+
+
+class TurnResult(BaseModel):
+    room: str
+    transcript: float = 0.0  # seconds after the last audio frame was sent
+    response: float = 0.0
+    first_audio: float = 0.0
+    done: float = 0.0
+    error: Optional[str] = None
+
+
+def load_fixtures(fixtures_dir: Path) -> List[Tuple[np.ndarray, int]]:
+    """Every `<name>.wav` in `fixtures_dir`, a recorded command followed by a little silence."""
+    import soundfile as sf
+
+    fixtures = []
+    for wav_path in sorted(Path(fixtures_dir).glob('*.wav')):
+        audio, sample_rate = sf.read(wav_path, dtype='int16', always_2d=True)
+        fixtures.append((audio[:, 0], sample_rate))
+    if not fixtures:
+        raise ValueError(f"No .wav fixtures in {fixtures_dir}.")
+    return fixtures
+
+
+async def run_satellite(url: str, room: str, fixtures: List[Tuple[np.ndarray, int]], turns: int, speed: float,
+                        offset: int = 0, frame_duration: float = 0.02) -> List[TurnResult]:
+    """One simulated satellite: streams fixtures at `speed` times real time and times each answer."""
+    results = []
+    async with websockets.connect(url, max_size=None) as websocket:
+        sample_rate = fixtures[0][1]
+        await websocket.send(json.dumps({"type": "hello", "room": room, "sample_rate": sample_rate}))
+        for turn in range(turns):
+            audio, sample_rate = fixtures[(offset + turn) % len(fixtures)]
+            await websocket.send(json.dumps({"type": "start"}))
+            frame = int(sample_rate * frame_duration)
+            for start in range(0, audio.size, frame):
+                await websocket.send(audio[start:start + frame].tobytes())
+                await asyncio.sleep(frame_duration / speed)
+            await websocket.send(json.dumps({"type": "end"}))
+            sent_at = time.perf_counter()
+
+            result = TurnResult(room=room)
+            while True:
+                message = await websocket.recv()
+                elapsed = time.perf_counter() - sent_at
+                if isinstance(message, bytes):
+                    result.first_audio = result.first_audio or elapsed
+                    continue
+                message = json.loads(message)
+                if message['type'] in ('transcript', 'response'):
+                    setattr(result, message['type'], elapsed)
+                elif message['type'] == 'error':
+                    result.error = message['message']
+                    break
+                elif message['type'] == 'done':
+                    result.done = elapsed
+                    break
+            results.append(result)
+    return results
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+async def run_load(url: str, fixtures_dir: Path, levels: List[int], turns: int = 3, speed: float = 1.0,
+                   target: float = 2.0) -> Dict[int, Dict[str, float]]:
+    """
+    Run `turns` turns on 1, 2, 4... satellites at once and report answer latencies per level.
+    The concurrency limit is the highest level whose p95 time to first audio stays within `target` seconds.
+    """
+    if websockets is None:
+        raise RuntimeError("The load generator needs the websockets package: pip install websockets")
+    fixtures = load_fixtures(fixtures_dir)
+    report = {}
+    for level in levels:
+        started = time.perf_counter()
+        satellites = [run_satellite(url, f"room-{index}", fixtures, turns, speed, offset=index) for index in range(level)]
+        results = [result for results in await asyncio.gather(*satellites, return_exceptions=True)
+                   if not isinstance(results, BaseException) for result in results]
+        wall = time.perf_counter() - started
+        succeeded = [result for result in results if result.error is None]
+        report[level] = {
+            "turns": len(results),
+            "errors": level * turns - len(succeeded),
+            "p50_transcript": percentile([result.transcript for result in succeeded], 0.5),
+            "p95_transcript": percentile([result.transcript for result in succeeded], 0.95),
+            "p50_first_audio": percentile([result.first_audio for result in succeeded], 0.5),
+            "p95_first_audio": percentile([result.first_audio for result in succeeded], 0.95),
+            "turns_per_minute": len(succeeded) / wall * 60,
+        }
+    within = [level for level, result in report.items() if not result["errors"] and result["p95_first_audio"] <= target]
+    print(f"Concurrency limit: {max(within) if within else 0} satellites "
+          f"(p95 first audio within {target:.1f}s)")
+    return report
+
+
+if __name__ == "__main__":
+    # python -m XSERVER.loadgen path/to/fixtures --levels 1,2,4,8
+    parser = argparse.ArgumentParser(description="Simulate many satellites against a Jarvix base")
+    parser.add_argument('fixtures', type=Path, help="Directory of .wav recordings of spoken commands")
+    parser.add_argument('--url', default='ws://localhost:8765')
+    parser.add_argument('--levels', default='1,2,4,8', help="Numbers of concurrent satellites to try")
+    parser.add_argument('--turns', type=int, default=3, help="Turns per satellite at every level")
+    parser.add_argument('--speed', type=float, default=1.0, help="Stream audio this many times faster than real time")
+    parser.add_argument('--target', type=float, default=2.0, help="Acceptable p95 seconds to first audio")
+    args = parser.parse_args()
+
+    load = asyncio.run(run_load(args.url, args.fixtures, [int(level) for level in args.levels.split(',')],
+                                args.turns, args.speed, args.target))
+    for level, result in load.items():
+        print(level, result)
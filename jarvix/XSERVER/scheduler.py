@@ -0,0 +1,242 @@
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from UTILS.printer import debug_print
+from XCHATBOT.streaming_stt import resample
+
+
+class SchedulerStats(BaseModel):
+    stt_requests: int = 0
+    stt_batches: int = 0
+    stt_time: float = 0.0
+    llm_requests: int = 0
+    llm_wait: float = 0.0  # time requests spent queued for the model
+    llm_time: float = 0.0
+    max_llm_queue: int = 0
+    served: Dict[str, int] = Field(default_factory=dict)  # model requests per room
+
+    @property
+    def average_batch(self) -> float:
+        return self.stt_requests / self.stt_batches if self.stt_batches else 0.0
+
+
+class _Request:
+    def __init__(self, payload):
+        self.payload = payload
+        self.future = asyncio.get_running_loop().create_future()
+        self.queued_at = time.perf_counter()
+
+
+class FairQueue:
+    """
+    One FIFO per room. `get` serves the rooms with the highest priority first and takes turns
+    between rooms of equal priority, so a busy kitchen cannot starve the bedroom.
+    """
+
+    def __init__(self):
+        self._rooms: Dict[str, Deque] = {}
+        self._priorities: Dict[str, int] = {}
+        self._last_served: Dict[str, int] = {}
+        self._served = 0
+        self._condition = asyncio.Condition()
+
+    def __len__(self) -> int:
+        return sum(len(items) for items in self._rooms.values())
+
+    async def put(self, room: str, priority: int, item) -> None:
+        async with self._condition:
+            self._rooms.setdefault(room, deque()).append(item)
+            self._priorities[room] = priority
+            self._condition.notify()
+
+    async def get(self) -> Tuple[str, object]:
+        async with self._condition:
+            await self._condition.wait_for(lambda: len(self) > 0)
+            waiting = [room for room, items in self._rooms.items() if items]
+            # Highest priority first, then the room that was served longest ago
+            room = min(waiting, key=lambda room: (-self._priorities[room], self._last_served.get(room, -1)))
+            self._served += 1
+            self._last_served[room] = self._served
+            return room, self._rooms[room].popleft()
+
+
+class EngineScheduler:
+    """
+    Shares one set of engines between every satellite.
+
+    STT: requests that arrive within `max_wait` of each other are transcribed as one batch of
+    up to `max_batch` utterances, with `transcribe_batch` when the engine has it, otherwise
+    one after the other on the STT thread. While a batch runs the next one fills up, so the
+    batches grow with the load. `stt_concurrency` batches can run at once, e.g. one per
+    STTWorkerPool worker.
+
+    LLM: requests wait in a FairQueue by room and priority, and `llm_concurrency` of them run
+    at a time. `processor_for_room` gives every room its own processor, so each keeps its own
+    conversation.
+
+    TTS: the engine runs on one thread and every chunk is a separate job, so utterances of
+    different rooms are synthesized interleaved instead of one room waiting for another's.
+    """
+
+    def __init__(self, stt_engine, processor_for_room: Callable[[str], Callable[[str], str]], tts_engine,
+                 tts_settings=None, tts_cache=None, transcribe_kwargs: Optional[Callable[[], dict]] = None,
+                 max_batch: int = int(os.getenv('STT_MAX_BATCH', '8')),
+                 max_wait: float = float(os.getenv('STT_MAX_WAIT', '0.05')),
+                 stt_concurrency: int = int(os.getenv('STT_CONCURRENCY', '1')),
+                 llm_concurrency: int = int(os.getenv('LLM_CONCURRENCY', '1'))):
+        self.stt_engine = stt_engine
+        self.processor_for_room = processor_for_room
+        self.tts_engine = tts_engine
+        self.tts_settings = tts_settings
+        self.tts_cache = tts_cache
+        self.transcribe_kwargs = transcribe_kwargs
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.stt_concurrency = stt_concurrency
+        self.llm_concurrency = llm_concurrency
+        self.stats = SchedulerStats()
+        self._stt_executor = ThreadPoolExecutor(max_workers=stt_concurrency, thread_name_prefix='stt')
+        self._llm_executor = ThreadPoolExecutor(max_workers=llm_concurrency, thread_name_prefix='llm')
+        self._tts_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tts')
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        self._stt_queue: "asyncio.Queue[_Request]" = asyncio.Queue()
+        self._stt_slots = asyncio.Semaphore(self.stt_concurrency)
+        self._llm_queue = FairQueue()
+        self._tasks = [asyncio.create_task(self._batch_stt(), name='stt batcher')]
+        self._tasks += [asyncio.create_task(self._serve_llm(), name=f'llm {index}') for index in range(self.llm_concurrency)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for executor in (self._stt_executor, self._llm_executor, self._tts_executor):
+            executor.shutdown(wait=False)
+
+    async def transcribe(self, audio: np.ndarray) -> str:
+        """Transcribe 16 kHz float32 mono audio, batched with whatever other rooms sent meanwhile."""
+        request = _Request(audio)
+        await self._stt_queue.put(request)
+        return await request.future
+
+    async def respond(self, room: str, priority: int, text: str) -> str:
+        request = _Request(text)
+        await self._llm_queue.put(room, priority, request)
+        self.stats.max_llm_queue = max(self.stats.max_llm_queue, len(self._llm_queue))
+        return await request.future
+
+    async def synthesize(self, text: str, sample_rate: int) -> AsyncIterator[np.ndarray]:
+        """Float32 chunks of `text` spoken at `sample_rate`, as soon as the engine produces them."""
+        loop = asyncio.get_running_loop()
+        key = self._cache_key(text)
+        if key is not None:
+            cached = await loop.run_in_executor(self._tts_executor, self.tts_cache.get, key)
+            if cached is not None:
+                yield resample(cached[0], cached[1], sample_rate)
+                return
+
+        chunks = iter(self.tts_engine.synthesize(text, self.tts_settings))
+        rendered, source_rate = [], sample_rate
+        try:
+            while True:
+                item = await loop.run_in_executor(self._tts_executor, next, chunks, None)
+                if item is None:
+                    break
+                chunk, source_rate = item
+                rendered.append(chunk)
+                yield resample(chunk, source_rate, sample_rate)
+        finally:
+            if hasattr(chunks, 'close'):
+                # The satellite may have cancelled, stops a subprocess engine mid-utterance
+                await loop.run_in_executor(self._tts_executor, chunks.close)
+        if key is not None and rendered:
+            await loop.run_in_executor(self._tts_executor, self.tts_cache.put, key, np.concatenate(rendered), source_rate)
+
+    def report(self) -> str:
+        stats = self.stats
+        return (f"Scheduler: {stats.stt_requests} transcriptions in {stats.stt_batches} batches "
+                f"({stats.average_batch:.1f} average, {stats.stt_time:.1f}s), {stats.llm_requests} model requests "
+                f"({stats.llm_wait:.1f}s queued, {stats.llm_time:.1f}s running, longest queue {stats.max_llm_queue}), "
+                f"per room {stats.served}")
+
+    async def _batch_stt(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # Wait for a free slot first, so requests keep piling into the next batch while all are busy
+            await self._stt_slots.acquire()
+            batch = [await self._stt_queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(await asyncio.wait_for(self._stt_queue.get(), max(deadline - loop.time(), 0)))
+                except asyncio.TimeoutError:
+                    break
+            batch = [request for request in batch if not request.future.cancelled()]
+            if not batch:
+                self._stt_slots.release()
+                continue
+            asyncio.create_task(self._run_stt_batch(batch))
+
+    async def _run_stt_batch(self, batch: List[_Request]) -> None:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            texts = await loop.run_in_executor(self._stt_executor, self._transcribe_batch,
+                                               [request.payload for request in batch])
+        except Exception as e:
+            debug_print(f"Transcribing a batch of {len(batch)} failed: {e}")
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+        finally:
+            self._stt_slots.release()
+        self.stats.stt_batches += 1
+        self.stats.stt_requests += len(batch)
+        self.stats.stt_time += time.perf_counter() - started
+        debug_print(f"Transcribed a batch of {len(batch)} in {time.perf_counter() - started:.2f}s")
+        for request, text in zip(batch, texts):
+            if not request.future.done():
+                request.future.set_result(text)
+
+    def _transcribe_batch(self, audios: List[np.ndarray]) -> List[str]:
+        kwargs = self.transcribe_kwargs() if self.transcribe_kwargs else {}
+        if hasattr(self.stt_engine, 'transcribe_batch'):
+            results = self.stt_engine.transcribe_batch(audios, **kwargs)
+        else:
+            results = [self.stt_engine.transcribe(audio, **kwargs) for audio in audios]
+        return [''.join(segment.text for segment in segments).strip() for segments, _ in results]
+
+    async def _serve_llm(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            room, request = await self._llm_queue.get()
+            if request.future.cancelled():
+                continue
+            started = time.perf_counter()
+            self.stats.llm_wait += started - request.queued_at
+            try:
+                response = await loop.run_in_executor(self._llm_executor, self.processor_for_room(room), request.payload)
+            except Exception as e:
+                debug_print(f"Answering {room} failed: {e}")
+                response = None
+                if not request.future.done():
+                    request.future.set_exception(e)
+            self.stats.llm_requests += 1
+            self.stats.llm_time += time.perf_counter() - started
+            self.stats.served[room] = self.stats.served.get(room, 0) + 1
+            if response is not None and not request.future.done():
+                request.future.set_result(response)
+
+    def _cache_key(self, text: str) -> Optional[str]:
+        if self.tts_cache is None:
+            return None
+        settings = self.tts_settings
+        return self.tts_cache.key(text.strip(), settings.rate, settings.volume, settings.voice_id, self.tts_engine.name)
@@ -0,0 +1,225 @@
+import asyncio
+import json
+import os
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+import numpy as np
+
+from UTILS.printer import debug_print
+from XCHATBOT.endpointing import create_endpointer
+from XCHATBOT.sentence_segmenter import SentenceSegmenter
+from XCHATBOT.streaming_stt import WHISPER_SAMPLE_RATE, resample
+from XSERVER.scheduler import EngineScheduler
+
+try:
+    import websockets  # optional, only needed for server mode
+except ImportError:
+    websockets = None
+
+"""
+    Protocol, one WebSocket per satellite. Text frames are JSON, binary frames are int16 mono PCM.
+
+    satellite -> base
+        {"type": "hello", "room": "kitchen", "priority": 1, "sample_rate": 16000, "output_sample_rate": 16000}
+        {"type": "start"}            the satellite heard its wake word, audio follows as binary frames
+        {"type": "end"}              optional, the satellite decided the user stopped talking
+        {"type": "cancel"}           drop the current turn, e.g. the user barged in
+    base -> satellite
+        {"type": "listening"}        acknowledges "start"
+        {"type": "end_of_speech"}    the base's endpointer closed the turn, stop streaming audio
+        {"type": "transcript", "text": ...}
+        {"type": "response", "text": ...}
+        {"type": "audio_start", "sample_rate": ...}, binary frames, {"type": "audio_end"}
+        {"type": "done", "timings": {...}}
+        {"type": "error", "message": ...}
+"""
+
+
+class SatelliteSession:
+    """One connected room: records its wake-triggered audio and runs its turns through the scheduler."""
+
+    def __init__(self, server: "JarvixServer", websocket):
+        self.server = server
+        self.websocket = websocket
+        self.room = f"satellite-{id(websocket):x}"
+        self.priority = 0
+        self.sample_rate = WHISPER_SAMPLE_RATE
+        self.output_sample_rate = WHISPER_SAMPLE_RATE
+        self.recording = False
+        self.endpointer = None
+        self.turn: Optional[asyncio.Task] = None
+        self._audio: List[np.ndarray] = []
+
+    async def run(self) -> None:
+        async for message in self.websocket:
+            if isinstance(message, bytes):
+                await self._feed(message)
+            else:
+                await self._command(json.loads(message))
+
+    def cancel(self) -> None:
+        self.recording = False
+        if self.turn is not None and not self.turn.done():
+            self.turn.cancel()
+
+    async def _command(self, message: dict) -> None:
+        kind = message.get('type')
+        if kind == 'hello':
+            self.room = message.get('room', self.room)
+            self.priority = int(message.get('priority', 0))
+            self.sample_rate = int(message.get('sample_rate', WHISPER_SAMPLE_RATE))
+            self.output_sample_rate = int(message.get('output_sample_rate', WHISPER_SAMPLE_RATE))
+            debug_print(f"Satellite '{self.room}' connected (priority {self.priority})")
+        elif kind == 'start':
+            self.cancel()
+            self.recording = True
+            self._audio = []
+            self.endpointer = create_endpointer(self.server.endpointer, silence_duration=self.server.silence_duration)
+            await self._send({"type": "listening"})
+        elif kind == 'end':
+            await self._end_of_speech()
+        elif kind == 'cancel':
+            self.cancel()
+        else:
+            await self._send({"type": "error", "message": f"Unknown message type '{kind}'."})
+
+    async def _feed(self, data: bytes) -> None:
+        if not self.recording:
+            return  # audio still in flight after the turn ended
+        chunk = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
+        self._audio.append(chunk)
+        if self.endpointer.process(chunk, self.sample_rate):
+            debug_print(f"{self.room}: end of turn ({self.endpointer.reason}) after {self.endpointer.elapsed:.1f}s")
+            await self._send({"type": "end_of_speech"})
+            await self._end_of_speech()
+
+    async def _end_of_speech(self) -> None:
+        if not self.recording:
+            return
+        self.recording = False
+        audio = np.concatenate(self._audio) if self._audio else np.zeros(0, dtype=np.float32)
+        self._audio = []
+        self.turn = asyncio.create_task(self._run_turn(resample(audio, self.sample_rate)))
+
+    async def _run_turn(self, audio: np.ndarray) -> None:
+        scheduler = self.server.scheduler
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+        try:
+            text = await scheduler.transcribe(audio) if audio.size else ''
+            timings['transcript'] = time.perf_counter() - started
+            await self._send({"type": "transcript", "text": text})
+            if text:
+                response = await scheduler.respond(self.room, self.priority, text)
+                timings['response'] = time.perf_counter() - started
+                await self._send({"type": "response", "text": response})
+                await self._send({"type": "audio_start", "sample_rate": self.output_sample_rate})
+                # Sentence by sentence, so the satellite starts playing after the first one
+                for utterance in SentenceSegmenter().segment([response]):
+                    async for chunk in scheduler.synthesize(utterance, self.output_sample_rate):
+                        timings.setdefault('first_audio', time.perf_counter() - started)
+                        await self.websocket.send((np.clip(chunk, -1, 1) * 32767).astype(np.int16).tobytes())
+                await self._send({"type": "audio_end"})
+            timings['done'] = time.perf_counter() - started
+            await self._send({"type": "done", "timings": timings})
+        except asyncio.CancelledError:
+            debug_print(f"{self.room}: turn cancelled")
+            raise
+        except Exception as e:
+            debug_print(f"{self.room}: turn failed: {e}")
+            await self._send({"type": "error", "message": str(e)})
+
+    async def _send(self, message: dict) -> None:
+        await self.websocket.send(json.dumps(message))
+
+
+class JarvixServer:
+    """
+    Base-station mode: satellites in every room stream their wake-triggered audio over a
+    WebSocket and get the spoken answer back, while one EngineScheduler shares Whisper, the
+    language model and the TTS engine between them.
+    """
+
+    def __init__(self, scheduler: EngineScheduler, host: str = os.getenv('SERVER_HOST', '0.0.0.0'),
+                 port: int = int(os.getenv('SERVER_PORT', '8765')), endpointer: str = os.getenv('ENDPOINTER', 'vad'),
+                 silence_duration: float = 1.3):
+        if websockets is None:
+            raise RuntimeError("Server mode needs the websockets package: pip install websockets")
+        self.scheduler = scheduler
+        self.host = host
+        self.port = port
+        self.endpointer = endpointer
+        self.silence_duration = silence_duration
+        self.sessions: Set[SatelliteSession] = set()
+
+    async def serve(self) -> None:
+        await self.scheduler.start()
+        try:
+            async with websockets.serve(self._handle, self.host, self.port, max_size=None):
+                print(f"\n🛰️ Jarvix base listening for satellites on ws://{self.host}:{self.port}")
+                await asyncio.Future()
+        finally:
+            await self.scheduler.stop()
+
+    async def _handle(self, websocket, path: Optional[str] = None) -> None:
+        session = SatelliteSession(self, websocket)
+        self.sessions.add(session)
+        try:
+            await session.run()
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            session.cancel()
+            self.sessions.discard(session)
+            debug_print(f"Satellite '{session.room}' disconnected. {self.scheduler.report()}")
+
+
+def build_scheduler() -> EngineScheduler:
+    """The engines configured through the usual environment variables, as in main.py."""
+    from XCHATBOT.chatbot import Chatbot
+    from XCHATBOT.stt_vocabulary import STTVocabulary
+    from XCHATBOT.tts import TTSSettings
+    from XCHATBOT.tts_cache import TTSCache
+    from XCHATBOT.tts_engines import create_tts_engine
+    from XMODELS.api_version import ApiClient, ModelType
+    from XMODELS.ollama_client import OllamaClient
+
+    model_type = ModelType(os.getenv('SELECTED_MODEL', ModelType.OLLAMA.value))
+    if model_type == ModelType.OLLAMA:
+        client = OllamaClient()
+        client.function_registry["handle_general_question"] = client.process_general_text
+    else:
+        api_key = os.getenv('OPENAI_API_KEY') if model_type == ModelType.GPT else None
+        client = ApiClient(gpt_api_key=api_key or '', claude_api_key=os.getenv('ANTHROPIC_API_KEY'),
+                           selected_model=model_type)
+    rooms: Dict[str, Callable[[str], str]] = {}
+
+    def processor_for_room(room: str) -> Callable[[str], str]:
+        # Requests of different rooms run concurrently (LLM_CONCURRENCY), so every room keeps its own
+        # conversation and request state, only the model and its connection are shared
+        if room not in rooms:
+            rooms[room] = client.for_conversation().process_text
+        return rooms[room]
+
+    vocabulary = STTVocabulary(mode=os.getenv('STT_VOCABULARY', 'prompt'))
+    for thread in Chatbot.stt_engine.warm_up().values():
+        thread.join()
+    return EngineScheduler(
+        stt_engine=Chatbot.stt_engine,
+        processor_for_room=processor_for_room,
+        tts_engine=create_tts_engine(os.getenv('TTS_ENGINE', 'pyttsx3')),
+        tts_settings=TTSSettings(),
+        tts_cache=TTSCache() if os.getenv('TTS_CACHE', 'true').lower() == 'true' else None,
+        transcribe_kwargs=vocabulary.transcribe_kwargs if vocabulary.mode != 'off' else None,
+    )
+
+
+if __name__ == "__main__":
+    # python -m XSERVER.server
+    from dotenv import load_dotenv
+    load_dotenv()
+    try:
+        asyncio.run(JarvixServer(build_scheduler()).serve())
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping... Goodbye!")
@@ -1,8 +1,25 @@
+import argparse
+import asyncio
 import os
+import sys
+
+from UTILS.startup import profiler, warm_up
+
+# Has to run before the imports below so they show up in the startup profile
+if '--profile-startup' in sys.argv:
+    profiler.enable()
+
 from XCHATBOT.chatbot import Chatbot
 from XCHATBOT.wake import WakeWordDetector
+from XCHATBOT.audio_capture import AudioCaptureService
+from XCHATBOT.barge_in import BargeInMonitor
+from XCHATBOT.pipeline import ConversationPipeline
+from XCHATBOT.stt_vocabulary import STTVocabulary
+from XCHATBOT.tts import NaturalTTS
+from XCHATBOT.tts_cache import TTSCache, PRERENDER_PHRASES, device_response_phrases
 from XMODELS.api_version import ModelType, ApiClient
 from XMODELS.ollama_client import OllamaClient, OllamaModel
+from XMODELS.response_cache import ResponseCache, ollama_embedding
 
 # TODO: Remove Home Assistant Integration
 # from XAUTO.home_assistant import HAConfig, HAInitializer, HAClient
@@ -16,6 +33,7 @@ class InteractiveMenu:
         self.selected_model = None
         self.gpt_api_key = None
         self.home_assistant_config = None
+        self.warm_up_threads = {}
 
     def setup_configuration(self):
         print("\n✨ Welcome to Jarvix Setup Wizard! ✨")
@@ -75,13 +93,23 @@ class InteractiveMenu:
         #     else:
         #         print("\n👍 Skipping Home Assistant setup. You can configure it later if you wish.")
 
-    def run(self):
+    def run(self, profile_startup: bool = False):
         print("\n🚦 Please wait while we initialize everything for you...")
         print("⚙️ Initializing components ⚙️")
         # Load wake word detector
-        wake_detector = WakeWordDetector()
+        with profiler.phase("wake word detector"):
+            wake_detector = WakeWordDetector()
         # Load chatbot (API key will be assigned later)
         chatbot = Chatbot()
+        if os.getenv('SHARED_AUDIO_CAPTURE', 'true').lower() == 'true':
+            # One microphone stream feeds both the wake word detector and the recorder
+            capture = AudioCaptureService(sample_rate=wake_detector.porcupine.sample_rate,
+                                          frame_length=wake_detector.porcupine.frame_length)
+            wake_detector.capture = capture
+            chatbot.capture = capture
+            if os.getenv('BARGE_IN', 'true').lower() == 'true':
+                # Keep listening while Jarvix speaks so the wake word or the user's voice cuts it off
+                chatbot.barge_in = BargeInMonitor(capture, wake_detector=wake_detector)
         # TODO: Remove Home Assistant Integration
         # ha_client = None
 
@@ -98,24 +126,75 @@ class InteractiveMenu:
         #     ha_client = HAClient()
         #     function_registry["control_home_device"] = ha_client.control_home_device
 
+        prerender_phrases = list(PRERENDER_PHRASES)
+        if os.getenv('TTS_CACHE', 'true').lower() == 'true':
+            # Replies that repeat word for word are played from disk instead of being synthesized again
+            NaturalTTS.cache = TTSCache()
+
+        # Device names and command phrases are given to Whisper so they are not misheard, once there are devices
+        vocabulary = STTVocabulary(mode=os.getenv('STT_VOCABULARY', 'prompt'))
+        if vocabulary.mode != 'off':
+            chatbot.vocabulary = vocabulary
+        # TODO: Remove Home Assistant Integration
+        # if ha_client:
+        #     ha_client.entity_index.add_listener(lambda: vocabulary.update_entities(ha_client.entity_index.names()))
+        #     vocabulary.update_entities(ha_client.entity_index.names())
+        #     prerender_phrases.extend(device_response_phrases(ha_client.entity_index.names()))
+
         # Setup API client based on the selected model
         api_client = None
-        if self.selected_model == ModelType.GPT:
-            api_client = ApiClient(gpt_api_key=self.gpt_api_key, function_registry=function_registry)
-        elif self.selected_model == ModelType.CLAUDE:
-            claude_api_key = os.getenv('ANTHROPIC_API_KEY')
-            api_client = ApiClient(claude_api_key=claude_api_key)
-        elif self.selected_model == ModelType.OLLAMA:
-            ollama_client = OllamaClient(model_name=OllamaModel.JARVIX)
-            function_registry["handle_general_question"] = ollama_client.process_general_text
-            ollama_client.function_registry = function_registry
-            api_client = ollama_client
+        with profiler.phase("language model client"):
+            if self.selected_model == ModelType.GPT:
+                api_client = ApiClient(gpt_api_key=self.gpt_api_key, function_registry=function_registry,
+                                       selected_model=self.selected_model)
+            elif self.selected_model == ModelType.CLAUDE:
+                claude_api_key = os.getenv('ANTHROPIC_API_KEY')
+                api_client = ApiClient(claude_api_key=claude_api_key, selected_model=self.selected_model)
+            elif self.selected_model == ModelType.OLLAMA:
+                ollama_client = OllamaClient(model_name=OllamaModel.JARVIX)
+                function_registry["handle_general_question"] = ollama_client.process_general_text
+                ollama_client.function_registry = function_registry
+                api_client = ollama_client
+            else:
+                print("⚠️ Invalid model selected. Defaulting to Ollama Llama.")
+                ollama_client = OllamaClient(model_name=OllamaModel.JARVIX)
+                function_registry["handle_general_question"] = ollama_client.process_general_text
+                ollama_client.function_registry = function_registry
+                api_client = ollama_client
+
+        if isinstance(api_client, ApiClient):
+            # TLS to the provider is set up while the rest starts, not on the first question
+            self.warm_up_threads.update(warm_up({"LLM connection": api_client.warm_up}))
         else:
-            print("⚠️ Invalid model selected. Defaulting to Ollama Llama.")
-            ollama_client = OllamaClient(model_name=OllamaModel.JARVIX)
-            function_registry["handle_general_question"] = ollama_client.process_general_text
-            ollama_client.function_registry = function_registry
-            api_client = ollama_client
+            # OllamaClient has started the server, the model loads into memory while the rest starts
+            self.warm_up_threads.update(warm_up({"Ollama jarvix": api_client.preload}))
+
+        if NaturalTTS.cache is not None:
+            self.warm_up_threads.update(warm_up({"TTS pre-render": lambda: chatbot.tts.prerender(prerender_phrases)}))
+
+        # Speak sentence by sentence while the answer is still being generated
+        processor = api_client.process_text
+        stream_processor = None
+        if os.getenv('STREAM_RESPONSES', 'false').lower() == 'true':
+            stream_processor = api_client.stream_text
+
+        if os.getenv('RESPONSE_CACHE', 'true').lower() == 'true':
+            # Repeated general questions are answered from the cache instead of the model
+            embed_model = os.getenv('RESPONSE_CACHE_EMBED_MODEL')
+            response_cache = ResponseCache(last_tool_names=lambda: api_client.last_tool_names,
+                                           **({'embed': ollama_embedding(embed_model)} if embed_model else {}))
+            if isinstance(api_client, OllamaClient):
+                # A cached answer is still part of the conversation, follow-ups refer to it
+                response_cache.remember = api_client.memory.add_turn
+            processor = response_cache.wrap(processor)
+            if stream_processor:
+                stream_processor = response_cache.wrap_stream(stream_processor)
+
+        if profile_startup:
+            # Wait for the background loads so their time is part of the report
+            for thread in list(self.warm_up_threads.values()):
+                thread.join()
+            print(profiler.report())
 
         print("\n✨ All systems are ready! Let's begin your journey with Jarvix. ✨\n")
 
@@ -130,14 +209,15 @@ class InteractiveMenu:
                         print("\n🎙️ Listening for your wake word... Say 'Hey Jarvix' to start interacting!")
                         if wake_detector.listen_for_wake_word():
                             print("\n💬 Wake word detected! Let's chat...")
-                            chatbot.start_conversation(processor=api_client.process_text)
+                            while chatbot.start_conversation(processor=processor, stream_processor=stream_processor):
+                                print("\n✋ Interrupted, listening...")
                             print("\n🤖 Conversation ended. Ready to listen for your next command.")
                     elif selected_mode == "2":
                         print("\n🛠️ Running in test mode...")
                         user_input = "What's your name?"
-                        chatbot.start_conversation(processor=api_client.process_text, test_text=user_input)
+                        chatbot.start_conversation(processor=processor, test_text=user_input, stream_processor=stream_processor)
                         user_input = "Can you turn on the test plug?"
-                        chatbot.start_conversation(processor=api_client.process_text, test_text=user_input)
+                        chatbot.start_conversation(processor=processor, test_text=user_input, stream_processor=stream_processor)
                         loop = False
                         print("\n🧪 Test Conversation ended.")
                     else:
@@ -145,17 +225,33 @@ class InteractiveMenu:
                         loop = False
             except KeyboardInterrupt:
                 print("\n🛑 Stopping... Goodbye!")
+        elif os.getenv('PIPELINE', 'async').lower() == 'async' and chatbot.capture is not None:
+            # Every stage runs concurrently and a turn can be cancelled at any point
+            pipeline = ConversationPipeline(chatbot, wake_detector, processor, stream_processor=stream_processor)
+            try:
+                asyncio.run(pipeline.run())
+            except KeyboardInterrupt:
+                print("\n🛑 Stopping... Goodbye!")
         else:
             try:
                 while True:
                     print("\n🎙️ Listening for your wake word... Say 'Hey Jarvix' to start interacting!")
                     if wake_detector.listen_for_wake_word():
                         print("\n💬 Wake word detected! Let's chat...")
-                        chatbot.start_conversation(processor=api_client.process_text)
+                        while chatbot.start_conversation(processor=processor, stream_processor=stream_processor):
+                            print("\n✋ Interrupted, listening...")
                         print("\n🤖 Conversation ended. Ready to listen for your next command.")
             except KeyboardInterrupt:
                 print("\n🛑 Stopping... Goodbye!")
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Jarvix voice assistant")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="Print per-phase, per-import and per-model load times once Jarvix is ready")
+    args = parser.parse_args()
+
     menu = InteractiveMenu()
-    menu.setup_configuration()
-    menu.run()
+    # Whisper and the TTS engine load in the background while the wizard waits for input
+    menu.warm_up_threads.update(Chatbot.warm_up())
+    with profiler.phase("setup wizard"):
+        menu.setup_configuration()
+    menu.run(profile_startup=args.profile_startup)
@@ -0,0 +1,13 @@
+from XMODELS.api_version import ApiClient, ModelType
+
+
+def test_conversations_share_the_connection_but_not_request_state():
+    client = ApiClient(gpt_api_key='test', selected_model=ModelType.GPT)
+    client._client, client._http_client = object(), object()
+
+    kitchen, office = client.for_conversation(), client.for_conversation()
+    kitchen.last_tool_names.append("control_home_device")
+
+    assert kitchen.client is office.client is client.client
+    assert office.last_tool_names == [] and client.last_tool_names == []
+    assert kitchen.tool_dispatcher is not office.tool_dispatcher
@@ -0,0 +1,94 @@
+import json
+import wave
+
+import numpy as np
+import pytest
+
+from XCHATBOT import endpointing
+from XCHATBOT.endpointing import AmplitudeEndpointer, Endpointer, VadEndpointer, evaluate
+
+SAMPLE_RATE = 16000
+
+
+def synthesize_turn(lead: float, words: list, pause: float, seed: int) -> np.ndarray:
+    """Room noise, then voiced "words" (a 140 Hz harmonic stack with a syllable envelope) separated by `pause`."""
+    rng = np.random.default_rng(seed)
+    parts = [np.zeros(int(lead * SAMPLE_RATE))]
+    for index, duration in enumerate(words):
+        t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+        voice = sum(np.sin(2 * np.pi * 140 * harmonic * t) / harmonic for harmonic in range(1, 6))
+        envelope = 0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)
+        parts.append(0.15 * voice * envelope)
+        if index < len(words) - 1:
+            parts.append(np.zeros(int(pause * SAMPLE_RATE)))
+    audio = np.concatenate(parts)
+    return (audio + rng.normal(0, 0.002, audio.size)).astype(np.float32)
+
+
+def write_fixture(directory, name: str, audio: np.ndarray) -> None:
+    with wave.open(str(directory / f"{name}.wav"), 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes((np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes())
+    # The speaker stops where the last word ends, the rest of the file is room noise
+    speech_end = np.flatnonzero(np.abs(audio) > 0.05)[-1] / SAMPLE_RATE
+    (directory / f"{name}.json").write_text(json.dumps({"speech_end": float(speech_end)}))
+
+
+@pytest.fixture
+def fixtures_dir(tmp_path, monkeypatch):
+    # The energy detector, so the result does not depend on whether webrtcvad is installed
+    monkeypatch.setattr(endpointing, 'webrtcvad', None)
+    write_fixture(tmp_path, "short_command", synthesize_turn(0.5, [0.4, 0.5], pause=0.15, seed=1))
+    write_fixture(tmp_path, "hesitation", synthesize_turn(0.8, [0.6, 0.5, 0.7], pause=0.35, seed=2))
+    write_fixture(tmp_path, "long_question", synthesize_turn(0.3, [0.5, 0.4, 0.6, 0.5, 0.8], pause=0.2, seed=3))
+    return tmp_path
+
+
+def test_endpointer_is_abstract():
+    with pytest.raises(TypeError):
+        Endpointer()
+
+
+def test_vad_ends_turns_sooner_without_truncating(fixtures_dir):
+    pytest.importorskip('soundfile')
+    results = evaluate(fixtures_dir, trailing_silence=3.0)
+
+    assert results['vad']['turns'] == 3
+    assert results['vad']['truncation_rate'] == 0.0
+    assert results['amplitude']['truncation_rate'] == 0.0
+    assert results['vad']['mean_latency_ms'] < results['amplitude']['mean_latency_ms']
+    assert results['vad']['p95_latency_ms'] < 800
+
+
+def feed(endpointer, audio: np.ndarray) -> float:
+    chunk = int(SAMPLE_RATE * endpointer.chunk_duration)
+    for start in range(0, audio.size, chunk):
+        if endpointer.process(audio[start:start + chunk], SAMPLE_RATE):
+            return (start + chunk) / SAMPLE_RATE
+    return audio.size / SAMPLE_RATE
+
+
+@pytest.mark.parametrize("transcript, reason", [
+    ("Turn off the kitchen light.", "early"),
+    ("Turn off the", "silence"),  # an unfinished sentence waits for the full silence
+    (None, "silence"),  # not decoded yet
+])
+def test_vad_early_end_needs_a_complete_transcript(monkeypatch, transcript, reason):
+    monkeypatch.setattr(endpointing, 'webrtcvad', None)
+    audio = np.concatenate((synthesize_turn(0.5, [0.5, 0.5], pause=0.1, seed=4), np.zeros(2 * SAMPLE_RATE, dtype=np.float32)))
+    endpointer = VadEndpointer()
+    endpointer.partial_transcript = lambda seconds: transcript
+
+    feed(endpointer, audio)
+
+    assert endpointer.reason == reason
+
+
+def test_amplitude_endpointer_waits_for_speech():
+    endpointer = AmplitudeEndpointer(max_duration=2)
+    feed(endpointer, np.zeros(3 * SAMPLE_RATE, dtype=np.float32))
+
+    assert not endpointer.speech_detected
+    assert endpointer.reason == "max_duration"
@@ -0,0 +1,56 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from XAUTO.http_session import HASession
+
+
+class StubHomeAssistant(BaseHTTPRequestHandler):
+    """Answers /manifest.json with 503, like Home Assistant while it starts, and everything else with 200."""
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def do_GET(self):
+        self.server.hits.append(self.path)
+        self.server.connections.add(self.client_address)
+        status, body = (503, b'starting') if self.path == '/manifest.json' else (200, b'[]')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHomeAssistant)
+    server.hits, server.connections = [], set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_requests_reuse_one_connection(stub_server):
+    session = HASession(f"http://127.0.0.1:{stub_server.server_address[1]}", transport='requests')
+    for _ in range(5):
+        assert session.get('/api/states').status_code == 200
+    session.close()
+
+    assert len(stub_server.hits) == 5
+    assert len(stub_server.connections) == 1
+
+
+def test_liveness_probe_is_not_retried(stub_server):
+    session = HASession(f"http://127.0.0.1:{stub_server.server_address[1]}", retries=3, backoff_factor=0.01,
+                        transport='requests')
+
+    assert session.get('/manifest.json', retries=0).status_code == 503
+    assert stub_server.hits == ['/manifest.json']
+
+    assert session.get('/manifest.json').status_code == 503
+    assert len(stub_server.hits) == 1 + 4  # the shared session still retries three times
+    session.close()
@@ -0,0 +1,74 @@
+import re
+
+import numpy as np
+import pytest
+
+from XMODELS.response_cache import ResponseCache
+
+
+def bag_of_words(text: str) -> list:
+    """An embedding that, like any embedding, scores reworded and reordered questions as near duplicates."""
+    vector = np.zeros(64, dtype=np.float32)
+    for word in re.findall(r"[a-z]+", text):
+        vector[hash(word) % 64] += 1.0
+    return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(path=tmp_path / 'responses.json', save_delay=60)
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("convert 5 miles to kilometers", "convert 5 kilometers to miles"),
+    ("is a dog bigger than a cat", "is a cat bigger than a dog"),
+    ("what is 12 times 13", "what is 12 times 14"),
+])
+def test_different_questions_do_not_share_answers(cache, cached, asked):
+    cache.put(cached, "cached answer", latency=1.0)
+
+    assert cache.get(asked) is None
+    assert cache.get(cached) == "cached answer"
+
+
+def test_identical_question_hits_after_normalization(cache):
+    cache.put("What's the capital of France?", "Paris.", latency=1.0)
+
+    assert cache.get("Hey Jarvix, what is the capital of france please") == "Paris."
+    assert cache.stats.exact_hits == 1
+
+
+def test_embedding_model_matches_reworded_questions_with_the_same_numbers(tmp_path):
+    cache = ResponseCache(path=tmp_path / 'responses.json', embed=bag_of_words, threshold=0.9, save_delay=60)
+    cache.put("what is 12 times 13", "156", latency=1.0)
+
+    assert cache.get("12 times 13 is what") == "156"
+    assert cache.get("what is 12 times 14") is None
+    assert cache.stats.semantic_hits == 1
+
+
+def test_entries_survive_a_restart(tmp_path):
+    cache = ResponseCache(path=tmp_path / 'responses.json', save_delay=60)
+    cache.put("who wrote hamlet", "Shakespeare.", latency=2.0)
+    cache.flush()
+
+    assert ResponseCache(path=tmp_path / 'responses.json').get("who wrote hamlet") == "Shakespeare."
+
+
+def test_hits_are_recorded_in_the_conversation(cache):
+    history = []
+    cache.remember = lambda user, assistant: history.append((user, assistant))
+    calls = []
+
+    def processor(text):
+        calls.append(text)
+        return "Paris."
+
+    answer = cache.wrap(processor)
+    assert answer("what is the capital of france") == "Paris."
+    assert history == []  # the processor records its own turns
+
+    assert answer("What is the capital of France?") == "Paris."
+    assert list(cache.wrap_stream(lambda text: iter(["Paris."]))("what is the capital of france")) == ["Paris."]
+    assert calls == ["what is the capital of france"]
+    assert history == [("What is the capital of France?", "Paris."), ("what is the capital of france", "Paris.")]
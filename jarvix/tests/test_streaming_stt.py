@@ -0,0 +1,47 @@
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from XCHATBOT.streaming_stt import StreamingTranscriber, WHISPER_SAMPLE_RATE
+
+
+class CountingModel:
+    """Stands in for a WhisperModel, returning one segment per second of audio."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def transcribe(self, audio, **kwargs):
+        self.calls += 1
+        seconds = int(audio.size / WHISPER_SAMPLE_RATE)
+        return [SimpleNamespace(text=f" w{i}", start=float(i), end=float(i + 1)) for i in range(seconds)], None
+
+
+def test_feeding_chunks_does_not_decode_every_chunk():
+    model = CountingModel()
+    transcriber = StreamingTranscriber(model, commit_interval=0.2, tail_duration=0.1).start()
+    chunk = np.zeros(WHISPER_SAMPLE_RATE // 100, dtype=np.float32)  # 10 ms, like a capture callback
+
+    started = time.monotonic()
+    for _ in range(300):
+        transcriber.feed(chunk)
+        time.sleep(0.002)
+    elapsed = time.monotonic() - started
+    transcriber.cancel()
+
+    assert model.calls <= elapsed / 0.2 + 1
+
+
+def test_transcript_until_wakes_the_worker_early():
+    model = CountingModel()
+    transcriber = StreamingTranscriber(model, commit_interval=60.0).start()
+    transcriber.feed(np.zeros(2 * WHISPER_SAMPLE_RATE, dtype=np.float32))
+
+    assert transcriber.transcript_until(2.0) is None
+    deadline = time.monotonic() + 2.0
+    while transcriber.transcript_until(2.0) is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert transcriber.transcript_until(2.0) == " w0 w1"
+    assert transcriber.finish() == " w0 w1"
@@ -0,0 +1,25 @@
+from XCHATBOT.stt_vocabulary import STTVocabulary, word_error_rate
+
+
+def test_no_bias_until_entities_are_known():
+    vocabulary = STTVocabulary(mode='both')
+    assert vocabulary.transcribe_kwargs() == {}
+
+    assert vocabulary.update_entities(["Kitchen Light", "Desk Lamp"])
+    kwargs = vocabulary.transcribe_kwargs()
+    assert "Devices: Kitchen Light, Desk Lamp." in kwargs['initial_prompt']
+    assert "Kitchen Light" in kwargs['hotwords']
+
+    assert vocabulary.update_entities([])
+    assert vocabulary.transcribe_kwargs() == {}
+
+
+def test_update_entities_only_reports_changes():
+    vocabulary = STTVocabulary()
+    assert vocabulary.update_entities(["Kitchen Light"])
+    assert not vocabulary.update_entities(["kitchen light!"])
+
+
+def test_word_error_rate():
+    assert word_error_rate("Turn off the kitchen light.", "turn off the kitchen light") == 0.0
+    assert word_error_rate("turn off the kitchen light", "turn of the kitchen light") == 0.2
@@ -0,0 +1,49 @@
+import time
+
+from XMODELS.tool_dispatcher import ToolCall, ToolDispatcher
+
+
+def joke():
+    yield "Why did the lamp "
+    yield "go to school?"
+
+
+def broken_stream(query):
+    yield "Let me think."
+    raise ConnectionError("model went away")
+
+
+def broken_call(**kwargs):
+    raise ConnectionError("model went away")
+
+
+def test_every_call_runs_concurrently_in_order():
+    def slow(name):
+        time.sleep(0.2)
+        return f"{name} done."
+
+    dispatcher = ToolDispatcher({"first": lambda: slow("first"), "second": lambda: slow("second")})
+    started = time.perf_counter()
+    response = dispatcher.dispatch([ToolCall(name="first"), ToolCall(name="second")])
+
+    assert response == "first done. second done."
+    assert time.perf_counter() - started < 0.35
+
+
+def test_failures_are_answered_with_an_apology():
+    dispatcher = ToolDispatcher({"broken_call": broken_call})
+    response = dispatcher.dispatch([ToolCall(name="broken_call"), ToolCall(name="control_home_device")])
+
+    assert response == "Sorry, broken call failed. Unknown function: control_home_device. You don't have Home Assistant setup."
+    assert dispatcher.last_results[0].error == "model went away"
+
+
+def test_failing_inline_stream_keeps_the_partial_answer():
+    dispatcher = ToolDispatcher({"turn_on": lambda: "Turned on."})
+    calls = [ToolCall(name="turn_on"), ToolCall(name="handle_general_question", arguments={"query": "why?"}),
+             ToolCall(name="joke")]
+
+    spoken = ''.join(dispatcher.run(calls, inline={"handle_general_question": broken_stream, "joke": joke}))
+
+    assert spoken == "Turned on. Let me think. Sorry, handle general question failed. Why did the lamp go to school?"
+    assert [result.error for result in dispatcher.last_results] == [None, "model went away", None]